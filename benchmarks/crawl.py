@@ -0,0 +1,163 @@
+"""Offline benchmark of the crawler against the local fake Notion server.
+
+    python benchmarks/crawl.py --pages 300 --latency 0.05 --concurrency 1 8 16
+
+Every scenario crawls the same synthetic workspace and prints wall time,
+number of API requests and 429 responses:
+    sync / async     full crawl with the synchronous and the asyncio crawler,
+    resume           a crawl interrupted by the time budget and resumed,
+    incremental      a crawl after editing a few pages,
+    rate limited     a full crawl against a server limiting requests per second,
+    replay           the full crawl replayed from a recorded fixture.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from notion4ever import async_notion2json  # noqa: E402
+from notion4ever import fake_notion  # noqa: E402
+from notion4ever import frontier  # noqa: E402
+from notion4ever import journal  # noqa: E402
+from notion4ever import notion2json  # noqa: E402
+from notion4ever import recording  # noqa: E402
+from notion4ever import throttling  # noqa: E402
+
+
+def crawl(
+    server: fake_notion.FakeNotionServer,
+    workdir: Path,
+    concurrency: int,
+    rate: float,
+    previous: dict | None = None,
+    since: str | None = None,
+    resume: bool = False,
+    time_budget: float | None = None,
+    record: str | None = None,
+    replay: str | None = None,
+) -> tuple:
+    """Crawls the fake workspace, concurrency 0 means the synchronous crawler.
+
+    Returns:
+        (notion_json, finished, started_at)
+    """
+    bucket = throttling.TokenBucket(rate=rate)
+    base_url = server.base_url
+    notion_json = {}
+    with journal.CrawlJournal(str(workdir / "notion_content.jsonl"), notion_json, resume=resume) as crawl_journal:
+        state = notion2json.CrawlState(crawl_journal, previous=previous, since=since)
+        crawl_frontier = frontier.Frontier(time_budget=time_budget)
+        root_id = server.workspace.root_id
+        if concurrency:
+            transport = recording.async_inner_transport(record, replay)
+            notion = throttling.async_throttled_client("secret", bucket, base_url=base_url, transport=transport)
+            finished = async_notion2json.crawl(root_id, notion, state, crawl_frontier, concurrency)
+        else:
+            transport = recording.inner_transport(record, replay)
+            notion = throttling.throttled_client("secret", bucket, base_url=base_url, transport=transport)
+            finished = notion2json.crawl(root_id, notion, state, crawl_frontier)
+            notion.close()
+    if not finished:
+        return notion_json, False, crawl_journal.started_at
+    notion_json = journal.compact(str(workdir / "notion_content.jsonl"), str(workdir / "notion_content.json"))
+    return notion_json, True, crawl_journal.started_at
+
+
+def unsigned(notion_json: dict) -> str:
+    """Serializes raw Notion data without signatures of file URLs, which change with every response."""
+    return re.sub(r"X-Amz-Signature=\w+", "", json.dumps(notion_json))
+
+
+def measure(name: str, server: fake_notion.FakeNotionServer, function) -> dict:
+    requests, throttled = server.requests, server.throttled
+    started = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - started
+    row = {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "requests": server.requests - requests,
+        "429": server.throttled - throttled,
+        "requests/s": round((server.requests - requests) / elapsed, 1) if elapsed else None,
+    }
+    print(" | ".join(f"{key}: {value}" for key, value in row.items()), flush=True)
+    return {**row, "result": result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark notion4ever crawler against a fake Notion server.")
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum depth of the page tree.")
+    parser.add_argument("--blocks", type=int, default=10, help="Top-level blocks per page.")
+    parser.add_argument("--databases", type=int, default=2, help="Number of databases.")
+    parser.add_argument("--database_size", type=int, default=30, help="Entries per database.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Delay of every API response in seconds.")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Client side request rate limit per second.")
+    parser.add_argument("--server_rate_limit", type=float, default=50.0, help="Server requests per second before 429.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[0, 8], help="0 is the synchronous crawler.")
+    parser.add_argument("--edited", type=int, default=5, help="Pages edited before the incremental crawl.")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this file.")
+    config = parser.parse_args()
+
+    workspace = fake_notion.FakeWorkspace(
+        config.pages, config.depth, config.blocks, config.databases, config.database_size
+    )
+    server = fake_notion.FakeNotionServer(("127.0.0.1", 0), workspace, latency=config.latency)
+    server.start()
+    print(f"Workspace: {len(workspace.objects)} pages and databases, {server.base_url}", flush=True)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        fixture = str(workdir / "fixture.jsonl")
+        reference = None
+        for concurrency in config.concurrency:
+            name = "sync" if concurrency == 0 else f"async x{concurrency}"
+            record = fixture if reference is None else None
+            row = measure(name, server, lambda: crawl(server, workdir, concurrency, config.rate, record=record))
+            rows.append(row)
+            if reference is None:
+                reference = row["result"]
+            elif unsigned(row["result"][0]) != unsigned(reference[0]):
+                print(f"  {name} result differs from {rows[0]['scenario']}!")
+
+        concurrency = config.concurrency[-1]
+        full = rows[-1]["seconds"]
+
+        def interrupted_and_resumed():
+            crawl(server, workdir, concurrency, config.rate, time_budget=full / 2)
+            return crawl(server, workdir, concurrency, config.rate, resume=True)
+
+        rows.append(measure("resume", server, interrupted_and_resumed))
+
+        previous, _, started_at = rows[0]["result"]
+        workspace.edit(config.edited)
+        rows.append(
+            measure(
+                "incremental",
+                server,
+                lambda: crawl(server, workdir, concurrency, config.rate, previous=previous, since=started_at),
+            )
+        )
+
+        server.rate_limit = config.server_rate_limit
+        server.retry_after = 0.5
+        rows.append(measure("rate limited", server, lambda: crawl(server, workdir, concurrency, config.rate)))
+        server.rate_limit = 0
+
+        rows.append(measure("replay", server, lambda: crawl(server, workdir, concurrency, config.rate, replay=fixture)))
+
+    server.shutdown()
+    if config.output:
+        with open(config.output, "w", encoding="utf-8") as f:
+            json.dump([{key: value for key, value in row.items() if key != "result"} for row in rows], f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Parity check of the direct HTML renderer against the markdown path.
+
+    python benchmarks/parity.py
+
+Every block type of markdown_parser.block_func_map, and the blocks
+html_renderer handles besides, is rendered both ways: blocks -> markdown ->
+Python-Markdown -> HTML as by site generation, and blocks -> HTML by
+html_renderer. The two must give the same HTML up to whitespace between
+tags. The known differences below are intended and only reported:
+    escaping         text of blocks is escaped, literal <tag> in Notion stays text
+                     instead of becoming raw HTML, '>' in mermaid diagrams too,
+    loose lists      the markdown path wraps list items in paragraphs and splits
+                     lists where blank lines separate items with children of
+                     other types; the HTML renderer follows the block tree,
+    children         children of paragraphs, quotes, callouts and other blocks
+                     which are not lists are indented in the markdown and become
+                     code blocks; the HTML renderer renders them as blocks.
+Exits with 1 when a case outside the known differences does not match.
+"""
+
+from pathlib import Path
+import re
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from notion4ever import html_renderer  # noqa: E402
+from notion4ever import markdown_parser  # noqa: E402
+from notion4ever import site_generation  # noqa: E402
+
+# Front matter which generate_page puts before the markdown of every page
+FRONT_MATTER = "---\ntitle: Page\n---\n\n"
+
+
+def richtext(text: str, **annotations) -> dict:
+    return {
+        "type": "text",
+        "text": {"content": text, "link": None},
+        "plain_text": text,
+        "href": None,
+        "annotations": {
+            "bold": False,
+            "italic": False,
+            "strikethrough": False,
+            "underline": False,
+            "code": False,
+            "color": "default",
+            **annotations,
+        },
+    }
+
+
+class Blocks:
+    """Makes blocks of the Notion API with unique IDs."""
+
+    def __init__(self):
+        self.count = 0
+
+    def block(self, block_type: str, payload: dict, children: list | None = None) -> dict:
+        self.count += 1
+        block = {
+            "object": "block",
+            "id": f"block-{self.count}",
+            "type": block_type,
+            "has_children": bool(children),
+            block_type: payload,
+        }
+        if children:
+            block["children"] = children
+        return block
+
+    def text(self, block_type: str, text: str, children: list | None = None, **payload) -> dict:
+        return self.block(block_type, {"rich_text": [richtext(text)], "color": "default", **payload}, children)
+
+    def file(self, block_type: str, url: str, caption: str = "") -> dict:
+        caption_richtext = [richtext(caption)] if caption else []
+        return self.block(block_type, {"type": "external", "external": {"url": url}, "caption": caption_richtext})
+
+
+def cases(b: Blocks) -> dict:
+    """Returns name -> blocks which must be rendered the same."""
+    return {
+        "paragraph": [
+            b.block(
+                "paragraph",
+                {"rich_text": [richtext("bold", bold=True), richtext(" and "), richtext("code", code=True)]},
+            ),
+            b.block("paragraph", {"rich_text": []}),
+        ],
+        "heading_1": [b.text("heading_1", "First")],
+        "heading_2": [b.text("heading_2", "Second")],
+        "heading_3": [b.text("heading_3", "Third")],
+        "toggle heading": [
+            b.text("heading_2", "Toggled", [b.text("paragraph", "inside")], is_toggleable=True),
+            b.text("heading_3", "Shown"),
+            b.block("table_of_contents", {"color": "default"}),
+        ],
+        "callout": [b.block("callout", {"rich_text": [richtext("note")], "icon": {"type": "emoji", "emoji": "💡"}})],
+        "toggle": [b.text("toggle", "toggle", [b.text("paragraph", "hidden")]), b.text("paragraph", "after")],
+        "quote": [b.text("quote", "quoted")],
+        "bulleted_list_item": [
+            b.text("bulleted_list_item", "first", [b.text("bulleted_list_item", "nested")]),
+            b.text("bulleted_list_item", "second"),
+        ],
+        "numbered_list_item": [b.text("numbered_list_item", "one"), b.text("numbered_list_item", "two")],
+        "to_do": [b.text("to_do", "done", checked=True), b.text("to_do", "open", checked=False)],
+        "list item with a paragraph": [b.text("bulleted_list_item", "item", [b.text("paragraph", "paragraph")])],
+        "code": [b.block("code", {"rich_text": [richtext("print(1)\nx = 'a'")], "language": "python", "caption": []})],
+        "code with caption": [
+            b.block("code", {"rich_text": [richtext("x = 1")], "language": "python", "caption": [richtext("Listing")]})
+        ],
+        "mermaid": [
+            b.block("code", {"rich_text": [richtext("graph TD; A---B")], "language": "mermaid", "caption": []})
+        ],
+        "embed": [b.block("embed", {"url": "https://example.com/embed", "caption": []})],
+        "image": [b.file("image", "https://example.com/a.png")],
+        "image with caption": [b.file("image", "https://example.com/a.png", "Caption")],
+        "bookmark": [b.block("bookmark", {"url": "https://example.com/bookmark", "caption": []})],
+        "equation": [b.block("equation", {"expression": "a^2 + b^2"})],
+        "divider": [b.block("divider", {})],
+        "file": [b.file("file", "https://example.com/a%20document.pdf")],
+        "table_row": [
+            b.block(
+                "table",
+                {"table_width": 2, "has_column_header": True, "has_row_header": False},
+                [
+                    b.block("table_row", {"cells": [[richtext("head 1")], [richtext("head 2")]]}),
+                    b.block("table_row", {"cells": [[richtext("cell 1")], [richtext("cell 2")]]}),
+                ],
+            )
+        ],
+        "video": [b.file("video", "https://example.com/clip.mp4")],
+        "video embed": [b.file("video", "http://www.youtube.com/embed/clip")],
+        "table_of_contents": [
+            b.text("heading_1", "Chapter"),
+            b.text("heading_2", "Section"),
+            b.block("table_of_contents", {"color": "default"}),
+        ],
+        "child_page": [b.block("child_page", {"title": "Child"})],
+        "column_list": [
+            b.block(
+                "column_list",
+                {},
+                [
+                    b.block("column", {}, [b.text("paragraph", "left")]),
+                    b.block("column", {}, [b.text("paragraph", "right")]),
+                ],
+            )
+        ],
+    }
+
+
+def known_differences(b: Blocks) -> dict:
+    """Returns name -> blocks rendered differently on purpose, see the module docstring."""
+    return {
+        "escaping": [
+            b.text("paragraph", "literal <tag> & text"),
+            b.block("code", {"rich_text": [richtext("graph TD; A-->B")], "language": "mermaid", "caption": []}),
+        ],
+        "loose lists": [
+            b.text(
+                "numbered_list_item", "1", [b.text("numbered_list_item", "1.1", [b.text("bulleted_list_item", "x")])]
+            ),
+            b.text("numbered_list_item", "2"),
+        ],
+        "children": [b.text("quote", "quoted", [b.text("paragraph", "child")])],
+    }
+
+
+def normalize(content: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r">\s+<", "><", content)).strip()
+
+
+def render_both(blocks: list, structured_notion: dict, converter: site_generation.MarkdownConverter) -> tuple:
+    page_id = next(iter(structured_notion["pages"]))
+    md_content = markdown_parser.convert_page(blocks, structured_notion, page_id, {})
+    from_markdown = converter.convert(FRONT_MATTER + md_content)
+    from_blocks = html_renderer.PageRenderer(structured_notion).render(blocks)
+    return normalize(from_markdown), normalize(from_blocks)
+
+
+def main():
+    b = Blocks()
+    checked = cases(b)
+    page = {"files": [], "title": "Page", "url": "/index.html", "emoji": None, "icon": None}
+    child = {"files": [], "title": "Child", "url": "/child/index.html", "emoji": "📄", "icon": None}
+    structured_notion = {"pages": {"page": page, checked["child_page"][0]["id"]: child}}
+    converter = site_generation.MarkdownConverter()
+
+    covered = {block["type"] for blocks in checked.values() for block in blocks}
+    covered |= {child["type"] for blocks in checked.values() for block in blocks for child in block.get("children", [])}
+    missing = set(markdown_parser.block_func_map) - covered
+    if missing:
+        print(f"Block types without a case: {', '.join(sorted(missing))}")
+
+    mismatches = 0
+    for name, blocks in checked.items():
+        from_markdown, from_blocks = render_both(blocks, structured_notion, converter)
+        if from_markdown == from_blocks:
+            print(f"same       {name}")
+            continue
+        mismatches += 1
+        print(f"DIFFERENT  {name}\n  markdown: {from_markdown}\n  html:     {from_blocks}")
+    for name, blocks in known_differences(b).items():
+        from_markdown, from_blocks = render_both(blocks, structured_notion, converter)
+        print(f"known      {name}\n  markdown: {from_markdown}\n  html:     {from_blocks}")
+
+    sys.exit(1 if mismatches or missing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Offline benchmark of page rendering: the markdown path against the direct HTML renderer.
+
+    python benchmarks/render.py --pages 300 --blocks 30
+    python benchmarks/render.py --raw notion_content.json
+
+The workspace is crawled once from the local fake Notion server (or read
+from a raw notion_content.json), then every scenario structures it and
+generates the site, printing the wall time of both stages:
+    markdown         blocks -> markdown -> Python-Markdown -> HTML,
+    markdown cached  the same with the HTML of every page in a warm --cache_dir,
+    html             blocks -> HTML in one walk, without markdown files,
+    html + markdown  blocks -> HTML, with the markdown exported next to it.
+"""
+
+from pathlib import Path
+import argparse
+import copy
+import json
+import logging
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import crawl as crawl_benchmark  # noqa: E402
+from notion4ever import fake_notion  # noqa: E402
+from notion4ever import site_generation  # noqa: E402
+from notion4ever import structuring  # noqa: E402
+from notion4ever.__main__ import build_parser  # noqa: E402
+
+REPOSITORY = Path(__file__).resolve().parents[1]
+
+SCENARIOS = {
+    "markdown": {"renderer": "markdown", "export_markdown": True, "cache": False},
+    "markdown cached": {"renderer": "markdown", "export_markdown": True, "cache": True},
+    "html": {"renderer": "html", "export_markdown": False, "cache": False},
+    "html + markdown": {"renderer": "html", "export_markdown": True, "cache": False},
+}
+
+
+def site_config(output_dir: Path, cache_dir: Path | None, renderer: str, export_markdown: bool, jobs: int) -> dict:
+    """Returns the config of the command line defaults, as __main__ makes it, with the settings of the scenario."""
+    config = vars(build_parser().parse_args([]))
+    config.update(
+        {
+            "include_search": True,
+            "download_files": False,
+            "output_dir": output_dir,
+            "templates_dir": REPOSITORY / "_templates",
+            "sass_dir": REPOSITORY / "_sass",
+            "cache_dir": cache_dir,
+            "jobs": jobs,
+            "renderer": renderer,
+            "export_markdown": export_markdown,
+        }
+    )
+    return config
+
+
+def build(raw_notion: dict, config: dict) -> dict:
+    raw_notion = copy.deepcopy(raw_notion)
+    started = time.perf_counter()
+    structured_notion = structuring.structurize_notion_content(raw_notion, config)
+    structured = time.perf_counter()
+    # The site is generated from structured data read back from JSON, as by __main__
+    structured_notion = json.loads(json.dumps(structured_notion, ensure_ascii=False))
+    structured_notion["base_url"] = ""
+    generating = time.perf_counter()
+    site_generation.generate_site(structured_notion, config)
+    finished = time.perf_counter()
+    return {
+        "structuring": round(structured - started, 3),
+        "site": round(finished - generating, 3),
+        "seconds": round(structured - started + finished - generating, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the markdown and the HTML page renderers.")
+    parser.add_argument("--raw", type=str, default=None, help="Raw notion_content.json instead of a fake workspace.")
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum depth of the page tree.")
+    parser.add_argument("--blocks", type=int, default=30, help="Top-level blocks per page.")
+    parser.add_argument("--databases", type=int, default=2, help="Number of databases.")
+    parser.add_argument("--database_size", type=int, default=30, help="Entries per database.")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes rendering pages.")
+    parser.add_argument("--repeat", type=int, default=3, help="Builds per scenario, the fastest one is reported.")
+    parser.add_argument("--output", type=str, default=None, help="Write results as JSON to this file.")
+    config = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        if config.raw:
+            with open(config.raw, "r", encoding="utf-8") as f:
+                raw_notion = json.load(f)
+        else:
+            workspace = fake_notion.FakeWorkspace(
+                config.pages, config.depth, config.blocks, config.databases, config.database_size
+            )
+            server = fake_notion.FakeNotionServer(("127.0.0.1", 0), workspace, latency=0)
+            server.start()
+            raw_notion, _, _ = crawl_benchmark.crawl(server, workdir, 0, 1000.0)
+            server.shutdown()
+        print(f"Workspace: {len(raw_notion)} pages", flush=True)
+
+        rows = []
+        for name, scenario in SCENARIOS.items():
+            cache_dir = workdir / "cache" / name if scenario["cache"] else None
+            site = site_config(
+                workdir / "site", cache_dir, scenario["renderer"], scenario["export_markdown"], config.jobs
+            )
+            if cache_dir is not None:
+                # Warms the cache of converted markdown
+                build(raw_notion, site)
+            timings = min((build(raw_notion, site) for _ in range(config.repeat)), key=lambda row: row["seconds"])
+            row = {"scenario": name, **timings}
+            print(" | ".join(f"{key}: {value}" for key, value in row.items()), flush=True)
+            rows.append(row)
+
+    if config.output:
+        with open(config.output, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
+from notion4ever import assets
 from notion4ever import notion2json
+from notion4ever import async_notion2json
+from notion4ever import frontier
+from notion4ever import images
+from notion4ever import journal
+from notion4ever import recording
 from notion4ever import structuring
 from notion4ever import site_generation
+from notion4ever import throttling
 
 import logging
 import json
@@ -9,8 +16,6 @@ import shutil
 import argparse
 import os
 
-from notion_client import Client
-
 
 # Helper function to handle boolean arguments
 def str_to_bool(value):
@@ -24,7 +29,7 @@ def str_to_bool(value):
         raise argparse.ArgumentTypeError(f"Boolean value expected, got {value}")
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description=(
             "Notion4ever: Export all your Notion content to markdown and HTML," "and serve it as a static site."
@@ -72,6 +77,109 @@ def main():
         default=True,
         help="Download files. (true/false)",
     )
+    parser.add_argument(
+        "--download_workers",
+        "-dw",
+        type=int,
+        default=8,
+        help="Number of files downloaded concurrently.",
+    )
+    parser.add_argument(
+        "--download_timeout",
+        "-dto",
+        type=float,
+        default=120.0,
+        help="Seconds a single file may take to download.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        "-cd",
+        type=str,
+        default="./.notion4ever_cache",
+        help="Directory of caches kept between builds, an empty string disables them.",
+    )
+    parser.add_argument(
+        "--incremental_build",
+        "-ib",
+        type=str_to_bool,
+        default=False,
+        help="Render only pages whose content, linked pages or templates changed since the previous build, "
+        "using the manifest in --cache_dir. (true/false)",
+    )
+    parser.add_argument(
+        "--renderer",
+        "-re",
+        choices=["markdown", "html"],
+        default="markdown",
+        help="Render pages by converting their markdown with Python-Markdown, or straight from Notion blocks to HTML.",
+    )
+    parser.add_argument(
+        "--export_markdown",
+        "-em",
+        type=str_to_bool,
+        default=True,
+        help="Write the markdown of every page next to its html. (true/false)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of processes structuring and rendering pages, 0 for one per CPU.",
+    )
+    parser.add_argument(
+        "--optimize_images",
+        "-oi",
+        type=str_to_bool,
+        default=True,
+        help="Generate resized variants of downloaded images for responsive pages. (true/false)",
+    )
+    parser.add_argument(
+        "--image_widths",
+        type=int,
+        nargs="+",
+        default=[320, 640, 1280, 1920],
+        help="Widths of resized variants of images in pixels.",
+    )
+    parser.add_argument(
+        "--image_format",
+        choices=list(images.FORMATS),
+        default="webp",
+        help="Format of resized variants of images.",
+    )
+    parser.add_argument(
+        "--image_quality",
+        type=int,
+        default=80,
+        help="Quality of resized variants of images (1-100).",
+    )
+    parser.add_argument(
+        "--image_workers",
+        type=int,
+        default=None,
+        help="Number of processes resizing images, the number of CPUs by default.",
+    )
+    parser.add_argument(
+        "--max_file_size",
+        "-mfs",
+        type=float,
+        default=None,
+        help="Files larger than this number of MB are not downloaded, see --oversized_files.",
+    )
+    parser.add_argument(
+        "--oversized_files",
+        "-of",
+        choices=["link", "skip"],
+        default="link",
+        help="Files over --max_file_size are linked from their original URL (link) or left out of the site (skip).",
+    )
+    parser.add_argument(
+        "--asset_store",
+        "-as",
+        type=str_to_bool,
+        default=True,
+        help=f"Download every file once into '{assets.STORE_DIR}' in --cache_dir and link it to pages. (true/false)",
+    )
     parser.add_argument(
         "--remove_before",
         "-rb",
@@ -102,7 +210,97 @@ def main():
         help="Include a search feature in the site. (true/false)",
     )
 
-    config = vars(parser.parse_args())
+    parser.add_argument(
+        "--async_fetch",
+        "-af",
+        type=str_to_bool,
+        default=False,
+        help="Download raw notion content with the concurrent asyncio crawler. (true/false)",
+    )
+    parser.add_argument(
+        "--fetch_concurrency",
+        "-fc",
+        type=int,
+        default=8,
+        help="Maximum number of Notion API requests in flight for the asyncio crawler.",
+    )
+    parser.add_argument(
+        "--discovery",
+        "-d",
+        choices=["recursive", "search"],
+        default="recursive",
+        help="How subpages are found: while parsing their parents or upfront with the search API. "
+        "The search discovery always uses the asyncio crawler.",
+    )
+    parser.add_argument(
+        "--crawl_priority",
+        "-cp",
+        choices=frontier.PRIORITIES,
+        default="shallow",
+        help="Which pages are fetched first: closer to the root (shallow) or recently edited (recent).",
+    )
+    parser.add_argument(
+        "--time_budget",
+        "-tb",
+        type=float,
+        default=None,
+        help="Seconds the download may take. The rest can be downloaded later with --resume true.",
+    )
+    parser.add_argument(
+        "--rate_limit",
+        "-rl",
+        type=float,
+        default=3.0,
+        help="Average number of Notion API requests per second.",
+    )
+    parser.add_argument(
+        "--max_retries",
+        "-mr",
+        type=int,
+        default=5,
+        help="Retries of rate limited, failed (5xx) or timed out Notion API requests.",
+    )
+    parser.add_argument(
+        "--notion_base_url",
+        "-nu",
+        type=str,
+        default=os.environ.get("NOTION_BASE_URL"),
+        help="Address of Notion API, e.g. of the local notion4ever.fake_notion server.",
+    )
+    parser.add_argument(
+        "--record_fixture",
+        type=str,
+        default=None,
+        help="Record every Notion API request and response into this JSONL fixture.",
+    )
+    parser.add_argument(
+        "--replay_fixture",
+        type=str,
+        default=None,
+        help="Answer Notion API requests from this recorded JSONL fixture instead of the network.",
+    )
+    parser.add_argument(
+        "--resume",
+        "-r",
+        type=str_to_bool,
+        default=False,
+        help="Resume an interrupted download from the crawl journal. (true/false)",
+    )
+    parser.add_argument(
+        "--incremental",
+        "-inc",
+        type=str_to_bool,
+        default=False,
+        help=(
+            "Refetch only pages edited since the previous download, "
+            "querying databases only for entries edited since then. (true/false)"
+        ),
+    )
+    return parser
+
+
+def main():
+    config = vars(build_parser().parse_args())
 
     if config["logging_level"] == "DEBUG":
         llevel = logging.DEBUG
@@ -112,6 +310,8 @@ def main():
     if config["output_dir"]:
         config["output_dir"] = Path(config["output_dir"]).absolute()
 
+    config["cache_dir"] = Path(config["cache_dir"]).absolute() if config["cache_dir"] else None
+
     if config["templates_dir"]:
         config["templates_dir"] = Path(config["templates_dir"]).absolute()
         if not config["templates_dir"].exists():
@@ -129,27 +329,94 @@ def main():
             shutil.rmtree(config["output_dir"])
             logging.debug("🤖 Removed old site files")
 
-    notion = Client(auth=config["notion_token"])
+    # One token bucket is shared by all clients, so they never exceed the rate limit together.
+    bucket = throttling.TokenBucket(rate=config["rate_limit"])
+    notion = throttling.throttled_client(
+        config["notion_token"],
+        bucket,
+        config["max_retries"],
+        base_url=config["notion_base_url"],
+        transport=recording.inner_transport(config["record_fixture"], config["replay_fixture"]),
+    )
     logging.info("🤖 Notion authentification completed successfully.")
 
-    # It will rewrite this file
     raw_notion = {}
+    previous_notion = {}
+    since = None
     filename = "./notion_content.json"
+    filename_journal = "./notion_content.jsonl"
+    filename_sync = "./notion_sync.json"
     filename_structured = "./notion_structured.json"
 
     # Stage 1. Downloading (reading) raw notion content and save it to json file
-    if Path(filename).exists():
+    if Path(filename).exists() and config["incremental"]:
+        logging.info("🤖 Reading previous raw notion content for the incremental update.")
+        with open(filename, "r") as f:
+            previous_notion = json.load(f)
+        if Path(filename_sync).exists():
+            with open(filename_sync, "r") as f:
+                since = json.load(f)["started_at"]
+
+    if Path(filename).exists() and not config["incremental"]:
         logging.info("🤖 Reading existing raw notion content.")
         with open(filename, "r") as f:
             raw_notion = json.load(f)
     else:
         logging.info("🤖 Started raw notion content parsing.")
-        notion2json.notion_page_parser(
-            config["notion_page_id"],
-            notion=notion,
-            filename=filename,
-            notion_json=raw_notion,
-        )
+        # Files are downloaded into the asset store during the crawl, before their signed URLs expire
+        prefetcher = None
+        store = structuring.asset_store(config)
+        if config["download_files"] and store is not None:
+            prefetcher = assets.AssetPrefetcher(
+                store,
+                config["download_workers"],
+                config["download_timeout"],
+                structuring.max_file_size(config),
+            )
+        finished = False
+        try:
+            with journal.CrawlJournal(filename_journal, raw_notion, resume=config["resume"]) as crawl_journal:
+                state = notion2json.CrawlState(
+                    crawl_journal, previous=previous_notion, since=since, prefetcher=prefetcher
+                )
+                crawl_frontier = frontier.Frontier(config["crawl_priority"], config["time_budget"])
+                if config["async_fetch"] or config["discovery"] == "search":
+                    finished = async_notion2json.crawl(
+                        config["notion_page_id"],
+                        notion=throttling.async_throttled_client(
+                            config["notion_token"],
+                            bucket,
+                            config["max_retries"],
+                            base_url=config["notion_base_url"],
+                            transport=recording.async_inner_transport(
+                                config["record_fixture"], config["replay_fixture"]
+                            ),
+                        ),
+                        state=state,
+                        frontier=crawl_frontier,
+                        concurrency=config["fetch_concurrency"],
+                        discovery=config["discovery"],
+                    )
+                else:
+                    finished = notion2json.crawl(
+                        config["notion_page_id"], notion=notion, state=state, frontier=crawl_frontier
+                    )
+        finally:
+            if prefetcher is not None:
+                # Downloads still queued when the crawl stops early are left to the resumed crawl
+                prefetcher.close(cancel=not finished)
+        if not finished:
+            # The journal keeps the fetched content for --resume.
+            return
+        raw_notion = journal.compact(filename_journal, filename)
+        with open(filename_sync, "w+", encoding="utf-8") as f:
+            json.dump({"started_at": crawl_journal.started_at}, f)
+        if previous_notion:
+            removed_pages = len(set(previous_notion) - set(raw_notion))
+            logging.info(f"🤖 Reused {state.reused_pages} unchanged pages, pruned {removed_pages} removed pages.")
+            logging.info(
+                f"🤖 Reused {state.reused_blocks} unchanged nested blocks, fetched {state.fetched_blocks} changed ones."
+            )
         logging.info(f"🤖 Downloaded raw notion content. Saved at {filename}")
 
     # Stage 2. Structuring data
@@ -0,0 +1,492 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from urllib import request
+from urllib.error import URLError
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import httpx
+
+
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded."""
+
+
+class IncompleteDownload(DownloadError):
+    """Raised when the connection ends before the whole file is received, the download can be resumed."""
+
+
+class OversizedFile(DownloadError):
+    """Raised when a file is larger than the maximum size of downloaded files."""
+
+    def __init__(self, size: int):
+        super().__init__(f"{size / 2**20:.1f} MB")
+        self.size = size
+
+
+# Directory of the AssetStore inside the cache directory, outside of the published site
+STORE_DIR = "assets"
+
+# Directory of '.part' files of downloads without the AssetStore inside the cache directory
+PARTIAL_DIR = "partial"
+
+# Query parameters of signed URLs (S3, CloudFront), which change every time Notion returns the URL.
+SIGNATURE_PARAMETERS = {"expires", "signature", "key-pair-id", "policy"}
+
+
+def normalize_url(url: str) -> str:
+    """Returns the URL without signature parameters of its query string.
+
+    Notion signs URLs of its files anew in every response, so the same file
+    comes with a different URL each time; the normalized URL stays the same.
+    """
+    parts = urlsplit(url)
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("x-amz-") and key.lower() not in SIGNATURE_PARAMETERS
+    ]
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path, urlencode(sorted(query)), ""))
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class AssetStore:
+    """Content-addressed store of downloaded files shared by all pages.
+
+    Every file is stored once as 'root/<sha256[:2]>/<sha256><suffix>', and a
+    persistent index maps normalized URLs to the stored files, so a file
+    embedded on many pages is downloaded once per site and later builds
+    skip files they already have. Pages get hardlinks to the stored files
+    (or copies where hardlinks are not supported, e.g. across filesystems),
+    so their paths do not change. Stored files are checked against their
+    sha256 once per build before they are used.
+
+    Args:
+        root (Path): Directory of the store with its 'index.json'.
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.index_file = self.root / "index.json"
+        # normalized URL -> {"sha256": ..., "size": ..., "path": path relative to root}
+        self.index: dict = {}
+        if self.index_file.exists():
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                self.index = json.load(f)["assets"]
+        # Paths whose content matched their sha256 in this build
+        self.verified: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Path | None:
+        """Returns the stored file of the URL or None if it is missing or damaged."""
+        with self._lock:
+            entry = self.index.get(normalize_url(url))
+        if entry is None:
+            return None
+        path = self.root / entry["path"]
+        with self._lock:
+            if path in self.verified:
+                return path
+        if not path.exists() or path.stat().st_size != entry["size"] or file_sha256(path) != entry["sha256"]:
+            return None
+        with self._lock:
+            self.verified.add(path)
+        return path
+
+    def partial(self, url: str) -> Path:
+        """Returns the '.part' file the URL is downloaded into, the same for every signature of the URL."""
+        (self.root / ".partial").mkdir(parents=True, exist_ok=True)
+        return self.root / ".partial" / f"{hashlib.sha1(normalize_url(url).encode()).hexdigest()}.part"
+
+    def add(self, url: str, downloaded: Path):
+        """Moves the completely downloaded file into the store as the file of the URL.
+
+        The file is named by its sha256, so the same file behind different
+        URLs is stored once.
+        """
+        digest = file_sha256(downloaded)
+        path = Path(digest[:2]) / f"{digest}{Path(urlsplit(url).path).suffix[:16]}"
+        (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+        size = downloaded.stat().st_size
+        os.replace(downloaded, self.root / path)
+        with self._lock:
+            self.verified.add(self.root / path)
+            self.index[normalize_url(url)] = {"sha256": digest, "size": size, "path": path.as_posix()}
+
+    def link(self, path: Path, destination: Path):
+        """Places the stored file at 'destination' as a hardlink or a copy."""
+        link_file(path, destination)
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            content = json.dumps({"version": 1, "assets": self.index}, ensure_ascii=False, indent=1, sort_keys=True)
+        with atomic_file(self.index_file) as f:
+            f.write(content.encode("utf-8"))
+
+
+class AssetDownloader:
+    """Downloads files concurrently over pooled keep-alive connections.
+
+    Up to 'workers' files are downloaded at once by one shared httpx client,
+    which keeps connections to each host alive between files. Every file is
+    streamed into a '.part' file and renamed into place only when its length
+    matches the Content-Length (or Content-Range) of the response, so an
+    interrupted build never leaves a truncated file behind. A broken
+    connection is resumed with an HTTP Range request from the end of the
+    '.part' file, up to 'retries' times within the build and again by the
+    next build; If-Range with the ETag of the first response makes sure the
+    parts belong to one version of the file. URLs of other schemes than
+    http(s) (file:, data:, ftp:) are fetched with urllib as before.
+
+    With a 'store', every file is downloaded once into the AssetStore and
+    linked to its destinations, so a file used by many pages or already
+    downloaded by an earlier build is not downloaded again. Without it,
+    '.part' files are kept in 'partial_dir', never next to their
+    destinations in the site.
+
+    Args:
+        workers (int): Number of concurrent downloads.
+        timeout (float): Seconds a single file may take to download.
+        store (AssetStore): Store shared by all pages or None to download
+            every destination on its own.
+        max_size (int): Files larger than this number of bytes are not
+            downloaded but recorded in 'oversized', None for no limit.
+        retries (int): Resumptions of a broken download within the build.
+        partial_dir (Path): Directory of '.part' files of downloads without
+            the store, kept for the next build. None for a temporary one.
+    """
+
+    def __init__(
+        self,
+        workers: int = 8,
+        timeout: float = 120.0,
+        store: AssetStore | None = None,
+        max_size: int | None = None,
+        retries: int = 3,
+        partial_dir: Path | None = None,
+    ):
+        self.workers = max(1, workers)
+        self._temporary_dir = None
+        if partial_dir is None:
+            if store is not None:
+                # Where AssetStore.partial() keeps the downloads into the store
+                partial_dir = store.root / ".partial"
+            else:
+                self._temporary_dir = tempfile.TemporaryDirectory(prefix="notion4ever-")
+                partial_dir = Path(self._temporary_dir.name)
+        self.partial_dir = partial_dir
+        self.timeout = timeout
+        self.store = store
+        self.max_size = max_size
+        self.retries = retries
+        self.client = httpx.Client(
+            follow_redirects=True,
+            timeout=httpx.Timeout(min(timeout, 30.0)),
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+            # Lengths are verified against the bytes as they are stored
+            headers={"Accept-Encoding": "identity"},
+        )
+        # destination -> reason of the failure
+        self.failures: dict = {}
+        # destination -> size of the file over 'max_size'
+        self.oversized: dict = {}
+        self.downloaded = 0
+        self.skipped = 0
+        self.reused = 0
+        self.resumed = 0
+        self._lock = threading.Lock()
+        # normalized URL -> lock, so concurrent destinations of one file wait for a single download
+        self._url_locks: dict = {}
+        # normalized URL -> size of the file over 'max_size'
+        self._oversized_urls: dict = {}
+
+    def __enter__(self) -> "AssetDownloader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.client.close()
+        if self.store is not None:
+            self.store.save()
+        if self._temporary_dir is not None:
+            self._temporary_dir.cleanup()
+
+    def download_all(self, downloads: dict):
+        """Downloads files concurrently.
+
+        Args:
+            downloads (dict): Destination path -> URL. Existing destinations
+                are not downloaded again.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for _ in executor.map(lambda item: self.download(*item), downloads.items()):
+                pass
+
+    def download(self, destination: Path, url: str):
+        if destination.exists():
+            logging.debug(f"🤖 {destination.name} already exists.")
+            with self._lock:
+                self.skipped += 1
+            return
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.store is None:
+                self.partial_dir.mkdir(parents=True, exist_ok=True)
+                part = self.partial_dir / f"{hashlib.sha1(str(destination).encode()).hexdigest()}.part"
+                self._fetch(url, part)
+                move_file(part, destination)
+                with self._lock:
+                    self.downloaded += 1
+            else:
+                self.store.link(self.store_url(url), destination)
+        except OversizedFile as e:
+            self.oversized[destination] = e.size
+            logging.info(f"🤖 {destination.name} is not downloaded, it has {e}.")
+            return
+        except (DownloadError, httpx.HTTPError, URLError, OSError) as e:
+            self.failures[destination] = f"{url}: {e}"
+            logging.warning(f"🤖Cannot download {destination.name} from link {url}.")
+            return
+        logging.debug(f"🤖 Downloaded {destination.name}")
+
+    def store_url(self, url: str) -> Path:
+        """Returns the stored file of the URL, downloading it unless the store has it."""
+        store = self.store
+        if store is None:
+            raise ValueError("Files are stored only by a downloader with a store.")
+        key = normalize_url(url)
+        with self._lock:
+            url_lock = self._url_locks.setdefault(key, threading.Lock())
+        with url_lock:
+            stored = store.get(url)
+            if stored is not None:
+                with self._lock:
+                    self.reused += 1
+                return stored
+            if key in self._oversized_urls:
+                raise OversizedFile(self._oversized_urls[key])
+            part = store.partial(url)
+            try:
+                self._fetch(url, part)
+            except OversizedFile as e:
+                self._oversized_urls[key] = e.size
+                raise
+            store.add(url, part)
+            with self._lock:
+                self.downloaded += 1
+            stored = store.get(url)
+            if stored is None:
+                raise DownloadError("stored file does not match its sha256")
+            return stored
+
+    def _fetch(self, url: str, part: Path):
+        """Downloads the URL into the '.part' file, resuming what is already there."""
+        if urlparse(url).scheme not in ("http", "https"):
+            try:
+                with open(part, "wb") as f:
+                    self._retrieve(url, f)
+            except BaseException:
+                # Downloads of other schemes are not resumed
+                part.unlink(missing_ok=True)
+                raise
+            return
+        deadline = time.monotonic() + self.timeout
+        for attempt in range(self.retries + 1):
+            try:
+                self._stream(url, part, deadline)
+                return
+            except (IncompleteDownload, httpx.TransportError) as e:
+                if attempt == self.retries or time.monotonic() > deadline:
+                    raise
+                logging.debug(f"🤖 Resuming {part.name} after: {e!r}")
+
+    def _stream(self, url: str, part: Path, deadline: float):
+        validator = part.with_name(f"{part.name}.etag")
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {}
+        if offset and validator.exists():
+            headers = {"Range": f"bytes={offset}-", "If-Range": validator.read_text(encoding="utf-8")}
+        with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 416:
+                # The part does not fit the file anymore
+                part.unlink()
+                raise IncompleteDownload("requested range not satisfiable")
+            if response.status_code >= 400:
+                raise DownloadError(f"HTTP {response.status_code}")
+            total = None
+            if response.status_code == 206:
+                start, total = content_range(response.headers.get("content-range", ""))
+                if start != offset:
+                    part.unlink()
+                    raise IncompleteDownload(f"server resumed from {start} instead of {offset}")
+                with self._lock:
+                    self.resumed += 1
+            else:
+                offset = 0
+                if "content-length" in response.headers and "content-encoding" not in response.headers:
+                    total = int(response.headers["content-length"])
+                tag = response.headers.get("etag") or response.headers.get("last-modified")
+                if tag:
+                    validator.write_text(tag, encoding="utf-8")
+                elif validator.exists():
+                    validator.unlink()
+            if self.max_size is not None and total is not None and total > self.max_size:
+                raise OversizedFile(total)
+
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_bytes(chunk_size=1 << 16):
+                    f.write(chunk)
+                    if self.max_size is not None and f.tell() > self.max_size:
+                        size = f.tell()
+                        f.close()
+                        part.unlink()
+                        raise OversizedFile(size)
+                    if time.monotonic() > deadline:
+                        raise DownloadError(f"timed out after {self.timeout:.0f}s, continues in the next build")
+                size = f.tell()
+        if total is not None and size != total:
+            raise IncompleteDownload(f"received {size} of {total} bytes")
+        if validator.exists():
+            validator.unlink()
+
+    def _retrieve(self, url: str, f):
+        with request.urlopen(url, timeout=self.timeout) as response:
+            while chunk := response.read(1 << 16):
+                f.write(chunk)
+                if self.max_size is not None and f.tell() > self.max_size:
+                    raise OversizedFile(f.tell())
+
+    def report(self):
+        logging.info(
+            f"🤖 Downloaded {self.downloaded} files, reused {self.reused} from the asset store, "
+            f"{self.skipped} already existed, {len(self.oversized)} were too large, {len(self.failures)} failed."
+        )
+        if self.resumed:
+            logging.info(f"🤖 Resumed {self.resumed} interrupted downloads.")
+        for destination, reason in self.failures.items():
+            logging.warning(f"🤖 Failed {destination}: {reason}")
+
+
+def content_range(value: str) -> tuple:
+    """Returns (first byte, total length or None) of a 'bytes first-last/total' Content-Range header."""
+    match = re.fullmatch(r"bytes (\d+)-\d+/(\d+|\*)", value.strip())
+    if match is None:
+        raise DownloadError(f"invalid Content-Range {value!r}")
+    total = None if match[2] == "*" else int(match[2])
+    return int(match[1]), total
+
+
+class AssetPrefetcher:
+    """Downloads files into the AssetStore in the background while the crawl goes on.
+
+    Notion signs URLs of its files for about an hour, so on long crawls
+    files are downloaded as soon as the crawler finds them instead of after
+    the crawl. Structuring then links them from the store without network
+    requests; only files which failed here are downloaded again there.
+
+    Args:
+        store (AssetStore): Store the files are downloaded into.
+        workers (int): Number of concurrent downloads.
+        timeout (float): Seconds a single file may take to download.
+        max_size (int): Files larger than this number of bytes are left to
+            the max-size policy of structuring, None for no limit.
+    """
+
+    def __init__(self, store: AssetStore, workers: int = 8, timeout: float = 120.0, max_size: int | None = None):
+        self.downloader = AssetDownloader(workers, timeout, store, max_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.downloader.workers)
+        self.submitted: set = set()
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "AssetPrefetcher":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(cancel=exc_type is not None)
+
+    def submit(self, url: str):
+        """Queues the download of the URL unless it has been queued before."""
+        if not urlparse(url).scheme:
+            return
+        key = normalize_url(url)
+        if key in self.submitted:
+            return
+        self.submitted.add(key)
+        self.executor.submit(self._prefetch, url)
+
+    def _prefetch(self, url: str):
+        try:
+            self.downloader.store_url(url)
+        except OversizedFile:
+            pass
+        except (DownloadError, httpx.HTTPError, URLError, OSError) as e:
+            # Structuring downloads the file again and reports the failure
+            with self._lock:
+                self.failed += 1
+            logging.debug(f"🤖 Cannot prefetch {url}: {e}")
+
+    def close(self, cancel: bool = False):
+        """Waits for the queued downloads or cancels them and saves the store index."""
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+        self.downloader.close()
+        logging.info(
+            f"🤖 Prefetched {self.downloader.downloaded} files during the crawl, "
+            f"{self.downloader.reused} were already stored, {self.failed} failed."
+        )
+
+
+def link_file(path: Path, destination: Path):
+    """Places the file at 'destination' as a hardlink or a copy, keeping an existing file there."""
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(path, destination)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copyfile(path, destination)
+
+
+def move_file(source: Path, destination: Path):
+    """Moves the file into place at once, copying it when the directories are on different filesystems."""
+    try:
+        os.replace(source, destination)
+    except OSError:
+        with open(source, "rb") as src, atomic_file(destination) as f:
+            shutil.copyfileobj(src, f)
+        source.unlink()
+
+
+@contextmanager
+def atomic_file(destination: Path):
+    """Opens a temporary file which is renamed to 'destination' only if writing succeeds."""
+    fd, tmp_name = tempfile.mkstemp(dir=destination.parent, prefix=f".{destination.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    os.replace(tmp_name, destination)
@@ -0,0 +1,383 @@
+from notion_client import APIResponseError
+from notion4ever.frontier import Frontier
+from notion4ever.notion2json import BlockReuse
+from notion4ever.notion2json import CrawlState
+from notion4ever.notion2json import expand
+from notion4ever.notion2json import finish_crawl
+from notion4ever.notion2json import is_not_found
+from notion4ever.notion2json import merge_database_entries
+from notion4ever.notion2json import normalize_id
+from notion4ever.notion2json import Pagination
+from notion4ever.notion2json import synced_source
+import notion_client
+import asyncio
+import logging
+
+
+async def list_all(endpoint, object_id: str, semaphore: asyncio.Semaphore, **kwargs) -> list:
+    """Collects every result of a paginated Notion list endpoint, as notion2json.list_all.
+
+    Args:
+        endpoint: Bound async endpoint, e.g. notion.blocks.children.list or
+            notion.databases.query.
+        object_id (str): ID of the block, page or database to list.
+        semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+        **kwargs: Additional parameters of the request, e.g. filter.
+
+    Returns:
+        results (list): Concatenated "results" of all pages of the listing.
+    """
+    pagination = Pagination(**kwargs)
+    while not pagination.done:
+        async with semaphore:
+            response: dict = await endpoint(object_id, **pagination.request())  # type: ignore
+        pagination.add(response)
+    return pagination.results
+
+
+async def block_parser(
+    block: dict,
+    notion: "notion_client.client.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    reuse: BlockReuse | None = None,
+    synced: dict | None = None,
+) -> dict:
+    """Asynchronous counterpart of notion2json.block_parser.
+
+    Sibling blocks with nested content are fetched concurrently, while the
+    cursor pagination of a single block stays sequential. References to a
+    synced block met concurrently wait for the same task listing its content.
+    """
+    if block["has_children"]:
+        if synced is not None and (source_id := synced_source(block)) is not None:
+            if source_id not in synced:
+                synced[source_id] = asyncio.ensure_future(synced_children(block, notion, semaphore, reuse, synced))
+            else:
+                logging.debug(f"🤖 Reused content of synced block {source_id}.")
+            block["children"] = await synced[source_id]
+            return block
+
+        if reuse is not None:
+            children = reuse.children(block)
+            if children is not None:
+                block["children"] = children
+                return block
+
+        block["children"] = await list_all(notion.blocks.children.list, block["id"], semaphore)
+        await asyncio.gather(
+            *(block_parser(child_block, notion, semaphore, reuse, synced) for child_block in block["children"])
+        )
+    return block
+
+
+async def synced_children(
+    block: dict,
+    notion: "notion_client.client.AsyncClient",
+    semaphore: asyncio.Semaphore,
+    reuse: BlockReuse | None,
+    synced: dict,
+) -> list:
+    children = await list_all(notion.blocks.children.list, block["id"], semaphore)
+    await asyncio.gather(*(block_parser(child_block, notion, semaphore, reuse, synced) for child_block in children))
+    return children
+
+
+async def list_blocks(
+    page: dict,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    semaphore: asyncio.Semaphore,
+):
+    """Lists blocks of a page or entries of a database, recording each cursor page."""
+    journal = state.journal
+    notion_json = state.notion_json
+    page_id = page["id"]
+    if page["object"] == "page":
+        endpoint = notion.blocks.children.list
+    elif page["object"] == "database":
+        endpoint = notion.databases.query
+    else:
+        raise ValueError("Unknown page type.")
+
+    pagination = Pagination(journal.next_cursor(page_id))
+    if pagination.start_cursor is None:
+        notion_json[page_id]["blocks"] = []
+    while not pagination.done:
+        async with semaphore:
+            blocks: dict = await endpoint(page_id, **pagination.request())  # type: ignore
+        pagination.add(blocks)
+        if page["object"] == "database":
+            for block in blocks["results"]:
+                block["type"] = "db_entry"
+        notion_json[page_id]["blocks"].extend(blocks["results"])
+        journal.blocks(page_id, blocks["results"], pagination.start_cursor)
+
+
+async def query_database_delta(
+    page: dict,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    semaphore: asyncio.Semaphore,
+    delta: dict,
+) -> list:
+    """Asynchronous counterpart of notion2json.query_database_delta."""
+    database_id = page["id"]
+    entry_ids, changed_entries = await asyncio.gather(
+        list_all(notion.databases.query, database_id, semaphore, filter_properties=["title"]),
+        list_all(
+            notion.databases.query,
+            database_id,
+            semaphore,
+            filter=delta,
+            sorts=[{"timestamp": "last_edited_time", "direction": "descending"}],
+        ),
+    )
+    entry_ids = [entry["id"] for entry in entry_ids]
+    entries = merge_database_entries(entry_ids, changed_entries, state.previous[database_id]["blocks"])
+    for i_entry, entry in enumerate(entries):
+        if entry is None:
+            async with semaphore:
+                entries[i_entry] = await notion.pages.retrieve(entry_ids[i_entry])
+    logging.debug(f"🤖 {len(changed_entries)} of {len(entries)} entries of {database_id} changed.")
+    return entries
+
+
+async def parse_block(
+    page_id: str,
+    i_block: int,
+    block: dict,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    semaphore: asyncio.Semaphore,
+    reuse: BlockReuse | None = None,
+):
+    block = await block_parser(block, notion, semaphore, reuse, state.synced_blocks)
+    state.journal.block(page_id, i_block, block)
+
+
+async def retrieve(page_id: str, notion: "notion_client.client.AsyncClient", semaphore: asyncio.Semaphore) -> dict:
+    """Asynchronous counterpart of notion2json.retrieve."""
+    try:
+        async with semaphore:
+            return await notion.pages.retrieve(page_id)  # type: ignore
+    except APIResponseError:
+        async with semaphore:
+            return await notion.databases.retrieve(page_id)  # type: ignore
+
+
+async def fetch_page(
+    page_id: str,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    semaphore: asyncio.Semaphore,
+    header: dict | None = None,
+) -> dict:
+    """Asynchronous counterpart of notion2json.fetch_page.
+
+    The content of a page is listed first, then all nested blocks are
+    parsed concurrently.
+
+    Args:
+        page_id (str): ID of the Notion page for parsing.
+        notion (notion_client.client.AsyncClient): Asynchronous client for
+            python API for Notion.
+        state (CrawlState): State of the crawl, see notion2json.fetch_page.
+        semaphore (asyncio.Semaphore): Bounds the number of requests in flight.
+        header (dict): Already known page object, which saves pages.retrieve call.
+
+    Returns:
+        page (dict): The page from 'state.notion_json'.
+    """
+    journal = state.journal
+    notion_json = state.notion_json
+    page = journal.retrieved_page(page_id)
+    if page is None:
+        page = header if header is not None else await retrieve(page_id, notion, semaphore)
+        notion_json[page["id"]] = page
+        journal.page(page)
+        logging.debug(f"🤖 Retrieved {page['id']} of type {page['object']}.")
+
+    if journal.is_done(page["id"]):
+        state.prefetch(page)
+        return page
+
+    reuse = None
+    if not journal.is_listed(page["id"]):
+        previous_page = state.unchanged_page(page) if page["object"] == "page" else None
+        if previous_page is not None:
+            notion_json[page["id"]]["blocks"] = previous_page["blocks"]
+            journal.blocks(page["id"], previous_page["blocks"], None, parsed=True)
+            state.reused_pages += 1
+            logging.debug(f"🤖 Reused unchanged content of {page['id']}.")
+        elif (delta := state.database_delta(page)) is not None:
+            entries = await query_database_delta(page, notion, state, semaphore, delta)
+            for block in entries:
+                block["type"] = "db_entry"
+            notion_json[page["id"]]["blocks"] = entries
+            journal.blocks(page["id"], entries, None)
+        else:
+            reuse = state.block_reuse(page)
+            await list_blocks(page, notion, state, semaphore)
+            logging.debug(f"🤖 Parsed content of {page['id']}.")
+
+    if page["object"] == "page":
+        nested_blocks = []
+        for i_block, block in enumerate(notion_json[page["id"]]["blocks"]):
+            if block["type"] not in ["page", "child_page", "child_database"]:
+                if not journal.is_parsed(page["id"], i_block):
+                    nested_blocks.append(parse_block(page["id"], i_block, block, notion, state, semaphore, reuse))
+        await asyncio.gather(*nested_blocks)
+        state.report_reuse(page["id"], reuse)
+    state.prefetch(page)
+    return page
+
+
+async def run_frontier(
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    frontier: Frontier,
+    semaphore: asyncio.Semaphore,
+    workers: int,
+):
+    """Fetches pages of the frontier with a fixed number of concurrent workers."""
+    tasks = {}
+    while True:
+        while len(tasks) < workers and (item := frontier.pop()) is not None:
+            page_id, header, depth = item
+            tasks[asyncio.create_task(fetch_page(page_id, notion, state, semaphore, header))] = (page_id, depth)
+        if not tasks:
+            break
+
+        finished, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            page_id, depth = tasks.pop(task)
+            error = task.exception()
+            if error is None:
+                frontier.complete(page_id)
+                expand(task.result(), depth, state, frontier)
+            elif is_not_found(error):
+                # if 404 error, then the block is removed in the end
+                frontier.fail(page_id)
+            else:
+                # Other finished tasks are still in 'tasks', so their exceptions are retrieved too
+                for pending in tasks:
+                    pending.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise error
+
+
+async def search_workspace(notion: "notion_client.client.AsyncClient", semaphore: asyncio.Semaphore) -> list:
+    """Lists every page and database shared with the integration, recently edited first."""
+    pagination = Pagination(sort={"direction": "descending", "timestamp": "last_edited_time"}, page_size=100)
+    while not pagination.done:
+        async with semaphore:
+            response: dict = await notion.search(**pagination.request())  # type: ignore
+        pagination.add(response)
+    return pagination.results
+
+
+def parent_id(page: dict) -> str | None:
+    """Returns ID of the parent page or database of a page or a database."""
+    return page["parent"].get("page_id") or page["parent"].get("database_id")
+
+
+def descendants(objects: list, root_id: str) -> dict:
+    """Restricts search results to the root and its descendants.
+
+    The parent/child graph is built from the "parent" field of each object.
+    Pages nested into blocks of another page (e.g. inside columns) are left
+    out, they are found once their parent page is fetched.
+
+    Returns:
+        descendants (dict): Pairs (object, depth below the root) by object ID,
+            in the order of 'objects'.
+    """
+    children = {}
+    for page in objects:
+        children.setdefault(parent_id(page), []).append(page["id"])
+
+    depths = {root_id: 0}
+    stack = [root_id]
+    while stack:
+        page_id = stack.pop()
+        for child_id in children.get(page_id, ()):
+            if child_id not in depths:
+                depths[child_id] = depths[page_id] + 1
+                stack.append(child_id)
+    return {page["id"]: (page, depths[page["id"]]) for page in objects if page["id"] in depths}
+
+
+async def _crawl(
+    page_id: str,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    frontier: Frontier,
+    concurrency: int,
+    discovery: str,
+) -> bool:
+    semaphore = asyncio.Semaphore(concurrency)
+    root_id = normalize_id(page_id)
+    try:
+        if discovery == "search":
+            found = descendants(await search_workspace(notion, semaphore), root_id)
+            logging.info(f"🤖 Found {len(found)} pages and databases with the search API.")
+            root_header, _ = found.pop(root_id, (None, 0))
+            # The root goes first, as the first page of notion_json is the root.
+            root = await fetch_page(root_id, notion, state, semaphore, root_header)
+            frontier.mark_fetched(root_id)
+            for object_id, (header, depth) in found.items():
+                frontier.push(object_id, header, depth)
+            # Subpages of the root are already queued with their headers, unless search has not found them
+            expand(root, 0, state, frontier)
+        else:
+            frontier.push(root_id)
+        await run_frontier(notion, state, frontier, semaphore, concurrency)
+    finally:
+        await notion.aclose()
+
+    frontier.report()
+    if not frontier.finished:
+        return False
+    finish_crawl(root_id, state, frontier)
+    return True
+
+
+def crawl(
+    page_id: str,
+    notion: "notion_client.client.AsyncClient",
+    state: CrawlState,
+    frontier: Frontier,
+    concurrency: int = 8,
+    discovery: str = "recursive",
+) -> bool:
+    """Parses notion page with all its nested content and subpages concurrently
+
+    Fills 'state.notion_json' with the same content notion2json.crawl
+    produces and appends it to the crawl journal. Up to 'concurrency' pages
+    of the frontier are fetched at once. Pages are recorded in the order they
+    are retrieved; journal.compact restores the depth-first order.
+
+    With the "search" discovery every page and database shared with the
+    integration is listed upfront with the search API and queued right away,
+    instead of waiting for their parents to be parsed. Subpages missing from
+    the search results (the search index is eventually consistent) are still
+    queued once their parents are fetched, and pages which are not reachable
+    from the root through blocks are discarded in the end, so the result is
+    the same as with the "recursive" discovery.
+
+    Args:
+        page_id (str): ID of the Notion page for parsing.
+        notion (notion_client.client.AsyncClient): Asynchronous client for
+            python API for Notion. It is closed after the crawl.
+        state (CrawlState): State of the crawl.
+        frontier (Frontier): Pages waiting to be fetched.
+        concurrency (int): Maximum number of pages and of Notion API requests
+            in flight.
+        discovery (str): "recursive" finds subpages while parsing their
+            parents, "search" lists them upfront with the search API.
+
+    Returns:
+        finished (bool): False if the time budget of the frontier is over
+            before all pages are fetched.
+    """
+    return asyncio.run(_crawl(page_id, notion, state, frontier, max(1, concurrency), discovery))
@@ -0,0 +1,509 @@
+"""Local stand-in for Notion API serving a synthetic workspace.
+
+It lets the crawler be benchmarked offline and reproducibly:
+
+    python -m notion4ever.fake_notion --pages 1000 --depth 4 --port 8765
+    python -m notion4ever -n secret -p ROOT_PAGE_ID --notion_base_url http://127.0.0.1:8765
+
+Only the endpoints notion4ever uses are implemented: pages and databases
+retrieval, block children, database queries and search. Files referenced by
+image blocks are served under /files/ with signed-looking query strings.
+"""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+import argparse
+import functools
+import json
+import logging
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# Placeholder of file URLs, replaced with signed URLs of the server in every response.
+FILES_URL = "fake-notion://files/"
+
+
+def notion_time(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+
+def rich_text(content: str) -> list:
+    return [
+        {
+            "type": "text",
+            "text": {"content": content, "link": None},
+            "annotations": {
+                "bold": False,
+                "italic": False,
+                "strikethrough": False,
+                "underline": False,
+                "code": False,
+                "color": "default",
+            },
+            "plain_text": content,
+            "href": None,
+        }
+    ]
+
+
+@functools.lru_cache(maxsize=256)
+def png(width: int, height: int, seed: int) -> bytes:
+    """Returns a valid PNG image filled with a gradient depending on 'seed'."""
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(
+        b"\x00" + b"".join(bytes((x * 255 // width, y * 255 // height, seed % 256)) for x in range(width))
+        for y in range(height)
+    )
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+class FakeWorkspace:
+    """Synthetic workspace: a tree of pages with databases and nested blocks.
+
+    Args:
+        pages (int): Number of pages besides database entries, the root included.
+        depth (int): Maximum depth of the page tree below the root.
+        blocks (int): Top-level blocks per page, every third one is a toggle
+            with nested blocks.
+        databases (int): Number of databases, placed under the first pages.
+        database_size (int): Number of entries of every database.
+        seed (int): Seed of the generator, the same seed gives the same workspace.
+    """
+
+    def __init__(
+        self,
+        pages: int = 100,
+        depth: int = 3,
+        blocks: int = 10,
+        databases: int = 1,
+        database_size: int = 20,
+        seed: int = 0,
+    ):
+        self.rng = random.Random(seed)
+        self.objects: dict = {}
+        # block, page or database ID -> list of its children blocks (or entries)
+        self.children: dict = {}
+        self.files: dict = {}
+        self.root_id = self._new_page(None, 0)
+
+        # The smallest fanout which fits all pages into 'depth' levels
+        fanout = 1
+        while depth > 0 and sum(fanout**level for level in range(1, depth + 1)) < pages - 1:
+            fanout += 1
+        queue = [(self.root_id, 0)] if depth > 0 else []
+        n_pages = 1
+        while queue and n_pages < pages:
+            parent_id, level = queue.pop(0)
+            for _ in range(fanout):
+                if n_pages >= pages:
+                    break
+                page_id = self._new_page(parent_id, blocks)
+                self.children[parent_id].append(self._child_block(parent_id, page_id, "child_page"))
+                n_pages += 1
+                if level + 1 < depth:
+                    queue.append((page_id, level + 1))
+
+        page_ids = [object_id for object_id in self.objects if object_id != self.root_id] or [self.root_id]
+        for i_database in range(databases):
+            parent_id = page_ids[i_database % len(page_ids)]
+            database_id = self._new_database(parent_id, database_size, blocks)
+            self.children[parent_id].append(self._child_block(parent_id, database_id, "child_database"))
+        self.children[self.root_id] = self._blocks(self.root_id, blocks) + self.children[self.root_id]
+
+    # Generation
+    def _uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _edited(self) -> str:
+        return notion_time(EPOCH + timedelta(minutes=self.rng.randrange(60 * 24 * 365)))
+
+    def _parent(self, parent_id: str | None, key: str = "page_id") -> dict:
+        if parent_id is None:
+            return {"type": "workspace", "workspace": True}
+        return {"type": key, key: parent_id}
+
+    def _new_page(self, parent_id: str | None, n_blocks: int, database_id: str | None = None) -> str:
+        page_id = self._uuid()
+        title = f"Page {len(self.objects)}"
+        page = {
+            "object": "page",
+            "id": page_id,
+            "created_time": notion_time(EPOCH),
+            "last_edited_time": self._edited(),
+            "cover": None,
+            "icon": {"type": "emoji", "emoji": "📄"},
+            "parent": self._parent(database_id, "database_id") if database_id else self._parent(parent_id),
+            "archived": False,
+            "in_trash": False,
+            "url": f"https://www.notion.so/{page_id.replace('-', '')}",
+            "public_url": None,
+        }
+        if database_id is None:
+            page["properties"] = {"title": {"id": "title", "type": "title", "title": rich_text(title)}}
+        else:
+            day = EPOCH + timedelta(days=self.rng.randrange(365))
+            page["properties"] = {
+                "Date": {"id": "date", "type": "date", "date": {"start": day.date().isoformat(), "end": None}},
+                "Tags": {
+                    "id": "tags",
+                    "type": "multi_select",
+                    "multi_select": [{"id": "a", "name": self.rng.choice(["red", "green", "blue"]), "color": "red"}],
+                },
+                "Name": {"id": "title", "type": "title", "title": rich_text(f"Entry {len(self.objects)}")},
+            }
+        self.objects[page_id] = page
+        self.children[page_id] = self._blocks(page_id, n_blocks) if n_blocks else []
+        return page_id
+
+    def _new_database(self, parent_id: str, size: int, n_blocks: int) -> str:
+        database_id = self._uuid()
+        self.objects[database_id] = {
+            "object": "database",
+            "id": database_id,
+            "created_time": notion_time(EPOCH),
+            "last_edited_time": self._edited(),
+            "title": rich_text(f"Database {len(self.objects)}"),
+            "description": [],
+            "icon": None,
+            "cover": None,
+            "properties": {
+                "Date": {"id": "date", "name": "Date", "type": "date", "date": {}},
+                "Tags": {"id": "tags", "name": "Tags", "type": "multi_select", "multi_select": {"options": []}},
+                "Name": {"id": "title", "name": "Name", "type": "title", "title": {}},
+            },
+            "parent": self._parent(parent_id),
+            "url": f"https://www.notion.so/{database_id.replace('-', '')}",
+            "archived": False,
+            "in_trash": False,
+            "is_inline": False,
+        }
+        self.children[database_id] = []
+        for _ in range(size):
+            entry_id = self._new_page(None, max(1, n_blocks // 3), database_id=database_id)
+            self.children[database_id].append(entry_id)
+        return database_id
+
+    def _block(self, parent_id: str, block_type: str, payload: dict, has_children: bool = False) -> dict:
+        block = {
+            "object": "block",
+            "id": self._uuid(),
+            "parent": {"type": "page_id", "page_id": parent_id},
+            "created_time": notion_time(EPOCH),
+            "last_edited_time": self._edited(),
+            "has_children": has_children,
+            "archived": False,
+            "in_trash": False,
+            "type": block_type,
+            block_type: payload,
+        }
+        if has_children:
+            self.children[block["id"]] = []
+        return block
+
+    def _child_block(self, parent_id: str, page_id: str, block_type: str) -> dict:
+        block = self._block(parent_id, block_type, {"title": "child"})
+        block["id"] = page_id
+        return block
+
+    def _text(self, parent_id: str, block_type: str, has_children: bool = False) -> dict:
+        words = " ".join(self.rng.choice(["lorem", "ipsum", "dolor", "sit", "amet"]) for _ in range(12))
+        return self._block(parent_id, block_type, {"rich_text": rich_text(words), "color": "default"}, has_children)
+
+    def _blocks(self, page_id: str, n_blocks: int) -> list:
+        blocks = [self._text(page_id, "heading_2")]
+        for i_block in range(1, n_blocks):
+            if i_block % 3 == 1:
+                toggle = self._text(page_id, "toggle", has_children=True)
+                item = self._text(toggle["id"], "bulleted_list_item", has_children=True)
+                self.children[toggle["id"]] = [self._text(toggle["id"], "paragraph"), item]
+                self.children[item["id"]] = [self._text(item["id"], "bulleted_list_item")]
+                blocks.append(toggle)
+            elif i_block % 7 == 5:
+                blocks.append(self._image(page_id))
+            else:
+                blocks.append(self._text(page_id, "paragraph"))
+        return blocks
+
+    def _image(self, page_id: str) -> dict:
+        name = f"{self._uuid()}/image.png"
+        self.files[name] = self.rng.getrandbits(8)
+        return self._block(
+            page_id,
+            "image",
+            {"caption": [], "type": "file", "file": {"url": f"{FILES_URL}{name}", "expiry_time": None}},
+        )
+
+    # Modification
+    def edit(self, count: int, seed: int = 1):
+        """Edits text of 'count' random pages, bumping their last_edited_time."""
+        rng = random.Random(seed)
+        pages = [page for page in self.objects.values() if page["object"] == "page"]
+        now = notion_time(datetime.now(timezone.utc) + timedelta(minutes=2))
+        for page in rng.sample(pages, min(count, len(pages))):
+            page["last_edited_time"] = now
+            for block in self.children[page["id"]]:
+                if block["type"] == "paragraph":
+                    block["paragraph"]["rich_text"] = rich_text("Edited paragraph.")
+                    block["last_edited_time"] = now
+                    break
+
+
+class FakeNotionServer(ThreadingHTTPServer):
+    """HTTP server answering Notion API requests from a FakeWorkspace.
+
+    Args:
+        workspace (FakeWorkspace): Served workspace.
+        latency (float): Seconds every API response is delayed by.
+        rate_limit (float): Average requests per second served before 429
+            responses start, 0 disables the limit.
+        throttle_every (int): Answer every n-th API request with 429, 0 disables it.
+        retry_after (float): Value of the Retry-After header of 429 responses.
+        image_size (int): Width and height of served images in pixels.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        workspace: FakeWorkspace,
+        latency: float = 0.0,
+        rate_limit: float = 0.0,
+        throttle_every: int = 0,
+        retry_after: float = 1.0,
+        image_size: int = 64,
+    ):
+        super().__init__(address, FakeNotionHandler)
+        self.workspace = workspace
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.image_size = image_size
+        self.requests = 0
+        self.throttled = 0
+        self.files_served = 0
+        self._lock = threading.Lock()
+        self._tokens = rate_limit
+        self._updated = time.monotonic()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self) -> bool:
+        """Counts an API request and decides whether it is rate limited."""
+        with self._lock:
+            self.requests += 1
+            limited = self.throttle_every > 0 and self.requests % self.throttle_every == 0
+            if self.rate_limit > 0:
+                now = time.monotonic()
+                self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+                self._updated = now
+                if self._tokens < 1:
+                    limited = True
+                else:
+                    self._tokens -= 1
+            if limited:
+                self.throttled += 1
+            return not limited
+
+    def start(self) -> threading.Thread:
+        """Serves in a daemon thread, e.g. for benchmarks."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeNotionHandler(BaseHTTPRequestHandler):
+    server: FakeNotionServer  # type: ignore
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle's algorithm would delay keep-alive responses.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(f"🤖 Fake Notion: {format % args}")
+
+    def send_json(self, status: int, payload: dict, headers: dict | None = None):
+        # Like Notion, every response signs file URLs anew.
+        body = re.sub(
+            re.escape(FILES_URL) + r'([^"?]+)',
+            lambda match: (
+                f"{self.server.base_url}/files/{match[1]}?X-Amz-Algorithm=AWS4-HMAC-SHA256"
+                f"&X-Amz-Expires=3600&X-Amz-Signature={uuid.uuid4().hex}"
+            ),
+            json.dumps(payload),
+        ).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_not_found(self, object_id: str):
+        self.send_json(
+            404,
+            {
+                "object": "error",
+                "status": 404,
+                "code": "object_not_found",
+                "message": f"Could not find object with ID: {object_id}.",
+            },
+        )
+
+    def send_list(self, results: list, params: dict):
+        start = int(params.get("start_cursor") or 0)
+        page_size = min(100, int(params.get("page_size") or 100))
+        end = start + page_size
+        self.send_json(
+            200,
+            {
+                "object": "list",
+                "results": results[start:end],
+                "next_cursor": str(end) if end < len(results) else None,
+                "has_more": end < len(results),
+                "type": "block",
+            },
+        )
+
+    def do_GET(self):
+        self.handle_api("GET")
+
+    def do_POST(self):
+        self.handle_api("POST")
+
+    def handle_api(self, method: str):
+        url = urlparse(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if url.path.startswith("/files/"):
+            return self.send_file(url.path.removeprefix("/files/"))
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        if not self.server.admit():
+            return self.send_json(
+                429,
+                {"object": "error", "status": 429, "code": "rate_limited", "message": "Rate limited."},
+                {"Retry-After": str(self.server.retry_after)},
+            )
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = url.path.removeprefix("/v1/").strip("/").split("/")
+        workspace = self.server.workspace
+        objects = workspace.objects
+        if method == "GET" and parts[0] in ("pages", "databases") and len(parts) == 2:
+            obj = objects.get(parts[1])
+            if obj is None or obj["object"] != parts[0][:-1]:
+                return self.send_not_found(parts[1])
+            return self.send_json(200, obj)
+        if method == "GET" and parts[0] == "blocks" and len(parts) == 3 and parts[2] == "children":
+            if parts[1] not in workspace.children or objects.get(parts[1], {}).get("object") == "database":
+                return self.send_not_found(parts[1])
+            return self.send_list(workspace.children[parts[1]], query)
+        if method == "POST" and parts[0] == "databases" and len(parts) == 3 and parts[2] == "query":
+            if objects.get(parts[1], {}).get("object") != "database":
+                return self.send_not_found(parts[1])
+            entries = [dict(objects[entry_id]) for entry_id in workspace.children[parts[1]]]
+            entries = self.filter_entries(entries, body, parse_qs(url.query).get("filter_properties"))
+            return self.send_list(entries, body)
+        if method == "POST" and parts[0] == "search":
+            results = sorted(objects.values(), key=lambda obj: obj["last_edited_time"], reverse=True)
+            return self.send_list(results, body)
+        self.send_json(400, {"object": "error", "status": 400, "code": "invalid_request_url", "message": self.path})
+
+    @staticmethod
+    def filter_entries(entries: list, body: dict, filter_properties: list | None) -> list:
+        last_edited = body.get("filter", {}).get("last_edited_time", {})
+        if "on_or_after" in last_edited:
+            since = datetime.fromisoformat(last_edited["on_or_after"])
+            entries = [
+                entry
+                for entry in entries
+                if datetime.fromisoformat(entry["last_edited_time"].replace("Z", "+00:00")) >= since
+            ]
+        for sort in body.get("sorts", []):
+            entries.sort(key=lambda entry: entry[sort["timestamp"]], reverse=sort["direction"] == "descending")
+        if filter_properties:
+            for entry in entries:
+                entry["properties"] = {
+                    name: value for name, value in entry["properties"].items() if value["id"] in filter_properties
+                }
+        return entries
+
+    def send_file(self, name: str):
+        if name not in self.server.workspace.files:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = png(self.server.image_size, self.server.image_size, self.server.workspace.files[name])
+        with self.server._lock:
+            self.server.files_served += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Notion workspace for offline benchmarks.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--pages", type=int, default=100, help="Number of pages.")
+    parser.add_argument("--depth", type=int, default=3, help="Maximum depth of the page tree.")
+    parser.add_argument("--blocks", type=int, default=10, help="Top-level blocks per page.")
+    parser.add_argument("--databases", type=int, default=1, help="Number of databases.")
+    parser.add_argument("--database_size", type=int, default=20, help="Entries per database.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated workspace.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of every API response in seconds.")
+    parser.add_argument("--rate_limit", type=float, default=0.0, help="Requests per second before 429, 0 is off.")
+    parser.add_argument("--throttle_every", type=int, default=0, help="Answer every n-th request with 429.")
+    parser.add_argument("--retry_after", type=float, default=1.0, help="Retry-After of 429 responses in seconds.")
+    parser.add_argument("--image_size", type=int, default=64, help="Size of served images in pixels.")
+    config = parser.parse_args()
+
+    logging.basicConfig(format="%(asctime)s %(levelname)s: %(message)s", level=logging.INFO)
+    workspace = FakeWorkspace(
+        config.pages, config.depth, config.blocks, config.databases, config.database_size, config.seed
+    )
+    server = FakeNotionServer(
+        (config.host, config.port),
+        workspace,
+        latency=config.latency,
+        rate_limit=config.rate_limit,
+        throttle_every=config.throttle_every,
+        retry_after=config.retry_after,
+        image_size=config.image_size,
+    )
+    logging.info(f"🤖 Serving {len(workspace.objects)} pages and databases at {server.base_url}.")
+    logging.info(f"🤖 Root page ID: {workspace.root_id}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
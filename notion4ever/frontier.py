@@ -0,0 +1,108 @@
+from notion4ever.notion2json import normalize_id
+from datetime import datetime
+import heapq
+import itertools
+import logging
+import time
+
+PRIORITIES = ["shallow", "recent"]
+
+
+class Frontier:
+    """Pages and databases waiting to be fetched in one crawl.
+
+    Every ID is fetched at most once per run: an ID enters the visited set
+    when it is pushed, so a page reachable through several paths (e.g. as a
+    child page and as a database entry, or through a linked database) is
+    skipped while it is queued, in flight or already fetched. Queued pages are
+    popped in the order of 'priority':
+        "shallow" - pages closer to the root first,
+        "recent" - recently edited pages first, as far as last_edited_time
+            is known from the header or from the block pointing to the page.
+    Once 'time_budget' seconds are over, nothing is popped anymore, so a
+    time-boxed crawl ends with the most valuable content fetched and can be
+    continued with --resume.
+
+    Args:
+        priority (str): Order of fetching, one of PRIORITIES.
+        time_budget (float): Seconds the crawl may take or None for no limit.
+    """
+
+    def __init__(self, priority: str = "shallow", time_budget: float | None = None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown crawl priority {priority}.")
+        self.priority = priority
+        self.deadline = time.monotonic() + time_budget if time_budget is not None else None
+        self.visited: set = set()
+        self.in_flight: set = set()
+        self.fetched: set = set()
+        self.not_found: set = set()
+        self.duplicates = 0
+        self._queue: list = []
+        self._order = itertools.count()
+
+    def _key(self, depth: int, last_edited_time: str | None) -> tuple:
+        if self.priority == "recent":
+            if last_edited_time is None:
+                edited = float("inf")
+            else:
+                edited = -datetime.fromisoformat(last_edited_time.replace("Z", "+00:00")).timestamp()
+            return (edited, depth)
+        return (depth,)
+
+    def push(self, page_id: str, header: dict | None = None, depth: int = 0, last_edited_time: str | None = None):
+        """Queues the page unless it has been visited in this run."""
+        page_id = normalize_id(page_id)
+        if page_id in self.visited:
+            self.duplicates += 1
+            return
+        self.visited.add(page_id)
+        if header is not None:
+            last_edited_time = header.get("last_edited_time", last_edited_time)
+        heapq.heappush(self._queue, (*self._key(depth, last_edited_time), next(self._order), page_id, header, depth))
+
+    def pop(self) -> tuple | None:
+        """Returns (page ID, header, depth) of the next page or None.
+
+        None means that the queue is empty or the time budget is over.
+        """
+        if not self._queue or self.expired:
+            return None
+        *_, page_id, header, depth = heapq.heappop(self._queue)
+        self.in_flight.add(page_id)
+        return page_id, header, depth
+
+    def mark_fetched(self, page_id: str):
+        """Records a page fetched before the frontier is run, so it is not queued again."""
+        page_id = normalize_id(page_id)
+        self.visited.add(page_id)
+        self.fetched.add(page_id)
+
+    def complete(self, page_id: str):
+        self.in_flight.discard(page_id)
+        self.fetched.add(page_id)
+
+    def fail(self, page_id: str):
+        """Marks the page as not found (404)."""
+        self.in_flight.discard(page_id)
+        self.not_found.add(page_id)
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    @property
+    def finished(self) -> bool:
+        """Checks that every visited page is fetched or not found."""
+        return not self._queue and not self.in_flight
+
+    def report(self):
+        logging.info(
+            f"🤖 Fetched {len(self.fetched)} pages and databases, "
+            f"skipped {self.duplicates} repeated references to them."
+        )
+        if not self.finished:
+            logging.warning(
+                f"🤖 Time budget is over with {len(self._queue) + len(self.in_flight)} pages left. "
+                "Continue the download with --resume true."
+            )
@@ -0,0 +1,432 @@
+from notion4ever.markdown_parser import mention_information
+from notion4ever.notion2json import synced_source
+
+from functools import partial
+from pathlib import Path
+from urllib.parse import urljoin
+from urllib.parse import urlparse
+from urllib.parse import unquote
+import html
+import logging
+
+from markdown.extensions.toc import nest_toc_tokens
+from markdown.extensions.toc import slugify
+from markdown.extensions.toc import unique
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexers import TextLexer
+from pygments.lexers import get_lexer_by_name
+from pygments.util import ClassNotFound
+
+# Placeholders of heading IDs and of the table of contents, filled in once the whole page is rendered
+HEADING_ID = "\x02heading\x03"
+TABLE_OF_CONTENTS = "\x02toc\x03"
+
+# The script markdown_mermaidjs adds after pages with mermaid diagrams
+MERMAID_SCRIPT = """<script type="module">
+    import mermaid from 'https://cdn.jsdelivr.net/npm/mermaid@11/dist/mermaid.esm.min.mjs';
+    mermaid.initialize({ startOnLoad: true });
+</script>"""
+
+# Opening and closing tags of lists, consecutive items of the same list are grouped into one
+LIST_TAGS = {
+    "bulleted_list_item": ("<ul>", "</ul>"),
+    # toggle item will be rendered as bulleted list item
+    "toggle": ("<ul>", "</ul>"),
+    "numbered_list_item": ("<ol>", "</ol>"),
+    "to_do": ('<ul class="task-list">', "</ul>"),
+}
+
+# The same markup as pymdownx.superfences highlighting with pygments
+CODE_FORMATTER = HtmlFormatter(wrapcode=True)
+
+
+def join(*parts: str) -> str:
+    return "\n".join(part for part in parts if part)
+
+
+def escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def plain_text(richtext_list: list) -> str:
+    return "".join(richtext["plain_text"] for richtext in richtext_list)
+
+
+def block_files(payload: dict) -> list:
+    """Returns URLs of the files of a block in the order markdown_parser.collect_block_info collects them."""
+    files = []
+    if "url" in payload:
+        files.append(payload["url"])
+    if "external" in payload:
+        files.append(payload["external"]["url"])
+    if "file" in payload:
+        files.append(payload["file"]["url"])
+    return files
+
+
+def file_url(payload: dict) -> str:
+    """Returns URL of the file shown by an image, video or file block."""
+    for source in ("file", "external"):
+        if source in payload:
+            return payload[source]["url"]
+    return payload["url"]
+
+
+class PageRenderer:
+    """Renders blocks of one page straight to HTML in a single walk of the block tree.
+
+    Consecutive list items are grouped into lists and children are nested
+    in the tags of their parents while walking, so no markdown is written
+    and parsed again. Files of the blocks are collected in the order of
+    markdown_parser.collect_block_info. Heading IDs and the table of
+    contents are filled in once the page is complete.
+
+    The HTML is that of the markdown path (benchmarks/parity.py checks every
+    block type), except where the markdown path depends on how
+    Python-Markdown reads the written markdown: text is escaped, so a
+    literal <tag> stays text instead of becoming raw HTML; list items are
+    not wrapped in paragraphs when blank lines make a list loose; and
+    children of blocks other than lists and toggles are rendered as blocks
+    instead of the code blocks their indented markdown becomes.
+
+    Args:
+        structured_notion (dict): Structured pages, for titles and URLs of child pages.
+        synced_cache (dict): Original block ID of synced blocks -> (HTML, files, headings)
+            of their children, shared by all pages of the site.
+    """
+
+    def __init__(self, structured_notion: dict, synced_cache: dict | None = None):
+        self.pages = structured_notion["pages"]
+        self.synced_cache = synced_cache if synced_cache is not None else {}
+        self.files: list = []
+        # (level, text) of headings in the order of the page
+        self.headings: list = []
+
+    def render(self, blocks: list) -> str:
+        return self.finish(self.blocks(blocks))
+
+    def blocks(self, blocks: list) -> str:
+        parts = []
+        list_tags = None
+        for block in blocks:
+            tags = LIST_TAGS.get(block["type"])
+            if tags != list_tags:
+                if list_tags:
+                    parts.append(list_tags[1])
+                if tags:
+                    parts.append(tags[0])
+                list_tags = tags
+            parts.append(self.block(block))
+        if list_tags:
+            parts.append(list_tags[1])
+        return join(*parts)
+
+    def children(self, block: dict) -> str:
+        if not block["has_children"]:
+            return ""
+        return self.blocks(block.get("children", []))
+
+    def block(self, block: dict) -> str:
+        block_type = block["type"]
+        if block_type in ["child_page", "child_database", "db_entry"]:
+            return self.child_page(block["id"])
+
+        self.files.extend(block_files(block[block_type]))
+        if block_type in block_html_map:
+            return block_html_map[block_type](self, block)
+        # The content of these kind of blocks is in the children
+        if block_type in ("column_list", "column"):
+            return self.children(block)
+        return join(f"<p>[{block_type} is not supported]</p>", self.children(block))
+
+    def child_page(self, page_id: str) -> str:
+        if page_id not in self.pages:
+            logging.warning(f"🤖 Page {page_id} is not found in the database.")
+            return ""
+        child = self.pages[page_id]
+        title = escape(child["title"])
+        if child["emoji"]:
+            title = f"{child['emoji']} {title}"
+        elif child["icon"]:
+            title = f'<span class="miniicon"> <img src="{html.escape(child["icon"])}"></span> {title}'
+        return f'<p><a href="{html.escape(child["url"])}">{title}</a></p>'
+
+    def synced_block(self, block: dict) -> str:
+        """Renders children of a synced block once for all pages showing it."""
+        key = synced_source(block)
+        if key not in self.synced_cache:
+            n_files, n_headings = len(self.files), len(self.headings)
+            content = self.children(block)
+            self.synced_cache[key] = (content, self.files[n_files:], self.headings[n_headings:])
+        else:
+            content, files, headings = self.synced_cache[key]
+            self.files.extend(files)
+            self.headings.extend(headings)
+        return content
+
+    def finish(self, content: str) -> str:
+        """Fills in heading IDs, the table of contents and the mermaid script."""
+        used: set = set()
+        tokens: list = [
+            {"level": level, "id": unique(slugify(text, "-"), used), "name": escape(text)}
+            for level, text in self.headings
+        ]
+        parts = content.split(HEADING_ID)
+        content = parts[0] + "".join(token["id"] + part for token, part in zip(tokens, parts[1:]))
+        if TABLE_OF_CONTENTS in content:
+            toc = join('<div class="toc">', toc_list(nest_toc_tokens(tokens)), "</div>")
+            content = content.replace(TABLE_OF_CONTENTS, toc)
+        if '<pre class="mermaid">' in content:
+            content = join(content, MERMAID_SCRIPT)
+        return content
+
+
+def toc_list(tokens: list) -> str:
+    items = []
+    for token in tokens:
+        children = toc_list(token["children"]) if token["children"] else ""
+        items.append(f'<li><a href="#{token["id"]}">{token["name"]}</a>{children}</li>')
+    return join("<ul>", *items, "</ul>")
+
+
+def paragraph(page: PageRenderer, block: dict) -> str:
+    payload = block["paragraph"]
+    # Blank line
+    if not block["has_children"] and not payload["rich_text"]:
+        return "<p><br/></p>"
+    text = richtext_html(payload["rich_text"])
+    return join(f"<p>{text}</p>" if text else "", page.children(block))
+
+
+def heading(page: PageRenderer, block: dict, level: int) -> str:
+    payload = block[block["type"]]
+    text = richtext_html(payload["rich_text"])
+    if payload.get("is_toggleable"):
+        # As in the markdown, headings in the summary of details get no ID and are not in the table of contents
+        return join("<details>", f"<summary><h{level}>{text}</h{level}></summary>", page.children(block), "</details>")
+    # Added before the children to keep the order of headings
+    page.headings.append((level, plain_text(payload["rich_text"])))
+    return join(f'<h{level} id="{HEADING_ID}">{text}</h{level}>', page.children(block))
+
+
+def callout(page: PageRenderer, block: dict) -> str:
+    payload = block["callout"]
+    icon = (payload.get("icon") or {}).get("emoji", "")
+    text = richtext_html(payload["rich_text"])
+    return join(f"<p>{' '.join(part for part in (icon, text) if part)}</p>", page.children(block))
+
+
+def quote(page: PageRenderer, block: dict) -> str:
+    text = richtext_html(block["quote"]["rich_text"])
+    return join("<blockquote>", f"<p>{text}</p>", page.children(block), "</blockquote>")
+
+
+def list_item_html(page: PageRenderer, block: dict, opening: str, text: str) -> str:
+    children = page.children(block)
+    if not children:
+        return f"{opening}{text}</li>"
+    # Items with only nested lists stay tight, others get paragraphs
+    if all(child["type"] in LIST_TAGS for child in block.get("children", [])):
+        return join(f"{opening}{text}{children}", "</li>")
+    return join(opening, f"<p>{text}</p>", children, "</li>")
+
+
+def list_item(page: PageRenderer, block: dict) -> str:
+    return list_item_html(page, block, "<li>", richtext_html(block[block["type"]]["rich_text"]))
+
+
+def to_do(page: PageRenderer, block: dict) -> str:
+    payload = block["to_do"]
+    checkbox = '<input type="checkbox" checked/>' if payload["checked"] else '<input type="checkbox"/>'
+    text = f"{checkbox} {richtext_html(payload['rich_text'])}"
+    return list_item_html(page, block, '<li class="task-list-item">', text)
+
+
+def highlight_code(source: str, language: str) -> str:
+    try:
+        lexer = get_lexer_by_name(language)
+    except ClassNotFound:
+        lexer = TextLexer()
+    return highlight(source, lexer, CODE_FORMATTER).rstrip("\n")
+
+
+def code(page: PageRenderer, block: dict) -> str:
+    payload = block["code"]
+    source = plain_text(payload["rich_text"])
+    language = payload["language"].replace(" ", "_")
+    if language == "mermaid":
+        content = f'<pre class="mermaid">\n{escape(source)}\n</pre>'
+    else:
+        content = highlight_code(source, language)
+    caption = richtext_html(payload.get("caption", []))
+    return join(f"<figcaption>{caption}</figcaption>" if caption else "", content, page.children(block))
+
+
+def iframe(url: str) -> str:
+    # Wrapped in a paragraph as by markdown_parser, browsers add the same empty paragraphs around it
+    return f"""<p><div class="res_emb_block">
+<iframe width="640" height="480" src="{html.escape(url)}" frameborder="0" allowfullscreen></iframe>
+</div></p>"""
+
+
+def embed(page: PageRenderer, block: dict) -> str:
+    return join(iframe(block["embed"]["url"]), page.children(block))
+
+
+def video(page: PageRenderer, block: dict) -> str:
+    url = file_url(block["video"])
+    clean_url = urljoin(url, urlparse(url).path)
+    if clean_url.endswith(".webm") or clean_url.endswith(".mp4"):
+        content = f'<p><video playsinline autoplay muted loop controls src="{html.escape(url)}"></video></p>'
+    else:
+        content = iframe(url.replace("http://", "https://"))
+    return join(content, page.children(block))
+
+
+# Bookmarks are shown as images, the same as by markdown_parser
+def image(page: PageRenderer, block: dict) -> str:
+    payload = block[block["type"]]
+    caption = payload.get("caption", [])
+    src = html.escape(file_url(payload))
+    if caption:
+        # The markup of markdown-captions
+        content = f'<p><figure><img src="{src}" /><figcaption>{richtext_html(caption)}</figcaption></figure></p>'
+    else:
+        content = f'<p><img alt="" src="{src}" /></p>'
+    return join(content, page.children(block))
+
+
+def file(page: PageRenderer, block: dict) -> str:
+    url = file_url(block["file"])
+    clean_url = urljoin(url, urlparse(url).path)
+    name = escape(unquote(Path(clean_url).name))
+    return join(f'<p><a href="{html.escape(url)}">📎 {name}</a></p>', page.children(block))
+
+
+def equation(page: PageRenderer, block: dict) -> str:
+    return join(f"<p>$$ {escape(block['equation']['expression'])} $$</p>", page.children(block))
+
+
+def divider(page: PageRenderer, block: dict) -> str:
+    return join("<hr />", page.children(block))
+
+
+def table_row(row: dict, header: bool, row_header: bool) -> str:
+    cells = []
+    for index, cell in enumerate(row["table_row"]["cells"]):
+        tag = "th" if header or (row_header and index == 0) else "td"
+        cells.append(f"<{tag}>{richtext_html(cell)}</{tag}>")
+    return join("<tr>", *cells, "</tr>")
+
+
+def table(page: PageRenderer, block: dict) -> str:
+    payload = block["table"]
+    rows = block.get("children", []) if block["has_children"] else []
+    row_header = payload.get("has_row_header", False)
+    parts = ["<table>"]
+    if rows and payload.get("has_column_header", True):
+        parts += ["<thead>", table_row(rows[0], True, row_header), "</thead>"]
+        rows = rows[1:]
+    parts += ["<tbody>", *(table_row(row, False, row_header) for row in rows), "</tbody>", "</table>"]
+    return join(*parts)
+
+
+def table_of_contents(page: PageRenderer, block: dict) -> str:
+    return join(TABLE_OF_CONTENTS, page.children(block))
+
+
+def synced_block(page: PageRenderer, block: dict) -> str:
+    return page.synced_block(block)
+
+
+block_html_map = {
+    "paragraph": paragraph,
+    "heading_1": partial(heading, level=1),
+    "heading_2": partial(heading, level=2),
+    "heading_3": partial(heading, level=3),
+    "callout": callout,
+    "toggle": list_item,
+    "quote": quote,
+    "bulleted_list_item": list_item,
+    "numbered_list_item": list_item,
+    "to_do": to_do,
+    "code": code,
+    "embed": embed,
+    "image": image,
+    "bookmark": image,
+    "equation": equation,
+    "divider": divider,
+    "file": file,
+    "table": table,
+    "video": video,
+    "table_of_contents": table_of_contents,
+    "synced_block": synced_block,
+}
+
+
+# Mentions
+def mention_link(content: str, url: str) -> str:
+    if "https://github.com/" in url:
+        repo = escape(Path(url).name)
+        return f'<a href="{html.escape(url)}" target="_blank"> <i class="fa fa-lg fa-github"> </i> {repo} </a>'
+    return f'<a href="{html.escape(url)}">{escape(content)}</a>'
+
+
+def mention_html(richtext: dict) -> str:
+    mention_type = richtext["mention"]["type"]
+    information = mention_information(richtext)
+    if mention_type in ("user", "date"):
+        return f"({escape(information['content'])})"
+    if mention_type in ("page", "database", "link_preview"):
+        if "url" not in information:
+            return escape(information["content"])
+        return mention_link(information["content"], information["url"])
+    return ""
+
+
+# Annotations, in the order markdown_parser applies them
+annotation_tags = {
+    "bold": "strong",
+    "italic": "em",
+    "strikethrough": "del",
+    "underline": "u",
+    "code": "code",
+}
+
+
+def richtext_word_html(richtext: dict) -> str:
+    if richtext["type"] == "equation":
+        return f"$ {escape(richtext['plain_text'])} $"
+    if richtext["type"] == "mention":
+        return mention_html(richtext)
+
+    word = escape(richtext["plain_text"])
+    if richtext.get("href"):
+        word = f'<a href="{html.escape(richtext["href"])}">{word}</a>'
+    annotations = richtext["annotations"]
+    for key, tag in annotation_tags.items():
+        if annotations[key]:
+            word = f"<{tag}>{word}</{tag}>"
+    if annotations["color"] != "default":
+        word = f"<span style='color:{annotations['color']}'>{word}</span>"
+    return word
+
+
+def richtext_html(richtext_list: list) -> str:
+    return "".join(richtext_word_html(richtext) for richtext in richtext_list)
+
+
+def parse_html(raw_notion: dict, structured_notion: dict, collect_files: bool = True):
+    """Renders blocks of every page to structured_notion["pages"][page_id]["html_content"].
+
+    Files of the blocks are added to the files of the page unless
+    'collect_files' is False, when markdown_parser.parse_markdown has added
+    the same files already.
+    """
+    synced_cache = {}
+    for page_id, page in raw_notion.items():
+        renderer = PageRenderer(structured_notion, synced_cache)
+        structured_notion["pages"][page_id]["html_content"] = renderer.render(page["blocks"])
+        if collect_files:
+            structured_notion["pages"][page_id]["files"].extend(renderer.files)
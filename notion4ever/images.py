@@ -0,0 +1,185 @@
+from notion4ever import assets
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import tempfile
+
+from PIL import Image
+from PIL import ImageOps
+
+# Directory of the resized images which pages show, inside the output directory
+IMAGES_DIR = "_images"
+
+# Directory of all resized images and their index, inside the cache directory
+CACHE_DIR = "images"
+
+# Resized images, animated GIFs and vector images are served as they are
+RASTER_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff"}
+
+# Pillow format and file suffix of the variants
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+# Width of images in page content of the default templates, see $content-width in _sass/main.scss
+CONTENT_SIZES = "(max-width: 800px) 100vw, 800px"
+
+IMG_SRC = re.compile(r'<img\b([^>]*?)\ssrc="([^"]*)"')
+
+
+def make_variants(source: str, digest: str, directory: str, settings: dict) -> dict:
+    """Saves resized variants of one image into 'directory', runs in a worker process.
+
+    Only widths smaller than the image are made, the original stays the
+    largest candidate.
+
+    Returns:
+        {"width": ..., "height": ..., "settings": settings, "variants": {width: filename}}
+    """
+    image_format, suffix = FORMATS[settings["format"]]
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+        if has_alpha and image_format == "JPEG":
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+
+        variants = {}
+        for variant_width in sorted(settings["widths"]):
+            if variant_width >= width:
+                break
+            filename = f"{digest}-{variant_width}{suffix}"
+            path = Path(directory) / filename
+            if not path.exists():
+                variant_height = max(1, round(height * variant_width / width))
+                resized = image.resize((variant_width, variant_height), Image.Resampling.LANCZOS)
+                fd, tmp_name = tempfile.mkstemp(dir=directory, prefix=f".{filename}.")
+                with os.fdopen(fd, "wb") as f:
+                    resized.save(f, image_format, quality=settings["quality"])
+                os.replace(tmp_name, path)
+            variants[str(variant_width)] = filename
+    return {"width": width, "height": height, "settings": settings, "variants": variants}
+
+
+def file_digest(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def optimize_images(structured_notion: dict, config: dict):
+    """Generates resized variants of downloaded images for responsive pages.
+
+    Variants of every downloaded raster image are made in a process pool
+    and cached in --cache_dir by the sha256 of the image, so unchanged
+    images are not resized again by later builds. Only the variants shown
+    by pages are linked into the site. The result is saved in
+    structured_notion["images"] as site URL of the image -> {"width",
+    "height", "srcset"}, which templates and responsive_html() turn into
+    img attributes.
+    """
+    structured_notion["images"] = {}
+    output_dir = Path(config["output_dir"])
+    published = output_dir / IMAGES_DIR
+    # Without a cache directory the variants are made straight in the site and not indexed
+    directory = config["cache_dir"] / CACHE_DIR if config["cache_dir"] else published
+    directory.mkdir(parents=True, exist_ok=True)
+    index_file = directory / "index.json"
+    index = {}
+    if config["cache_dir"] and index_file.exists():
+        with open(index_file, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    settings = {
+        "widths": sorted(config["image_widths"]),
+        "format": config["image_format"],
+        "quality": config["image_quality"],
+    }
+
+    # Site URL -> sha256 of the downloaded image
+    digests = {}
+    for page in structured_notion["pages"].values():
+        for url in page["files"]:
+            if url in digests or not url.startswith("/") or Path(url).suffix.lower() not in RASTER_SUFFIXES:
+                continue
+            source = output_dir / url.lstrip("/")
+            if source.exists():
+                digests[url] = file_digest(source)
+
+    outdated = {}
+    for url, digest in digests.items():
+        entry = index.get(digest)
+        if (
+            entry is None
+            or entry["settings"] != settings
+            or not all((directory / filename).exists() for filename in entry["variants"].values())
+        ):
+            outdated.setdefault(digest, output_dir / url.lstrip("/"))
+    if outdated:
+        with ProcessPoolExecutor(max_workers=config["image_workers"]) as executor:
+            futures = {
+                digest: executor.submit(make_variants, str(source), digest, str(directory), settings)
+                for digest, source in outdated.items()
+            }
+            for digest, future in futures.items():
+                try:
+                    index[digest] = future.result()
+                except (OSError, ValueError, Image.DecompressionBombError) as e:
+                    index.pop(digest, None)
+                    logging.warning(f"🤖 Cannot resize {outdated[digest].name}: {e}")
+        if config["cache_dir"]:
+            with open(index_file, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=1, sort_keys=True)
+
+    shown = set()
+    for url, digest in digests.items():
+        if digest not in index:
+            continue
+        entry = index[digest]
+        shown.update(entry["variants"].values())
+        candidates = [f"/{IMAGES_DIR}/{filename} {width}w" for width, filename in entry["variants"].items()]
+        candidates.append(f"{quote(url)} {entry['width']}w")
+        structured_notion["images"][url] = {
+            "width": entry["width"],
+            "height": entry["height"],
+            "srcset": ", ".join(candidates),
+        }
+    publish_variants(directory, published, shown)
+    logging.info(f"🤖 Optimized {len(structured_notion['images'])} images, resized {len(outdated)} of them.")
+
+
+def publish_variants(directory: Path, published: Path, shown: set):
+    """Places the variants which pages show into the site and removes the other files there."""
+    published.mkdir(parents=True, exist_ok=True)
+    for path in published.iterdir():
+        if path.name not in shown and path.is_file():
+            path.unlink()
+    if directory != published:
+        for filename in shown:
+            assets.link_file(directory / filename, published / filename)
+
+
+def responsive_html(content: str, images: dict | None) -> str:
+    """Adds srcset, sizes, width, height and lazy loading to img tags of optimized images in page HTML."""
+    if not images:
+        return content
+
+    def attributes(match: re.Match) -> str:
+        image = images.get(html.unescape(match[2]))
+        if image is None or "srcset=" in match[1]:
+            return match[0]
+        return (
+            f'{match[0]} srcset="{html.escape(image["srcset"])}" sizes="{CONTENT_SIZES}" '
+            f'width="{image["width"]}" height="{image["height"]}" loading="lazy" decoding="async"'
+        )
+
+    return IMG_SRC.sub(attributes, content)
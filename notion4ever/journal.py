@@ -0,0 +1,207 @@
+from notion4ever.notion2json import normalize_id
+from notion4ever.notion2json import sort_pages
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+import json
+import logging
+import os
+import time
+
+
+class CrawlJournal:
+    """Append-only JSONL journal of a crawl.
+
+    Instead of rewriting the whole notion_content.json after every request,
+    each fetched piece of content is appended as one JSON record:
+        {"op": "start", "started_at": ...}
+            start time of the crawl in iso format,
+        {"op": "page", "page": {...}}
+            page or database header returned by pages/databases.retrieve,
+        {"op": "blocks", "id": ..., "results": [...], "next_cursor": ..., "parsed": ...}
+            one cursor page of blocks (or database entries) of a page, with
+            nested blocks already parsed if "parsed" is true,
+        {"op": "block", "id": ..., "index": ..., "block": {...}}
+            top-level block of a page with all its nested children,
+        {"op": "done", "id": ..., "removed": [...]}
+            the page and all its subpages are parsed, 'removed' are indices
+            of blocks pointing to deleted subpages,
+        {"op": "discard", "id": ...}
+            the page turned out to be outside of the crawled tree.
+    Records are flushed right away and fsynced every 'fsync_every' records or
+    'fsync_interval' seconds. Replaying the journal rebuilds both 'notion_json'
+    and the crawl progress, which lets the crawler resume without refetching.
+
+    Args:
+        filename (str): Name of the JSONL journal file.
+        notion_json (dict): Dictionary with raw Notion data, which is filled
+            from the journal when resuming.
+        resume (bool): Continue an existing journal instead of starting anew.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        notion_json: dict,
+        resume: bool = False,
+        fsync_every: int = 500,
+        fsync_interval: float = 5.0,
+    ):
+        self.filename = filename
+        self.notion_json = notion_json
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # page_id -> cursor of the next batch of blocks, None if all blocks are listed
+        self.cursors: dict = {}
+        # page_id -> indices of top-level blocks parsed with all nested blocks
+        self.parsed: dict = {}
+        self.done: set = set()
+        self.started_at = datetime.now(timezone.utc).isoformat()
+
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        if resume and Path(filename).exists():
+            replay(filename, notion_json, self)
+            logging.info(f"🤖 Resumed crawl of {len(notion_json)} pages from {filename}.")
+            self._file = open(filename, "a", encoding="utf-8")
+        else:
+            self._file = open(filename, "w", encoding="utf-8")
+            self.append({"op": "start", "started_at": self.started_at})
+
+    def __enter__(self) -> "CrawlJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    # Records
+    def page(self, page: dict):
+        self.append({"op": "page", "page": page})
+
+    def blocks(self, page_id: str, results: list, next_cursor: str | None, parsed: bool = False):
+        if parsed:
+            listed = len(self.notion_json[page_id]["blocks"]) - len(results)
+            self.parsed.setdefault(page_id, set()).update(range(listed, listed + len(results)))
+        self.cursors[page_id] = next_cursor
+        self.append({"op": "blocks", "id": page_id, "results": results, "next_cursor": next_cursor, "parsed": parsed})
+
+    def block(self, page_id: str, index: int, block: dict):
+        self.parsed.setdefault(page_id, set()).add(index)
+        self.append({"op": "block", "id": page_id, "index": index, "block": block})
+
+    def page_done(self, page_id: str, removed: list):
+        self.done.add(page_id)
+        self.append({"op": "done", "id": page_id, "removed": removed})
+
+    def discard(self, page_id: str):
+        self.notion_json.pop(page_id, None)
+        self.cursors.pop(page_id, None)
+        self.parsed.pop(page_id, None)
+        self.append({"op": "discard", "id": page_id})
+
+    # Progress
+    def retrieved_page(self, page_id: str) -> dict | None:
+        """Returns page already retrieved in this crawl or None."""
+        return self.notion_json.get(normalize_id(page_id))
+
+    def is_listed(self, page_id: str) -> bool:
+        return page_id in self.cursors and self.cursors[page_id] is None
+
+    def next_cursor(self, page_id: str) -> str | None:
+        """Returns cursor to continue listing blocks of the page or None to start over."""
+        return self.cursors.get(page_id)
+
+    def is_parsed(self, page_id: str, index: int) -> bool:
+        return index in self.parsed.get(page_id, ())
+
+    def is_done(self, page_id: str) -> bool:
+        return page_id in self.done
+
+
+def replay(filename: str, notion_json: dict, crawl_journal: CrawlJournal | None = None):
+    """Applies records of the journal 'filename' to 'notion_json'.
+
+    A truncated last record, left by a crash in the middle of a write, is
+    ignored. If 'crawl_journal' is given, its crawl progress is restored too.
+    """
+    with open(filename, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"🤖 Skipped broken record {line_number} of {filename}.")
+                continue
+
+            if record["op"] == "start":
+                if crawl_journal is not None:
+                    crawl_journal.started_at = record["started_at"]
+            elif record["op"] == "page":
+                page = record["page"]
+                notion_json[page["id"]] = page
+            elif record["op"] == "blocks":
+                blocks = notion_json[record["id"]].setdefault("blocks", [])
+                blocks.extend(record["results"])
+                if crawl_journal is not None:
+                    crawl_journal.cursors[record["id"]] = record["next_cursor"]
+                    if record.get("parsed"):
+                        listed = len(blocks) - len(record["results"])
+                        parsed = crawl_journal.parsed.setdefault(record["id"], set())
+                        parsed.update(range(listed, len(blocks)))
+            elif record["op"] == "block":
+                notion_json[record["id"]]["blocks"][record["index"]] = record["block"]
+                if crawl_journal is not None:
+                    crawl_journal.parsed.setdefault(record["id"], set()).add(record["index"])
+            elif record["op"] == "done":
+                for i_block in reversed(record["removed"]):
+                    notion_json[record["id"]]["blocks"].pop(i_block)
+                if crawl_journal is not None:
+                    crawl_journal.done.add(record["id"])
+            elif record["op"] == "discard":
+                notion_json.pop(record["id"], None)
+                if crawl_journal is not None:
+                    crawl_journal.cursors.pop(record["id"], None)
+                    crawl_journal.parsed.pop(record["id"], None)
+            else:
+                raise ValueError(f"Unknown journal record {record['op']}.")
+
+
+def compact(journal_filename: str, filename: str, remove_journal: bool = True) -> dict:
+    """Replays the journal and writes the final notion_content.json snapshot.
+
+    The snapshot is written to a temporary file first and renamed atomically,
+    so a crash never leaves a truncated notion_content.json behind.
+
+    Returns:
+        notion_json (dict): Dictionary with raw Notion data.
+    """
+    notion_json = {}
+    replay(journal_filename, notion_json)
+    notion_json = sort_pages(notion_json)
+
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "w", encoding="utf-8") as f:
+        json.dump(notion_json, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+    if remove_journal:
+        Path(journal_filename).unlink()
+    return notion_json
@@ -0,0 +1,140 @@
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# Fields of other pages shown on a page: in its path header, gallery cards and list rows
+LINKED_PAGE_FIELDS = ["title", "url", "icon", "emoji", "cover", "properties_md", "properties"]
+
+# Site-wide fields used by the page templates
+SITE_FIELDS = ["base_url", "build_locally", "include_footer", "include_search", "search_index", "archive_url"]
+
+
+def fingerprint(data) -> str:
+    """Returns sha256 of JSON serialized data, dates included."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def directory_fingerprint(directory: Path) -> str:
+    """Returns sha256 of names and contents of all files in the directory."""
+    sha256 = hashlib.sha256()
+    for path in sorted(Path(directory).rglob("*")):
+        if path.is_file():
+            sha256.update(path.relative_to(directory).as_posix().encode())
+            sha256.update(hashlib.sha256(path.read_bytes()).digest())
+    return sha256.hexdigest()
+
+
+def page_fingerprint(page_id: str, structured_notion: dict, shared: str) -> str:
+    """Returns the fingerprint of everything the rendered page depends on.
+
+    These are the structured data of the page, the shown fields of its
+    breadcrumb pages, of its children and of the root page, the optimized
+    images it shows and 'shared' for site-wide inputs like templates.
+    """
+    pages = structured_notion["pages"]
+    page = pages[page_id]
+
+    def linked(linked_id: str) -> dict:
+        return {field: pages[linked_id].get(field) for field in LINKED_PAGE_FIELDS}
+
+    images = structured_notion.get("images") or {}
+    shown = [*page["files"], page["cover"], *(pages[child_id]["cover"] for child_id in page["children"])]
+    return fingerprint(
+        {
+            "shared": shared,
+            "page": page,
+            "family_line": [linked(parent_id) for parent_id in page["family_line"]],
+            "children": [linked(child_id) for child_id in page["children"]],
+            "root": linked(structured_notion["root_page_id"]),
+            "images": {url: images[url] for url in shown if url in images},
+        }
+    )
+
+
+def site_fingerprint(structured_notion: dict, templates: str, renderer: str) -> str:
+    """Returns the fingerprint of inputs shared by all pages: site fields, templates and the page renderer."""
+    return fingerprint(
+        {
+            "site": {field: structured_notion.get(field) for field in SITE_FIELDS},
+            "templates": templates,
+            "renderer": renderer,
+        }
+    )
+
+
+class SiteManifest:
+    """Inputs and outputs of every page of the previous build of the site.
+
+    Each page is recorded with the fingerprint of its inputs and the files
+    rendered from it, so a later build renders only pages whose fingerprint
+    changed or whose files are missing, and deletes the files of pages which
+    are gone. The manifest belongs to one output directory; for any other
+    one the whole site is rendered.
+
+    Args:
+        filename (Path): JSON file of the manifest.
+        output_dir (Path): Output directory of the site.
+    """
+
+    def __init__(self, filename: Path, output_dir: Path):
+        self.filename = Path(filename)
+        self.output_dir = Path(output_dir)
+        self.previous: dict = {"pages": {}, "sass": None}
+        if self.filename.exists():
+            with open(self.filename, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["output_dir"] == str(self.output_dir):
+                self.previous = manifest
+        # page ID -> {"fingerprint": ..., "outputs": [paths relative to output_dir]}
+        self.pages: dict = {}
+        self.sass = None
+
+    def unchanged(self, page_id: str, page_fingerprint: str) -> bool:
+        """Checks that the page was rendered from the same inputs and its files still exist."""
+        entry = self.previous["pages"].get(page_id)
+        if entry is None or entry["fingerprint"] != page_fingerprint:
+            return False
+        return all((self.output_dir / output).exists() for output in entry["outputs"])
+
+    def keep(self, page_id: str):
+        """Records the unchanged page with its files from the previous build."""
+        self.pages[page_id] = self.previous["pages"][page_id]
+
+    def record(self, page_id: str, page_fingerprint: str, outputs: list):
+        self.pages[page_id] = {
+            "fingerprint": page_fingerprint,
+            "outputs": [Path(output).relative_to(self.output_dir).as_posix() for output in outputs],
+        }
+
+    def sass_unchanged(self, sass_fingerprint: str) -> bool:
+        self.sass = sass_fingerprint
+        return self.previous["sass"] == sass_fingerprint and (self.output_dir / "css").exists()
+
+    def remove_stale_outputs(self) -> int:
+        """Deletes files of pages which are not in the site anymore, returns their number."""
+        current = {output for entry in self.pages.values() for output in entry["outputs"]}
+        removed = 0
+        for page_id, entry in self.previous["pages"].items():
+            if page_id in self.pages:
+                continue
+            for output in entry["outputs"]:
+                path = self.output_dir / output
+                if output in current or not path.exists():
+                    continue
+                path.unlink()
+                removed += 1
+                # Folders of pages are removed once nothing else like downloaded files is left there
+                if path.parent != self.output_dir and not any(path.parent.iterdir()):
+                    path.parent.rmdir()
+        logging.debug(f"🤖 Removed {removed} files of deleted pages.")
+        return removed
+
+    def save(self):
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.filename.parent, prefix=f".{self.filename.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"output_dir": str(self.output_dir), "sass": self.sass, "pages": self.pages}, f, indent=1)
+        os.replace(tmp_name, self.filename)
@@ -1,11 +1,17 @@
 # Most of the code was taken from the Notion2md repository
 # https://github.com/echo724/notion2md/tree/main/notion2md
+import hashlib
+import json
+import os
 import re
+import tempfile
 from pathlib import Path
 from urllib.parse import urljoin
 from urllib.parse import urlparse
 from urllib.parse import unquote
 
+from notion4ever.notion2json import synced_source
+
 
 def paragraph(information: dict) -> str:
     return information["text"]
@@ -189,16 +195,6 @@ block_type_footer_map = {
 }
 
 
-def blocks_convertor(blocks: list, structured_notion, page_id) -> str:
-    results = []
-    for block in blocks:
-        block_md = block_convertor(block, 0, structured_notion, page_id)
-        results.append(block_md)
-
-    outcome_blocks = "".join([result for result in results])
-    return outcome_blocks
-
-
 def collect_block_info(payload: dict, structured_notion: dict, page_id) -> dict:
     information = dict()
     if "text" in payload:
@@ -241,17 +237,28 @@ def collect_block_info(payload: dict, structured_notion: dict, page_id) -> dict:
     return information
 
 
-def block_convertor(block: dict, depth=0, structured_notion={}, page_id="") -> str:
+def write_block(write, block: dict, depth=0, structured_notion={}, page_id="", synced_cache: dict | None = None):
+    """Writes markdown of a block with its children as chunks to 'write'.
+
+    Children are written straight after their parent, prefixed with the
+    tabs of their depth, so the markdown of a page is never concatenated
+    again on the way up. Only code blocks are collected to be indented.
+
+    'synced_cache' maps (original block ID, depth) of synced blocks to the
+    markdown of their children and the files found there, so the content of
+    a synced block shown on many pages is converted only once.
+    """
     block_type = block["type"]
     # Special Case: Block is blank
     if block_type == "paragraph" and not block["has_children"] and not block[block_type]["rich_text"]:
-        return blank() + "\n\n"
+        write(blank() + "\n\n")
+        return
 
     # Special Case: Block is a child page
     if block_type in ["child_page", "child_database", "db_entry"]:
         if block["id"] not in structured_notion["pages"]:
             print(f"Page {block['id']} is not found in the database.")
-            return ""
+            return
         title = structured_notion["pages"][block["id"]]["title"]
         url = structured_notion["pages"][block["id"]]["url"]
         outcome_block = f"{title}]({url})\n\n"
@@ -263,20 +270,23 @@ def block_convertor(block: dict, depth=0, structured_notion={}, page_id="") -> s
             outcome_block = f"""[<span class="miniicon"> <img src="{icon}"></span> {outcome_block}"""
         else:
             outcome_block = f"[{outcome_block}"
-        return outcome_block
+        write(outcome_block)
+        return
+
+    # Code blocks are indented as a whole once they are complete
+    code_chunks = []
+    output = code_chunks.append if block_type == "code" else write
 
     # Normal Cases
     information = collect_block_info(block[block_type], structured_notion, page_id)
     if block_type != "synced_block" and block_type in block_func_map:
         if block_type in ["embed", "video"]:
             block[block_type]["dont_download"] = True
-        outcome_block = block_func_map[block_type](information) + "\n\n"
+        output(block_func_map[block_type](information) + "\n\n")
     # Special Case: The content of these kind of blocks is in the children so that we can bypass this step.
     # And we will handle the children in the following steps.
-    elif block_type in ("synced_block", "column_list", "column", "table"):
-        outcome_block = ""
-    else:
-        outcome_block = f"[{block_type} is not supported]\n\n"
+    elif block_type not in ("synced_block", "column_list", "column", "table"):
+        output(f"[{block_type} is not supported]\n\n")
 
     # Process children
     if block["has_children"]:
@@ -290,10 +300,28 @@ def block_convertor(block: dict, depth=0, structured_notion={}, page_id="") -> s
                 table_list.append(block_func_map[cell_type](cell_info))
             # convert to markdown table
             for index, value in enumerate(table_list):
-                outcome_block += f"| {' | '.join(value)} |\n"
+                output(f"| {' | '.join(value)} |\n")
                 if index == 0:
-                    outcome_block += f"| {' | '.join(['---'] * len(value))} |\n"
-            outcome_block += "\n"
+                    output(f"| {' | '.join(['---'] * len(value))} |\n")
+            output("\n")
+        elif block_type == "synced_block" and synced_cache is not None:
+            key = (synced_source(block), depth)
+            files = structured_notion["pages"][page_id]["files"]
+            if key not in synced_cache:
+                n_files = len(files)
+                synced_chunks = []
+                synced_depth = depth
+                for child_block in block["children"]:
+                    if child_block["type"] == "heading_1":
+                        synced_depth = 0
+                    synced_chunks.append("\t" * synced_depth)
+                    write_block(
+                        synced_chunks.append, child_block, synced_depth, structured_notion, page_id, synced_cache
+                    )
+                synced_cache[key] = ("".join(synced_chunks), files[n_files:])
+            else:
+                files.extend(synced_cache[key][1])
+            output(synced_cache[key][0])
         else:
             if block["type"] not in (
                 "heading_1",
@@ -311,19 +339,30 @@ def block_convertor(block: dict, depth=0, structured_notion={}, page_id="") -> s
                 # child block for it, which is strange.
                 if block["type"] == "heading_1":
                     depth = 0
-                block_md = block_convertor(block, depth, structured_notion, page_id)
-                outcome_block += "\t" * depth + block_md
+                output("\t" * depth)
+                write_block(output, block, depth, structured_notion, page_id, synced_cache)
 
     # Post-processing
     if block_type == "code":
-        outcome_block = outcome_block.rstrip("\n").replace("\n", "\n" + "\t" * depth)
-        outcome_block += "\n\n"
+        write("".join(code_chunks).rstrip("\n").replace("\n", "\n" + "\t" * depth) + "\n\n")
     elif block_type in block_type_footer_map:
         footer = block_type_footer_map[block_type](information)
         if footer:
-            outcome_block += footer + "\n\n"
+            write(footer + "\n\n")
+
 
-    return outcome_block
+def block_convertor(block: dict, depth=0, structured_notion={}, page_id="", synced_cache: dict | None = None) -> str:
+    """Converts a block with its children to markdown."""
+    chunks = []
+    write_block(chunks.append, block, depth, structured_notion, page_id, synced_cache)
+    return "".join(chunks)
+
+
+def blocks_convertor(blocks: list, structured_notion, page_id, synced_cache: dict | None = None) -> str:
+    chunks = []
+    for block in blocks:
+        write_block(chunks.append, block, 0, structured_notion, page_id, synced_cache)
+    return "".join(chunks)
 
 
 # Link
@@ -464,36 +503,225 @@ def richtext_convertor(richtext_list: list, title_mode=False) -> str:
     return outcome_sentence
 
 
-def grouping(page_md: str) -> str:
-    page_md_fixed = []
-    prev_line_type = ""
-    for line in page_md.splitlines():
+# Characters ending lines for str.splitlines()
+LINE_BREAKS = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+
+class MarkdownWriter:
+    """Collects markdown chunks of a page into one buffer, grouping lists on the way.
+
+    Chunks are split into lines as by str.splitlines(). Lines of a list
+    (bullets, numbers or checkboxes) are kept together without blank lines
+    and separated by a blank line from other content. Every three newlines
+    in a row are shortened to two, as a replace() over the whole page did.
+    So the page is written in one pass, linear in its length.
+    """
+
+    def __init__(self):
+        self.parts: list = []
+        # Parts of the current line, which is not complete yet
+        self.line: list = []
+        # The last line ended with a carriage return, a line feed right after it is the same line break
+        self.after_cr = False
+        self.prev_line_type = ""
+        self.started = False
+        # Newlines not written yet
+        self.newlines = 0
+
+    def write(self, chunk: str):
+        if not chunk:
+            return
+        if self.after_cr and chunk[0] == "\n":
+            chunk = chunk[1:]
+        self.after_cr = False
+        for piece in chunk.splitlines(keepends=True):
+            end = piece[-1]
+            self.after_cr = end == "\r"
+            if end not in LINE_BREAKS:
+                self.line.append(piece)
+                continue
+            content = piece[:-2] if end == "\n" and piece.endswith("\r\n") else piece[:-1]
+            self.add_line("".join(self.line) + content if self.line else content)
+            self.line = []
+
+    def add_line(self, line: str):
         line_type = ""
-        norm_line = line.lstrip("\t").lstrip()
-        if norm_line.startswith("- [ ]") or norm_line.startswith("- [x]"):
+        norm_line = line.lstrip()
+        if norm_line.startswith(("- [ ]", "- [x]")):
             line_type = "checkbox"
         elif norm_line.startswith("* "):
             line_type = "bullet"
         elif norm_line.startswith("1. "):
             line_type = "numbered"
 
-        if prev_line_type != "":
+        if self.prev_line_type != "":
             if line == "":
-                continue
+                return
+
+        if line_type != self.prev_line_type:
+            self.emit("")
+
+        self.emit(line)
+        self.prev_line_type = line_type
+
+    def emit(self, line: str):
+        if self.started:
+            self.newlines += 1
+        self.started = True
+        if line:
+            self.flush_newlines()
+            self.parts.append(line)
+
+    def flush_newlines(self):
+        if self.newlines:
+            self.parts.append("\n" * (self.newlines // 3 * 2 + self.newlines % 3))
+            self.newlines = 0
+
+    def getvalue(self) -> str:
+        if self.line:
+            self.add_line("".join(self.line))
+            self.line = []
+        self.flush_newlines()
+        return "".join(self.parts)
+
+
+# Blocks which link other pages, their markdown shows the title, URL and icon of the page
+PAGE_LINK_BLOCKS = ["child_page", "child_database", "db_entry"]
+
+
+def block_signature(block: dict, structured_notion: dict, parts: list):
+    """Appends everything the markdown of the block and its children depends on to 'parts'.
 
-        if line_type != prev_line_type:
-            page_md_fixed.append("")
+    These are IDs, types and payloads of the blocks, and the title, URL and
+    icon of the linked pages. The payload is used rather than
+    last_edited_time, which Notion rounds to the minute, and it also holds
+    signed file URLs and mentions which change without an edit of the block.
+    """
+    block_type = block["type"]
+    parts.append(block["id"])
+    parts.append(block_type)
+    if block_type in PAGE_LINK_BLOCKS:
+        page = structured_notion["pages"].get(block["id"])
+        fields = [page["title"], page["url"], page["emoji"], page["icon"]] if page else None
+        parts.append(json.dumps(fields, ensure_ascii=False))
+        return
+
+    # Equal payloads read from JSON have equal repr(), which is faster than dumping them again
+    parts.append(repr(block[block_type]))
+    if block["has_children"]:
+        parts.append("(")
+        for child_block in block["children"]:
+            block_signature(child_block, structured_notion, parts)
+        parts.append(")")
+
+
+class BlockCache:
+    """Markdown of top-level blocks converted by previous runs, kept in a JSON file.
 
-        page_md_fixed.append(line)
-        prev_line_type = line_type
-    return "\n".join(page_md_fixed)
+    Every top-level block of a page is looked up by the hash of its
+    signature, see block_signature(), and converted with its children only
+    when it is not found. An entry holds the markdown and the files found
+    in the block. The grouped markdown of a page is kept as well, for the
+    same sequence of blocks. The cache is dropped when this module changes,
+    and entries not used by a run are not saved again.
+
+    Args:
+        filename (Path): JSON file of the cache.
+    """
+
+    def __init__(self, filename: Path):
+        self.filename = Path(filename)
+        self.version = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+        self.previous: dict = {"blocks": {}, "pages": {}}
+        if self.filename.exists():
+            with open(self.filename, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache["version"] == self.version:
+                self.previous = cache
+        # Signature hash -> [markdown, files]
+        self.blocks: dict = {}
+        # Hash of signatures of the blocks of a page -> markdown of the page
+        self.pages: dict = {}
+        self.converted = 0
+        self.cached = 0
+
+    def key(self, block: dict, structured_notion: dict) -> str:
+        parts = []
+        block_signature(block, structured_notion, parts)
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> list | None:
+        entry = self.blocks.get(key) or self.previous["blocks"].get(key)
+        if entry is not None:
+            self.blocks[key] = entry
+            self.cached += 1
+        return entry
+
+    def put(self, key: str, block_md: str, files: list) -> list:
+        self.blocks[key] = [block_md, files]
+        self.converted += 1
+        return self.blocks[key]
+
+    def page_markdown(self, keys: list, chunks: list) -> str:
+        """Returns the markdown of a page made of the blocks, grouped once for the same blocks."""
+        key = hashlib.sha256("\0".join(keys).encode("utf-8")).hexdigest()
+        page_md = self.pages.get(key) or self.previous["pages"].get(key)
+        if page_md is None:
+            writer = MarkdownWriter()
+            for chunk in chunks:
+                writer.write(chunk)
+            page_md = writer.getvalue()
+        self.pages[key] = page_md
+        return page_md
+
+    def export(self) -> dict:
+        """Returns and forgets the entries used so far with the counts, see update()."""
+        used = {"blocks": self.blocks, "pages": self.pages, "converted": self.converted, "cached": self.cached}
+        self.blocks, self.pages, self.converted, self.cached = {}, {}, 0, 0
+        return used
+
+    def update(self, used: dict):
+        """Adds the entries used by the cache of a worker process."""
+        self.blocks.update(used["blocks"])
+        self.pages.update(used["pages"])
+        self.converted += used["converted"]
+        self.cached += used["cached"]
+
+    def save(self):
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.filename.parent, prefix=f".{self.filename.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "blocks": self.blocks, "pages": self.pages}, f, ensure_ascii=False)
+        os.replace(tmp_name, self.filename)
+
+
+def convert_page(blocks: list, structured_notion: dict, page_id: str, synced_cache: dict, block_cache=None) -> str:
+    """Returns the markdown of the top-level blocks of a page, appending its files to the page."""
+    if block_cache is None:
+        writer = MarkdownWriter()
+        for block in blocks:
+            write_block(writer.write, block, 0, structured_notion, page_id, synced_cache)
+        return writer.getvalue()
+
+    files = structured_notion["pages"][page_id]["files"]
+    keys, chunks = [], []
+    for block in blocks:
+        key = block_cache.key(block, structured_notion)
+        entry = block_cache.get(key)
+        if entry is None:
+            n_files = len(files)
+            block_md = block_convertor(block, 0, structured_notion, page_id, synced_cache)
+            entry = block_cache.put(key, block_md, files[n_files:])
+        else:
+            files.extend(entry[1])
+        keys.append(key)
+        chunks.append(entry[0])
+    return block_cache.page_markdown(keys, chunks)
 
 
-def parse_markdown(raw_notion: dict, structured_notion: dict):
+def parse_markdown(raw_notion: dict, structured_notion: dict, block_cache: BlockCache | None = None):
+    synced_cache = {}
     for page_id, page in raw_notion.items():
-        structured_notion["pages"][page_id]["md_content"] = ""
-        page_md = blocks_convertor(raw_notion[page_id]["blocks"], structured_notion, page_id)
-        page_md = grouping(page_md)
-        page_md = page_md.replace("\n\n\n", "\n\n")
-        # page_md = code_aligner(page_md)
-        structured_notion["pages"][page_id]["md_content"] = page_md
+        structured_notion["pages"][page_id]["md_content"] = convert_page(
+            page["blocks"], structured_notion, page_id, synced_cache, block_cache
+        )
@@ -1,16 +1,336 @@
 from notion_client import APIResponseError
 import notion_client
-import json
+from datetime import datetime
+from datetime import timedelta
+from typing import TYPE_CHECKING
 import logging
+import uuid
 
+if TYPE_CHECKING:
+    from notion4ever.assets import AssetPrefetcher
+    from notion4ever.frontier import Frontier
+    from notion4ever.journal import CrawlJournal
 
-def update_notion_file(filename: str, notion_json: dict):
-    """Writes notion_json dictionary to a json file."""
-    with open(filename, "w+", encoding="utf-8") as f:
-        json.dump(notion_json, f, ensure_ascii=False, indent=4)
 
+# Blocks with a file, which is downloaded for the site
+FILE_BLOCKS = ["image", "video", "file", "pdf", "audio"]
 
-def block_parser(block: dict, notion: "notion_client.client.Client") -> dict:
+
+def normalize_id(page_id: str) -> str:
+    """Returns page_id in the dashed form used by Notion API responses."""
+    try:
+        return str(uuid.UUID(page_id))
+    except ValueError:
+        return page_id
+
+
+def subpage_ids(page: dict) -> list:
+    """Returns IDs of subpages and database entries listed in page blocks."""
+    ids = []
+    for block in page.get("blocks", []):
+        if page["object"] == "database":
+            if block["object"] in ["page", "child_page", "child_database"]:
+                ids.append(block["id"])
+        elif block["type"] in ["page", "child_page", "child_database"]:
+            ids.append(block["id"])
+    return ids
+
+
+def sort_pages(notion_json: dict) -> dict:
+    """Orders pages the way the depth-first notion_page_parser inserts them.
+
+    The first page of 'notion_json' is treated as the root. The order matters,
+    because structuring.parse_headers derives the order of children from it.
+    Pages which are not reachable from the root keep their relative order at
+    the end.
+    """
+    if not notion_json:
+        return {}
+
+    ordered_json = {}
+    stack = [next(iter(notion_json))]
+    while stack:
+        page_id = stack.pop()
+        if page_id in ordered_json or page_id not in notion_json:
+            continue
+        ordered_json[page_id] = notion_json[page_id]
+        stack.extend(reversed(subpage_ids(notion_json[page_id])))
+
+    for page_id, page in notion_json.items():
+        if page_id not in ordered_json:
+            ordered_json[page_id] = page
+    return ordered_json
+
+
+class CrawlState:
+    """State shared by all parsers of one crawl.
+
+    Args:
+        journal (CrawlJournal): Append-only journal of the crawl. Its
+            'notion_json' is the dictionary with raw Notion data being filled.
+        previous (dict): Raw Notion data of the previous crawl. Pages which
+            are not edited since then are copied from it instead of refetched.
+        since (str): Start time of the previous crawl in iso format. Notion
+            rounds last_edited_time to minutes, so pages edited within the
+            minute before it are refetched anyway.
+        prefetcher (AssetPrefetcher): Downloads files of fetched pages while
+            their signed URLs are valid, or None.
+    """
+
+    def __init__(
+        self,
+        journal: "CrawlJournal",
+        previous: dict | None = None,
+        since: str | None = None,
+        prefetcher: "AssetPrefetcher | None" = None,
+    ):
+        self.journal = journal
+        self.prefetcher = prefetcher
+        self.notion_json = journal.notion_json
+        self.previous = previous or {}
+        self.since = datetime.fromisoformat(since) if since else None
+        self.reused_pages = 0
+        self.reused_blocks = 0
+        self.fetched_blocks = 0
+        # source synced block ID -> its parsed children (or a task listing them in the asyncio crawler)
+        self.synced_blocks: dict = {}
+
+    def prefetch(self, page: dict):
+        """Queues the files of the fetched page for download."""
+        if self.prefetcher is not None:
+            for url in file_urls(page):
+                self.prefetcher.submit(url)
+
+    @property
+    def incremental(self) -> bool:
+        return bool(self.previous)
+
+    def edited_before(self, last_edited_time: str) -> bool:
+        """Checks that the edit happened before the previous crawl started."""
+        if self.since is None:
+            return True
+        edited = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00"))
+        return edited + timedelta(minutes=1) <= self.since
+
+    def unchanged_page(self, page: dict) -> dict | None:
+        """Returns the previous version of the page if it has not been edited since."""
+        previous_page = self.previous.get(page["id"])
+        if previous_page is None or "blocks" not in previous_page:
+            return None
+        if previous_page["last_edited_time"] != page["last_edited_time"]:
+            return None
+        if not self.edited_before(page["last_edited_time"]):
+            return None
+        return previous_page
+
+    def database_delta(self, page: dict) -> dict | None:
+        """Returns databases.query filter for entries edited since the previous crawl.
+
+        None means that the database has to be listed in full: it is not a
+        database, it is new, or the time of the previous crawl is unknown.
+        """
+        if page["object"] != "database" or self.since is None:
+            return None
+        if "blocks" not in self.previous.get(page["id"], {}):
+            return None
+        # last_edited_time is rounded to minutes
+        on_or_after = (self.since - timedelta(minutes=1)).isoformat()
+        return {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": on_or_after}}
+
+    def block_reuse(self, page: dict) -> "BlockReuse | None":
+        """Returns cache of nested blocks of the previous version of the page."""
+        if page["object"] != "page" or page["id"] not in self.previous:
+            return None
+        return BlockReuse(self.previous[page["id"]], self)
+
+    def report_reuse(self, page_id: str, reuse: "BlockReuse | None"):
+        if reuse is None or reuse.reused + reuse.fetched == 0:
+            return
+        self.reused_blocks += reuse.reused
+        self.fetched_blocks += reuse.fetched
+        logging.debug(
+            f"🤖 Reused {reuse.ratio:.0%} ({reuse.reused}/{reuse.reused + reuse.fetched}) "
+            f"of nested blocks of {page_id}."
+        )
+
+
+class BlockReuse:
+    """Nested blocks of the previous version of a page, indexed by block id.
+
+    A block which has the same last_edited_time as before reuses its whole
+    'children' subtree from the previous crawl instead of listing it again.
+    This relies on Notion updating last_edited_time of a block when its
+    nested content changes.
+    """
+
+    def __init__(self, previous_page: dict, state: CrawlState):
+        self.state = state
+        self.blocks = {}
+        stack = list(previous_page.get("blocks", []))
+        while stack:
+            block = stack.pop()
+            if "children" in block:
+                self.blocks[block["id"]] = block
+                stack.extend(block["children"])
+        self.reused = 0
+        self.fetched = 0
+
+    @property
+    def ratio(self) -> float:
+        total = self.reused + self.fetched
+        return self.reused / total if total else 0.0
+
+    def children(self, block: dict) -> list | None:
+        """Returns previous children of an unchanged block or None if they must be fetched."""
+        previous_block = self.blocks.get(block["id"])
+        if (
+            previous_block is not None
+            and previous_block.get("last_edited_time") == block.get("last_edited_time")
+            and self.state.edited_before(block["last_edited_time"])
+        ):
+            self.reused += 1
+            return previous_block["children"]
+        self.fetched += 1
+        return None
+
+
+def file_urls(obj: dict) -> list:
+    """Returns URLs of files downloaded for the site from a page, a block or their children.
+
+    These are covers, icons, files properties of database entries and the
+    files of image, video, file, pdf and audio blocks.
+    """
+    urls = []
+    for asset in ("cover", "icon"):
+        value = obj.get(asset)
+        if isinstance(value, dict) and value.get("type") in ("file", "external"):
+            urls.append(value[value["type"]]["url"])
+    for property in obj.get("properties", {}).values():
+        if property.get("type") == "files" and isinstance(property["files"], list):
+            urls.extend(file["file"]["url"] for file in property["files"] if "file" in file)
+    block_type = obj.get("type")
+    if block_type in FILE_BLOCKS and obj[block_type].get("type") in ("file", "external"):
+        urls.append(obj[block_type][obj[block_type]["type"]]["url"])
+    for child in obj.get("blocks", []) + obj.get("children", []):
+        urls.extend(file_urls(child))
+    return urls
+
+
+def synced_source(block: dict) -> str | None:
+    """Returns ID of the original block whose content a synced block shows.
+
+    Every reference to a synced block lists the same children as the
+    original, so they are fetched once per crawl and shared by all references.
+    None means the block is not a synced block.
+    """
+    if block["type"] != "synced_block":
+        return None
+    synced_from = block["synced_block"].get("synced_from")
+    return synced_from["block_id"] if synced_from else block["id"]
+
+
+def merge_database_entries(entry_ids: list, changed_entries: list, previous_entries: list) -> list:
+    """Merges database entries edited since the previous crawl into its entries.
+
+    Args:
+        entry_ids (list): IDs of all current entries in the database order.
+        changed_entries (list): Entries edited since the previous crawl.
+        previous_entries (list): Entries of the database from the previous crawl.
+
+    Returns:
+        entries (list): Entries in the order of 'entry_ids'. Entries deleted
+            since the previous crawl are dropped, entries unknown to both lists
+            are None and have to be retrieved.
+    """
+    known_entries = {entry["id"]: entry for entry in previous_entries}
+    known_entries.update((entry["id"], entry) for entry in changed_entries)
+    return [known_entries.get(entry_id) for entry_id in entry_ids]
+
+
+def entry_header(block: dict) -> dict:
+    """Returns database entry from databases.query as if it was retrieved by pages.retrieve."""
+    return {key: value for key, value in block.items() if key != "type"}
+
+
+class Pagination:
+    """Cursor of a paginated Notion list endpoint, shared by the synchronous and the asyncio crawler.
+
+    Every listing of both crawlers goes through it: send a request with the
+    parameters of request() and pass the response to add() until 'done'.
+
+    Args:
+        start_cursor (str): Cursor to continue a listing from, e.g. the one
+            recorded in the journal of an interrupted crawl.
+        **kwargs: Parameters of every request of the listing, e.g. filter.
+    """
+
+    def __init__(self, start_cursor: str | None = None, **kwargs):
+        self.kwargs = kwargs
+        self.results: list = []
+        self.start_cursor = start_cursor
+        self.done = False
+
+    def request(self) -> dict:
+        """Returns parameters of the next request."""
+        if self.start_cursor is None:
+            return self.kwargs
+        return {**self.kwargs, "start_cursor": self.start_cursor}
+
+    def add(self, response: dict):
+        """Collects results of a response and moves the cursor to the next page of the listing."""
+        self.results.extend(response["results"])
+        self.start_cursor = response["next_cursor"]
+        self.done = self.start_cursor is None
+
+
+def list_all(endpoint, object_id: str, **kwargs) -> list:
+    """Collects every result of a paginated Notion list endpoint.
+
+    Args:
+        endpoint: Bound endpoint, e.g. notion.blocks.children.list or
+            notion.databases.query.
+        object_id (str): ID of the block, page or database to list.
+        **kwargs: Additional parameters of the request, e.g. filter.
+
+    Returns:
+        results (list): Concatenated "results" of all pages of the listing.
+    """
+    pagination = Pagination(**kwargs)
+    while not pagination.done:
+        pagination.add(endpoint(object_id, **pagination.request()))
+    return pagination.results
+
+
+def query_database_delta(page: dict, notion: "notion_client.client.Client", state: CrawlState, delta: dict) -> list:
+    """Lists entries of a database fetching in full only entries edited since the previous crawl.
+
+    A cheap pass over the database with only the title property returns IDs
+    of all current entries, which detects deleted ones. A second query with
+    the 'delta' filter returns the changed entries, which are merged into the
+    entries of the previous crawl.
+    """
+    database_id = page["id"]
+    entry_ids = [entry["id"] for entry in list_all(notion.databases.query, database_id, filter_properties=["title"])]
+    changed_entries = list_all(
+        notion.databases.query,
+        database_id,
+        filter=delta,
+        sorts=[{"timestamp": "last_edited_time", "direction": "descending"}],
+    )
+    entries = merge_database_entries(entry_ids, changed_entries, state.previous[database_id]["blocks"])
+    for i_entry, entry in enumerate(entries):
+        if entry is None:
+            entries[i_entry] = notion.pages.retrieve(entry_ids[i_entry])
+    logging.debug(f"🤖 {len(changed_entries)} of {len(entries)} entries of {database_id} changed.")
+    return entries
+
+
+def block_parser(
+    block: dict,
+    notion: "notion_client.client.Client",
+    reuse: BlockReuse | None = None,
+    synced: dict | None = None,
+) -> dict:
     """Parses block for obtaining all nested blocks
 
     This function does recursive search over all nested blocks in a given block.
@@ -20,6 +340,10 @@ def block_parser(block: dict, notion: "notion_client.client.Client") -> dict:
             function notion.blocks.children.list().
         notion (notion_client.client.Client): Client for python API for
             Notion from https://github.com/ramnes/notion-sdk-py is used here.
+        reuse (BlockReuse): Nested blocks of the previous version of the page.
+            Unchanged blocks take their children from it without API calls.
+        synced (dict): Children of synced blocks by ID of the original block,
+            shared by all pages of the crawl.
 
     Returns:
         block (dict): Notion block, which contains additional "children" key,
@@ -27,116 +351,225 @@ def block_parser(block: dict, notion: "notion_client.client.Client") -> dict:
     """
 
     if block["has_children"]:
-        block["children"] = []
-        start_cursor = None
-        while True:
-            # first time we need to get the first page of children
-            if start_cursor is None:
-                blocks: dict = notion.blocks.children.list(block["id"])  # type: ignore
+        # Editing the original does not touch last_edited_time of its references,
+        # so synced blocks are always taken from the cache of this crawl.
+        if synced is not None and (source_id := synced_source(block)) is not None:
+            if source_id not in synced:
+                children = list_all(notion.blocks.children.list, block["id"])
+                for child_block in children:
+                    block_parser(child_block, notion, reuse, synced)
+                synced[source_id] = children
             else:
-                blocks: dict = notion.blocks.children.list(block["id"], start_cursor=start_cursor)  # type: ignore
-
-            block["children"].extend(blocks["results"])
-            start_cursor = blocks["next_cursor"]
+                logging.debug(f"🤖 Reused content of synced block {source_id}.")
+            block["children"] = synced[source_id]
+            return block
 
-            # if there are no more children, then break the loop
-            if start_cursor is None:
-                break
+        if reuse is not None:
+            children = reuse.children(block)
+            if children is not None:
+                block["children"] = children
+                return block
 
+        block["children"] = list_all(notion.blocks.children.list, block["id"])
         for child_block in block["children"]:
-            block_parser(child_block, notion)
+            block_parser(child_block, notion, reuse, synced)
     return block
 
 
-def notion_page_parser(
+def retrieve(page_id: str, notion: "notion_client.client.Client") -> dict:
+    """Returns the page or the database with the ID."""
+    try:
+        return notion.pages.retrieve(page_id)  # type: ignore
+    except APIResponseError:
+        return notion.databases.retrieve(page_id)  # type: ignore
+
+
+def fetch_page(
     page_id: str,
     notion: "notion_client.client.Client",
-    filename: str,
-    notion_json: dict,
-):
-    """Parses notion page with all its nested content and subpages
+    state: CrawlState,
+    header: dict | None = None,
+) -> dict:
+    """Fetches a notion page or a database with all its nested content, but not its subpages
 
-    This function does recursive search over all nested subpages and databases.
-    The result of parsing incrementally saves in 'notion_json' dict and locally
-    in the 'filename' file.
+    The result is saved in 'state.notion_json' dict and is appended to the
+    crawl journal. Pages, cursor pages of blocks and top-level blocks which
+    are already recorded in a resumed journal are not fetched again. In the
+    incremental mode the blocks of pages which are not edited since the
+    previous crawl are copied from it.
 
     Args:
         page_id (str): ID of the Notion page for parsing
         notion (notion_client.client.Client): Client for python API for
             Notion from https://github.com/ramnes/notion-sdk-py is used here.
-        filename (str): Name of the JSON file to be saved.
-        notion_json (dict): Dictionary with raw Notion data. Keys of this
-            dictionary is the unique ID for each notion page. Each page contains
-            a key 'blocks' which is a list of blocks with a content inside the
-            page. Some blocks may be nested pages and databases.
+        state (CrawlState): State of the crawl. Its 'notion_json' is a
+            dictionary with raw Notion data. Keys of this dictionary is the
+            unique ID for each notion page. Each page contains a key 'blocks'
+            which is a list of blocks with a content inside the page. Some
+            blocks may be nested pages and databases.
+        header (dict): Already known page object, e.g. a database entry
+            returned by databases.query, which saves pages.retrieve call.
+
+    Returns:
+        page (dict): The page from 'state.notion_json'.
     """
-    try:
-        page: dict = notion.pages.retrieve(page_id)  # type: ignore
-        page_type = "page"
+    journal = state.journal
+    notion_json = state.notion_json
+    page = journal.retrieved_page(page_id)
+    if page is None:
+        page = header if header is not None else retrieve(page_id, notion)
+        notion_json[page["id"]] = page
+        journal.page(page)
+        logging.debug(f"🤖 Retrieved {page['id']} of type {page['object']}.")
+    page_type = page["object"]
 
-    except APIResponseError:
-        page: dict = notion.databases.retrieve(page_id)  # type: ignore
-        page_type = "database"
-        pass
-
-    notion_json[page["id"]] = page
-    logging.debug(f"🤖 Retrieved {page['id']} of type {page_type}.")
-    update_notion_file(filename, notion_json)
-    start_cursor = None
-    notion_json[page["id"]]["blocks"] = []
-
-    while True:
-        if start_cursor is None:
-            if page_type == "page":
-                blocks: dict = notion.blocks.children.list(page_id)  # type: ignore
-            elif page_type == "database":
-                blocks: dict = notion.databases.query(page_id)  # type: ignore
-            else:
-                raise ValueError("Unknown page type.")
+    if journal.is_done(page["id"]):
+        state.prefetch(page)
+        return page
+
+    reuse = None
+    if not journal.is_listed(page["id"]):
+        previous_page = state.unchanged_page(page) if page_type == "page" else None
+        if previous_page is not None:
+            notion_json[page["id"]]["blocks"] = previous_page["blocks"]
+            journal.blocks(page["id"], previous_page["blocks"], None, parsed=True)
+            state.reused_pages += 1
+            logging.debug(f"🤖 Reused unchanged content of {page['id']}.")
+        elif (delta := state.database_delta(page)) is not None:
+            entries = query_database_delta(page, notion, state, delta)
+            for block in entries:
+                block["type"] = "db_entry"
+            notion_json[page["id"]]["blocks"] = entries
+            journal.blocks(page["id"], entries, None)
         else:
+            reuse = state.block_reuse(page)
             if page_type == "page":
-                blocks: dict = notion.blocks.children.list(page_id, start_cursor=start_cursor)  # type: ignore
+                endpoint = notion.blocks.children.list
             elif page_type == "database":
-                blocks: dict = notion.databases.query(page_id, start_cursor=start_cursor)  # type: ignore
+                endpoint = notion.databases.query
             else:
                 raise ValueError("Unknown page type.")
 
-        start_cursor = blocks["next_cursor"]
-        notion_json[page["id"]]["blocks"].extend(blocks["results"])
-        update_notion_file(filename, notion_json)
-        if start_cursor is None:
-            break
+            pagination = Pagination(journal.next_cursor(page["id"]))
+            if pagination.start_cursor is None:
+                notion_json[page["id"]]["blocks"] = []
+            while not pagination.done:
+                blocks: dict = endpoint(page["id"], **pagination.request())  # type: ignore
+                pagination.add(blocks)
+                if page_type == "database":
+                    for block in blocks["results"]:
+                        block["type"] = "db_entry"
+                notion_json[page["id"]]["blocks"].extend(blocks["results"])
+                journal.blocks(page["id"], blocks["results"], pagination.start_cursor)
 
-    logging.debug(f"🤖 Parsed content of {page['id']}.")
+            logging.debug(f"🤖 Parsed content of {page['id']}.")
 
-    removed_blocks = []
-    for i_block, block in enumerate(notion_json[page["id"]]["blocks"]):
-        if page_type == "page":
+    if page_type == "page":
+        for i_block, block in enumerate(notion_json[page["id"]]["blocks"]):
             if block["type"] in ["page", "child_page", "child_database"]:
-                try:
-                    notion_page_parser(block["id"], notion, filename, notion_json)
-                except APIResponseError as e:
-                    # if 404 error, then remove the block
-                    if e.code == notion_client.APIErrorCode.ObjectNotFound:
-                        logging.debug(f"🤖 Removing block {block['id']}.")
-                        removed_blocks.append(i_block)
-                    raise e
-            else:
-                block = block_parser(block, notion)
+                continue
+            if not journal.is_parsed(page["id"], i_block):
+                block = block_parser(block, notion, reuse, state.synced_blocks)
                 notion_json[page["id"]]["blocks"][i_block] = block
-                update_notion_file(filename, notion_json)
-        elif page_type == "database":
-            block["type"] = "db_entry"
-            notion_json[page["id"]]["blocks"][i_block] = block
-            update_notion_file(filename, notion_json)
+                journal.block(page["id"], i_block, block)
+    state.report_reuse(page["id"], reuse)
+    state.prefetch(page)
+    return page
+
+
+def subpage_blocks(page: dict, state: CrawlState) -> list:
+    """Returns (index of block, block, known header) for each subpage or database entry of the page."""
+    subpages = []
+    for i_block, block in enumerate(page.get("blocks", [])):
+        if page["object"] == "page":
+            if block["type"] in ["page", "child_page", "child_database"]:
+                subpages.append((i_block, block, None))
+        elif page["object"] == "database":
             if block["object"] in ["page", "child_page", "child_database"]:
-                try:
-                    notion_page_parser(block["id"], notion, filename, notion_json)
-                except APIResponseError as e:
-                    # if 404 error, then remove the block
-                    if e.code == notion_client.APIErrorCode.ObjectNotFound:
-                        logging.debug(f"🤖 Removing block {block['id']}.")
-                        removed_blocks.append(i_block)
-                    raise e
-    for i_block in reversed(removed_blocks):
-        notion_json[page["id"]]["blocks"].pop(i_block)
+                # In the incremental mode the entry from the query is enough to compare last_edited_time.
+                header = entry_header(block) if state.incremental else None
+                subpages.append((i_block, block, header))
+    return subpages
+
+
+def expand(page: dict, depth: int, state: CrawlState, frontier: "Frontier"):
+    """Queues subpages and database entries of the fetched page."""
+    for _, block, header in subpage_blocks(page, state):
+        frontier.push(block["id"], header, depth + 1, block.get("last_edited_time"))
+
+
+def is_not_found(error: BaseException) -> bool:
+    return isinstance(error, APIResponseError) and error.code == notion_client.APIErrorCode.ObjectNotFound
+
+
+def finish_crawl(root_id: str, state: CrawlState, frontier: "Frontier"):
+    """Completes the crawl once the frontier is exhausted.
+
+    Blocks pointing to subpages which returned 404 are removed, pages which
+    are not reachable from the root through blocks are discarded, and all
+    pages are marked as done in the journal.
+    """
+    # Reachable pages in the order they are found, and as a set for membership tests
+    reachable = []
+    reached = set()
+    stack = [root_id]
+    while stack:
+        page_id = stack.pop()
+        if page_id in reached or page_id not in state.notion_json:
+            continue
+        reachable.append(page_id)
+        reached.add(page_id)
+        stack.extend(block["id"] for _, block, _ in subpage_blocks(state.notion_json[page_id], state))
+
+    for page_id in set(state.notion_json) - reached:
+        state.journal.discard(page_id)
+    for page_id in reachable:
+        if state.journal.is_done(page_id):
+            continue
+        page = state.notion_json[page_id]
+        removed_blocks = [
+            i_block for i_block, block, _ in subpage_blocks(page, state) if block["id"] in frontier.not_found
+        ]
+        for i_block in reversed(removed_blocks):
+            logging.debug(f"🤖 Removing block {page['blocks'][i_block]['id']}.")
+            page["blocks"].pop(i_block)
+        state.journal.page_done(page_id, removed_blocks)
+
+
+def crawl(page_id: str, notion: "notion_client.client.Client", state: CrawlState, frontier: "Frontier") -> bool:
+    """Parses notion page with all its nested content and subpages
+
+    Pages are fetched one by one in the order of the frontier, which never
+    fetches the same page twice. Subpages which return 404 are removed from
+    the blocks of their parent pages.
+
+    Args:
+        page_id (str): ID of the Notion page for parsing.
+        notion (notion_client.client.Client): Client for python API for Notion.
+        state (CrawlState): State of the crawl, see fetch_page.
+        frontier (Frontier): Pages waiting to be fetched.
+
+    Returns:
+        finished (bool): False if the time budget of the frontier is over
+            before all pages are fetched.
+    """
+    root_id = normalize_id(page_id)
+    frontier.push(root_id)
+    while (item := frontier.pop()) is not None:
+        page_id, header, depth = item
+        try:
+            page = fetch_page(page_id, notion, state, header)
+        except APIResponseError as e:
+            # if 404 error, then the block is removed in the end
+            if not is_not_found(e):
+                raise e
+            frontier.fail(page_id)
+            continue
+        frontier.complete(page_id)
+        expand(page, depth, state, frontier)
+
+    frontier.report()
+    if not frontier.finished:
+        return False
+    finish_crawl(root_id, state, frontier)
+    return True
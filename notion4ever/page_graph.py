@@ -0,0 +1,112 @@
+class PageGraph:
+    """Tree of pages as arrays of page indices, built once from the structured pages.
+
+    Pages are numbered in the order of 'pages'. 'parent' holds the index of
+    the parent of every page, or -1 when the parent is not in the workspace,
+    and 'children' the indices of its children in their order. Children are
+    those listed by structuring.parse_headers(), while ancestors follow the
+    "parent" field, as the family lines always did. The graph keeps the
+    depth of every page instead of its chain of ancestors, so it takes
+    linear memory; a chain is built on demand by following 'parent', or
+    for all pages at once by family_lines().
+    Traversals use explicit loops, so deep trees do not hit the recursion
+    limit, and a cycle of pages raises ValueError instead of looping.
+
+    Args:
+        pages (dict): Page ID -> page with "parent" and "children".
+    """
+
+    def __init__(self, pages: dict):
+        self.ids = list(pages)
+        self.index = {page_id: i for i, page_id in enumerate(self.ids)}
+        self.parent = [self.index.get(page["parent"], -1) for page in pages.values()]
+        self.children = [[self.index[child_id] for child_id in page["children"]] for page in pages.values()]
+        # Number of ancestors of every page, -1 until it is known
+        self.depth = [-1] * len(self.ids)
+        self._descendants: list | None = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _depth(self, node: int) -> int:
+        # Climbs up to a page with a known depth, then sets the depths on the way down
+        path = []
+        on_path = set()
+        while node != -1 and self.depth[node] == -1:
+            if node in on_path:
+                raise ValueError(f"Page {self.ids[node]} is its own ancestor.")
+            path.append(node)
+            on_path.add(node)
+            node = self.parent[node]
+        depth = -1 if node == -1 else self.depth[node]
+        for node in reversed(path):
+            depth += 1
+            self.depth[node] = depth
+        return depth if path else self.depth[node]
+
+    def ancestors(self, page_id: str) -> list:
+        """Returns IDs of the ancestors of the page from the top one down to its parent."""
+        node = self.index[page_id]
+        chain = [""] * self._depth(node)
+        for i in range(len(chain) - 1, -1, -1):
+            node = self.parent[node]
+            chain[i] = self.ids[node]
+        return chain
+
+    def family_lines(self):
+        """Yields (page ID, IDs of its ancestors from the top one down) of every page.
+
+        The pages are walked depth-first along their "parent" fields and
+        every line is a copy of the current path, so the cost is linear in
+        the number of pages plus the length of the lines.
+        """
+        below = [[] for _ in self.ids]
+        for node, parent in enumerate(self.parent):
+            if parent != -1:
+                below[parent].append(node)
+        path = []
+        stack = [(node, 0) for node in reversed(range(len(self.ids))) if self.parent[node] == -1]
+        walked = 0
+        while stack:
+            node, depth = stack.pop()
+            del path[depth:]
+            self.depth[node] = depth
+            yield self.ids[node], path[:]
+            path.append(self.ids[node])
+            stack.extend((child, depth + 1) for child in reversed(below[node]))
+            walked += 1
+        if walked < len(self.ids):
+            node = next(node for node, depth in enumerate(self.depth) if depth == -1)
+            raise ValueError(f"Page {self.ids[node]} is its own ancestor or nested in such a page.")
+
+    def _preorder(self, node: int) -> list:
+        order = []
+        stack = [node]
+        seen = set()
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                raise ValueError(f"Page {self.ids[node]} is nested in itself.")
+            seen.add(node)
+            order.append(node)
+            stack.extend(reversed(self.children[node]))
+        return order
+
+    def preorder(self, page_id: str) -> list:
+        """Returns IDs of the page and of all pages nested in it, every page before its children."""
+        return [self.ids[node] for node in self._preorder(self.index[page_id])]
+
+    def descendants(self, page_id: str) -> int:
+        """Returns the number of pages nested in the page, counted for all pages at the first call."""
+        if self._descendants is None:
+            nested = {child for children in self.children for child in children}
+            order = []
+            for node in range(len(self.ids)):
+                if node not in nested:
+                    order.extend(self._preorder(node))
+            counts = [0] * len(self.ids)
+            # Children come after their parent in pre-order, so they are counted first
+            for node in reversed(order):
+                counts[node] = sum(1 + counts[child] for child in self.children[node])
+            self._descendants = counts
+        return self._descendants[self.index[page_id]]
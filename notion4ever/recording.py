@@ -0,0 +1,138 @@
+from collections import deque
+from urllib.parse import parse_qsl
+import json
+import threading
+import httpx
+
+
+def request_key(method: str, url: httpx.URL | str, content: bytes | None) -> str:
+    """Identifies a request by its method, path, sorted query and JSON body."""
+    url = httpx.URL(str(url))
+    query = sorted(parse_qsl(url.query.decode()))
+    body = json.loads(content) if content else None
+    return json.dumps([method, url.path, query, body], sort_keys=True)
+
+
+class Recorder:
+    """Writes every Notion API exchange into a JSONL fixture.
+
+    Each line holds the request (method, URL, JSON body) and the response
+    (status, Retry-After header, JSON body), so the fixture can be replayed
+    with ReplayTransport. Records of concurrent requests are written whole,
+    one at a time.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = None
+        self._lock = threading.Lock()
+
+    def record(self, request: httpx.Request, status_code: int, headers: httpx.Headers, content: bytes):
+        record = {
+            "method": request.method,
+            "url": str(request.url),
+            "body": json.loads(request.content) if request.content else None,
+            "status": status_code,
+            "headers": {key: headers[key] for key in ("content-type", "retry-after") if key in headers},
+            "response": content.decode("utf-8"),
+        }
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.filename, "w", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """httpx transport which records the exchanges of the wrapped transport."""
+
+    def __init__(self, recorder: Recorder, transport: httpx.BaseTransport | None = None):
+        self.recorder = recorder
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        response = self.transport.handle_request(request)
+        content = response.read()
+        response.close()
+        self.recorder.record(request, response.status_code, response.headers, content)
+        return httpx.Response(response.status_code, headers=response.headers, content=content)
+
+    def close(self):
+        self.transport.close()
+        self.recorder.close()
+
+
+class AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    """Asynchronous counterpart of RecordingTransport."""
+
+    def __init__(self, recorder: Recorder, transport: httpx.AsyncBaseTransport | None = None):
+        self.recorder = recorder
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self.transport.handle_async_request(request)
+        content = await response.aread()
+        await response.aclose()
+        self.recorder.record(request, response.status_code, response.headers, content)
+        return httpx.Response(response.status_code, headers=response.headers, content=content)
+
+    async def aclose(self):
+        await self.transport.aclose()
+        self.recorder.close()
+
+
+class ReplayTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """httpx transport which answers requests from a recorded fixture.
+
+    Requests are matched by method, path, query and JSON body, not by their
+    order, so a fixture recorded by one crawler can be replayed by another
+    one or with a different concurrency. Identical requests get their
+    recorded responses in turn, e.g. a 429 and then the retried success; the
+    last one is repeated once they run out. An unknown request raises
+    LookupError, as the crawl would diverge from the recorded one.
+    """
+
+    def __init__(self, filename: str):
+        self.responses: dict = {}
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                content = json.dumps(record["body"]).encode() if record["body"] is not None else None
+                key = request_key(record["method"], record["url"], content)
+                self.responses.setdefault(key, deque()).append(record)
+        self._lock = threading.Lock()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request.method, request.url, request.read())
+        with self._lock:
+            if key not in self.responses:
+                raise LookupError(f"No recorded response for {request.method} {request.url}.")
+            records = self.responses[key]
+            record = records.popleft() if len(records) > 1 else records[0]
+        return httpx.Response(record["status"], headers=record["headers"], content=record["response"].encode())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return self.handle_request(request)
+
+
+def inner_transport(record: str | None = None, replay: str | None = None) -> httpx.BaseTransport | None:
+    """Returns the transport under the throttling one: recording, replaying or None for the network."""
+    if replay:
+        return ReplayTransport(replay)
+    if record:
+        return RecordingTransport(Recorder(record))
+    return None
+
+
+def async_inner_transport(record: str | None = None, replay: str | None = None) -> httpx.AsyncBaseTransport | None:
+    """Asynchronous counterpart of inner_transport."""
+    if replay:
+        return ReplayTransport(replay)
+    if record:
+        return AsyncRecordingTransport(Recorder(record))
+    return None
@@ -1,11 +1,22 @@
+from notion4ever import images
+from notion4ever import manifest
+from notion4ever import workers
+from notion4ever.page_graph import PageGraph
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
 import sass
 import markdown
 import shutil
 import jinja2
+import jinja2.meta
 from pathlib import Path
 import logging
 import dateutil.parser as dt_parser
 import json
+import hashlib
+import os
+import tempfile
 
 # pip install mdx_truly_sane_lists
 # required pip install markdown-captions, pip install markdown-checklist
@@ -30,27 +41,164 @@ def generate_css(config: dict):
     sass.compile(dirname=(config["sass_dir"], (Path(config["output_dir"]) / "css").as_posix()))
 
 
-def generate_404(structured_notion: dict, config: dict):
+class TemplateEngine:
+    """Site-wide Jinja environment which compiles every template once.
+
+    Compiled templates, the included partials too, are kept by the
+    environment for the whole build. With a cache directory their bytecode
+    is also stored on disk, checked against the hash of the template
+    source, so later builds and worker processes skip the compilation of
+    unchanged templates.
+
+    Args:
+        templates_dir (Path): Directory of the templates.
+        cache_dir (Path): Directory of persistent caches or None.
+    """
+
+    def __init__(self, templates_dir: Path, cache_dir: Path | None = None):
+        bytecode_cache = None
+        if cache_dir:
+            (Path(cache_dir) / "jinja").mkdir(parents=True, exist_ok=True)
+            bytecode_cache = jinja2.FileSystemBytecodeCache(str(Path(cache_dir) / "jinja"))
+        self.loader = jinja2.FileSystemLoader(templates_dir)
+        self.environment = jinja2.Environment(
+            loader=self.loader,
+            bytecode_cache=bytecode_cache,
+            # Templates do not change during a build
+            auto_reload=False,
+        )
+
+    def render(self, template_name: str, **context) -> str:
+        return self.environment.get_template(template_name).render(**context)
+
+    def fingerprint(self, template_name: str) -> str:
+        """Returns sha256 of the sources of the template and of all templates it includes, imports or extends."""
+        sha256 = hashlib.sha256()
+        pending, seen = [template_name], set()
+        while pending:
+            name = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            source, _, _ = self.loader.get_source(self.environment, name)
+            sha256.update(name.encode() + b"\0" + source.encode("utf-8"))
+            referenced = jinja2.meta.find_referenced_templates(self.environment.parse(source))
+            # Dynamic references are None, they cannot be followed
+            pending.extend(sorted(name for name in referenced if name is not None))
+        return sha256.hexdigest()
+
+
+MARKDOWN_EXTENSIONS = [
+    "meta",
+    "tables",
+    "mdx_truly_sane_lists",
+    "markdown_captions",
+    "pymdownx.tilde",
+    "pymdownx.tasklist",
+    "pymdownx.superfences",
+    "pymdownx.blocks.details",
+    "markdown_mermaidjs",
+    "toc",
+]
+
+MARKDOWN_EXTENSION_CONFIGS = {
+    "mdx_truly_sane_lists": {
+        "nested_indent": 4,
+        "truly_sane": True,
+    },
+    "pymdownx.tasklist": {
+        "clickable_checkbox": True,
+    },
+}
+
+# Distributions of markdown and its extensions, their versions are a part of the render cache key
+MARKDOWN_DISTRIBUTIONS = [
+    "markdown",
+    "mdx-truly-sane-lists",
+    "markdown-captions",
+    "pymdown-extensions",
+    "markdown-mermaidjs",
+]
+
+
+def converter_key() -> str:
+    """Identifies the markdown conversion by the extensions, their configuration and versions."""
+    versions = []
+    for distribution in MARKDOWN_DISTRIBUTIONS:
+        try:
+            versions.append(metadata.version(distribution))
+        except metadata.PackageNotFoundError:
+            versions.append(None)
+    return json.dumps([MARKDOWN_EXTENSIONS, MARKDOWN_EXTENSION_CONFIGS, versions], sort_keys=True)
+
+
+class MarkdownConverter:
+    """Converts markdown of pages to HTML with one reused markdown.Markdown.
+
+    The extension stack is built once per process and reset between pages.
+    With a cache directory the HTML of every page is also stored on disk,
+    keyed by the hash of its markdown together with the extensions, their
+    configuration and versions, so pages whose markdown has not changed are
+    not converted again by later builds.
+
+    Args:
+        cache_dir (Path): Directory of persistent caches or None.
+    """
+
+    def __init__(self, cache_dir: Path | None = None):
+        self.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS, extension_configs=MARKDOWN_EXTENSION_CONFIGS)
+        self.cache_dir = Path(cache_dir) / "html" if cache_dir else None
+        self.config_key = converter_key()
+        self.converted = 0
+        self.cached = 0
+
+    def convert(self, md_content: str) -> str:
+        if self.cache_dir is None:
+            self.converted += 1
+            return self.markdown.reset().convert(md_content)
+
+        key = hashlib.sha256(f"{self.config_key}\n{md_content}".encode("utf-8")).hexdigest()
+        path = self.cache_dir / key[:2] / f"{key}.html"
+        if path.exists():
+            self.cached += 1
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                return f.read()
+        html_content = self.markdown.reset().convert(md_content)
+        self.converted += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(html_content)
+        os.replace(tmp_name, path)
+        return html_content
+
+
+def markdown_converter(config: dict) -> MarkdownConverter | None:
+    """Returns the converter of page markdown, None when pages are rendered straight from blocks."""
+    if config["renderer"] == "html":
+        return None
+    return MarkdownConverter(config["cache_dir"])
+
+
+def renderer_key(config: dict) -> str:
+    """Identifies how pages are rendered: the renderer, the markdown export and the markdown conversion."""
+    return json.dumps([config["renderer"], config["export_markdown"], converter_key()])
+
+
+def generate_404(structured_notion: dict, config: dict, templates: TemplateEngine):
     """Generates 404 html page."""
     with open(Path(config["output_dir"]) / "404.html", "w+", encoding="utf-8") as f:
-        tml = (Path(config["templates_dir"]) / "404.html").read_text()
-        jinja_loader = jinja2.FileSystemLoader(config["templates_dir"])
-        jtml = jinja2.Environment(loader=jinja_loader).from_string(tml)
-        html_page = jtml.render(content="", site=structured_notion)
+        html_page = templates.render("404.html", content="", site=structured_notion)
         f.write(html_page)
 
 
-def generate_archive(structured_notion: dict, config: dict):
+def generate_archive(structured_notion: dict, config: dict, templates: TemplateEngine):
     """Generates archive page."""
     archive_link = "Archive.html"
     structured_notion["archive_url"] = str((Path(config["output_dir"]).resolve() / archive_link))
 
     with open(Path(config["output_dir"]) / archive_link, "w+", encoding="utf-8") as f:
-        # Specify template folder
-        tml = (Path(config["templates_dir"]) / "archive.html").read_text()
-        jinja_loader = jinja2.FileSystemLoader(config["templates_dir"])
-        jtemplate = jinja2.Environment(loader=jinja_loader).from_string(tml)
-        html_page = jtemplate.render(content="", site=structured_notion)
+        html_page = templates.render("archive.html", content="", site=structured_notion)
         f.write(html_page)
 
 
@@ -61,7 +209,24 @@ def str_to_dt(structured_notion: dict):
                 structured_notion["pages"][page_id][field] = dt_parser.isoparse(page[field])
 
 
-def generate_page(page_id: str, structured_notion: dict, config: dict):
+def generate_page(
+    page_id: str,
+    structured_notion: dict,
+    config: dict,
+    templates: TemplateEngine,
+    converter: "MarkdownConverter | None",
+    graph: PageGraph,
+) -> list:
+    """Renders the page into its html file and, with config["export_markdown"], its markdown file.
+
+    Pages rendered from blocks by html_renderer have their HTML already,
+    the markdown of other pages is converted by 'converter'. The breadcrumb
+    pages are the ancestors of the page, which graph.ancestors() collects
+    by following the parents up from the page.
+
+    Returns:
+        paths (list): Written files.
+    """
     page = structured_notion["pages"][page_id]
     page_url = page["url"]
 
@@ -69,10 +234,12 @@ def generate_page(page_id: str, structured_notion: dict, config: dict):
     folder = (config["output_dir"] / page_url.lstrip("/")).parent
     md_filename = f"{page_id}.md"
     html_filename = "index.html"
+    paths = []
 
     logging.debug(f"🤖 MD {folder / md_filename}; HTML {folder / html_filename}")
     folder.mkdir(parents=True, exist_ok=True)
-    with open((folder / md_filename).resolve(), "w+", encoding="utf-8") as f:
+    html_content = page.get("html_content")
+    if "md_content" in page:
         metadata = (
             "---\n"
             f"title: {page['title']}\n"
@@ -88,46 +255,83 @@ def generate_page(page_id: str, structured_notion: dict, config: dict):
         md_content = page["md_content"]
         md_content = metadata + md_content
 
-        f.write(md_content)
-
-    html_content = markdown.markdown(
-        md_content,
-        extensions=[
-            "meta",
-            "tables",
-            "mdx_truly_sane_lists",
-            "markdown_captions",
-            "pymdownx.tilde",
-            "pymdownx.tasklist",
-            "pymdownx.superfences",
-            "pymdownx.blocks.details",
-            "markdown_mermaidjs",
-            "toc",
-        ],
-        extension_configs={
-            "mdx_truly_sane_lists": {
-                "nested_indent": 4,
-                "truly_sane": True,
-            },
-            "pymdownx.tasklist": {
-                "clickable_checkbox": True,
-            },
-        },
-    )
+        if config["export_markdown"]:
+            with open((folder / md_filename).resolve(), "w+", encoding="utf-8") as f:
+                f.write(md_content)
+            paths.append(folder / md_filename)
+        if html_content is None and converter is not None:
+            html_content = converter.convert(md_content)
 
-    tml = (Path(config["templates_dir"]) / "page.html").read_text()
+    html_content = images.responsive_html(html_content, structured_notion.get("images"))
 
     with open((folder / html_filename).resolve(), "w+", encoding="utf-8") as f:
-        # Specify template folder
-        jinja_loader = jinja2.FileSystemLoader(config["templates_dir"])
-        jtemplate = jinja2.Environment(loader=jinja_loader).from_string(tml)
-        html_page = jtemplate.render(content=html_content, page=page, site=structured_notion)
+        breadcrumbs = [structured_notion["pages"][parent_id] for parent_id in graph.ancestors(page_id)]
+        html_page = templates.render(
+            "page.html", content=html_content, page=page, site=structured_notion, breadcrumbs=breadcrumbs
+        )
         f.write(html_page)
+    paths.append(folder / html_filename)
+    return paths
 
 
-def generate_pages(structured_notion: dict, config: dict):
-    for page_id, page in structured_notion["pages"].items():
-        generate_page(page_id, structured_notion, config)
+# Site context of a worker process of generate_pages, set once by init_worker
+_worker_context: tuple = ()
+
+
+def init_worker(structured_notion: dict, config: dict):
+    global _worker_context
+    _worker_context = (
+        structured_notion,
+        config,
+        TemplateEngine(config["templates_dir"], config["cache_dir"]),
+        markdown_converter(config),
+        PageGraph(structured_notion["pages"]),
+    )
+
+
+def generate_pages_in_worker(page_ids: list) -> list:
+    """Renders a shard of pages in a worker process with the site context it received once."""
+    structured_notion, config, templates, converter, graph = _worker_context
+    return [
+        (page_id, generate_page(page_id, structured_notion, config, templates, converter, graph))
+        for page_id in page_ids
+    ]
+
+
+def generate_pages(
+    structured_notion: dict, config: dict, templates: TemplateEngine, page_ids: list, graph: PageGraph
+) -> dict:
+    """Renders the pages, in 'config["jobs"]' processes if it is more than one.
+
+    Every worker receives the site once when it starts and then renders
+    shards of pages; pages do not depend on each other, so the output is the
+    same as of the serial rendering.
+
+    Returns:
+        outputs (dict): Page ID -> written files.
+    """
+    jobs = workers.jobs_count(config)
+    if jobs <= 1 or len(page_ids) < 2:
+        converter = markdown_converter(config)
+        outputs = {
+            page_id: generate_page(page_id, structured_notion, config, templates, converter, graph)
+            for page_id in page_ids
+        }
+        if converter is not None:
+            logging.debug(f"🤖 Converted markdown of {converter.converted} pages, {converter.cached} cached.")
+        return outputs
+
+    # A few shards per worker balance pages of different sizes
+    shard_size = max(1, len(page_ids) // (jobs * 4))
+    shards = [page_ids[i : i + shard_size] for i in range(0, len(page_ids), shard_size)]
+    outputs = {}
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(structured_notion, config)
+    ) as executor:
+        for shard_outputs in executor.map(generate_pages_in_worker, shards):
+            outputs.update(shard_outputs)
+    logging.debug(f"🤖 {jobs} processes rendered {len(outputs)} pages.")
+    return outputs
 
 
 def generate_search_index(structured_notion: dict, config: dict):
@@ -144,25 +348,55 @@ def generate_site(structured_notion: dict, config: dict):
     verify_templates(config)
     logging.debug("🤖 SASS and templates are verified.")
 
-    generate_css(config)
-    logging.debug("🤖 SASS translated to CSS folder.")
+    site_manifest = None
+    if config["incremental_build"] and config["cache_dir"]:
+        site_manifest = manifest.SiteManifest(config["cache_dir"] / "site_manifest.json", config["output_dir"])
+
+    if site_manifest is not None and site_manifest.sass_unchanged(manifest.directory_fingerprint(config["sass_dir"])):
+        logging.debug("🤖 SASS and fonts are unchanged.")
+    else:
+        generate_css(config)
+        logging.debug("🤖 SASS translated to CSS folder.")
+
+        if (Path(config["output_dir"]) / "css" / "fonts").exists():
+            shutil.rmtree(Path(config["output_dir"]) / "css" / "fonts")
+        shutil.copytree(Path(config["sass_dir"]) / "fonts", Path(config["output_dir"]) / "css" / "fonts")
+        logging.debug("🤖 Copied fonts.")
 
     generate_search_index(structured_notion, config)
     logging.debug("🤖 Generated search index file.")
 
-    if (Path(config["output_dir"]) / "css" / "fonts").exists():
-        shutil.rmtree(Path(config["output_dir"]) / "css" / "fonts")
-    shutil.copytree(Path(config["sass_dir"]) / "fonts", Path(config["output_dir"]) / "css" / "fonts")
-    logging.debug("🤖 Copied fonts.")
-
     str_to_dt(structured_notion)
     logging.debug("🤖 Changed string in dates to datetime objects.")
 
-    generate_archive(structured_notion, config)
+    templates = TemplateEngine(config["templates_dir"], config["cache_dir"])
+
+    generate_archive(structured_notion, config, templates)
     logging.info("🤖 Archive page generated.")
 
-    generate_404(structured_notion, config)
+    generate_404(structured_notion, config, templates)
     logging.info("🤖 404.html page generated.")
 
-    generate_pages(structured_notion, config)
-    logging.info("🤖 All html and md pages generated.")
+    page_ids = list(structured_notion["pages"])
+    # The page tree is rebuilt from the parents and children of the pages, it is not stored with them
+    graph = PageGraph(structured_notion["pages"])
+    if site_manifest is None:
+        generate_pages(structured_notion, config, templates, page_ids, graph)
+        logging.info("🤖 All html and md pages generated.")
+        return
+
+    shared = manifest.site_fingerprint(structured_notion, templates.fingerprint("page.html"), renderer_key(config))
+    fingerprints = {page_id: manifest.page_fingerprint(page_id, structured_notion, shared) for page_id in page_ids}
+    changed = [page_id for page_id in page_ids if not site_manifest.unchanged(page_id, fingerprints[page_id])]
+    outputs = generate_pages(structured_notion, config, templates, changed, graph)
+    for page_id in page_ids:
+        if page_id in outputs:
+            site_manifest.record(page_id, fingerprints[page_id], outputs[page_id])
+        else:
+            site_manifest.keep(page_id)
+    removed = site_manifest.remove_stale_outputs()
+    site_manifest.save()
+    logging.info(
+        f"🤖 Generated {len(changed)} changed html and md pages, {len(page_ids) - len(changed)} were unchanged, "
+        f"removed {removed} files of deleted pages."
+    )
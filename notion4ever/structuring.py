@@ -3,10 +3,14 @@ import logging
 from urllib.parse import urljoin
 from urllib.parse import urlparse
 from urllib.parse import unquote
-from urllib.error import HTTPError
 from pathlib import Path
+from notion4ever import assets
+from notion4ever import html_renderer
+from notion4ever import images
 from notion4ever import markdown_parser
-from urllib import request
+from notion4ever.page_graph import PageGraph
+from notion4ever import workers
+from concurrent.futures import ProcessPoolExecutor
 from itertools import groupby
 import re
 import html
@@ -231,36 +235,22 @@ def find_lists_in_dbs(structured_notion: dict):
                     break
 
 
-def parse_family_line(page_id: str, family_line: list, structured_notion: dict):
-    """Parses the whole parental line for page with 'page_id'"""
-    par_id = structured_notion["pages"][page_id]["parent"]
-    if par_id is not None and par_id in structured_notion["pages"]:
-        family_line.insert(0, par_id)
-        family_line = parse_family_line(par_id, family_line, structured_notion)
+def parse_family_lines(structured_notion: dict, graph: PageGraph):
+    """Sets the whole parental line of every page, from the top page down to its parent."""
+    for page_id, family_line in graph.family_lines():
+        structured_notion["pages"][page_id]["family_line"] = family_line
 
-    return family_line
-
-
-def parse_family_lines(structured_notion: dict):
-    for page_id, page in structured_notion["pages"].items():
-        page["family_line"] = parse_family_line(page_id, [], structured_notion)
-
-
-def generate_urls(page_id: str, structured_notion: dict, config: dict):
-    """Generates url for each page nested in page with 'page_id'"""
-    if page_id == structured_notion["root_page_id"]:
-        f_url = "/index.html"
-        structured_notion["pages"][page_id]["url"] = f_url
-        structured_notion["urls"].append(f_url)
-    else:
-        f_url = f"/{page_id}/index.html"
 
+def generate_urls(structured_notion: dict, graph: PageGraph):
+    """Generates url for each page nested in the root page, in pre-order"""
+    for page_id in graph.preorder(structured_notion["root_page_id"]):
+        if page_id == structured_notion["root_page_id"]:
+            f_url = "/index.html"
+        else:
+            f_url = f"/{page_id}/index.html"
         structured_notion["pages"][page_id]["url"] = f_url
         structured_notion["urls"].append(f_url)
 
-    for child_id in structured_notion["pages"][page_id]["children"]:
-        generate_urls(child_id, structured_notion, config)
-
 
 # ======================
 # Properties handlers
@@ -383,93 +373,192 @@ def p_last_edited_time(property: dict) -> str:
 #     return md_property
 
 
+properties_map = {
+    "rich_text": p_rich_text,
+    "number": p_number,
+    "select": p_select,
+    "multi_select": p_multi_select,
+    "date": p_date,
+    "people": p_people,
+    "files": p_files,
+    "checkbox": p_checkbox,
+    "url": p_url,
+    "email": p_email,
+    "phone_number": p_phone_number,
+    # "formula": p_formula,
+    # "relation": p_relation,
+    # "rollup": p_rollup,
+    "created_time": p_created_time,
+    # "created_by": p_created_by,
+    "last_edited_time": p_last_edited_time,
+    # "last_edited_by": p_last_edited_by
+}
+
+
+def db_entry_properties(properties: dict) -> tuple:
+    """Returns markdown of the properties of a database entry and URLs of the files in them."""
+    properties_md = {}
+    files = []
+    for property_title, property in properties.items():
+        if property["type"] == "title":
+            continue  # We already have the title
+        properties_md[property_title] = ""
+        if property["type"] in properties_map:
+            if property["type"] == "files":
+                for file in property["files"]:
+                    files.append(file["file"]["url"])
+            properties_md[property_title] = properties_map[property["type"]](property)
+        else:
+            logging.debug(f"{property['type']} is not supported yet")
+    return properties_md, files
+
+
 def parse_db_entry_properties(raw_notion: dict, structured_notion: dict):
-    properties_map = {
-        "rich_text": p_rich_text,
-        "number": p_number,
-        "select": p_select,
-        "multi_select": p_multi_select,
-        "date": p_date,
-        "people": p_people,
-        "files": p_files,
-        "checkbox": p_checkbox,
-        "url": p_url,
-        "email": p_email,
-        "phone_number": p_phone_number,
-        # "formula": p_formula,
-        # "relation": p_relation,
-        # "rollup": p_rollup,
-        "created_time": p_created_time,
-        # "created_by": p_created_by,
-        "last_edited_time": p_last_edited_time,
-        # "last_edited_by": p_last_edited_by
-    }
     for page_id, page in structured_notion["pages"].items():
         if page["type"] == "db_entry":
-            structured_notion["pages"][page_id]["properties"] = raw_notion[page_id]["properties"]
-            structured_notion["pages"][page_id]["properties_md"] = {}
-            for property_title, property in structured_notion["pages"][page_id]["properties"].items():
-                if property["type"] == "title":
-                    continue  # We already have the title
-                structured_notion["pages"][page_id]["properties_md"][property_title] = ""
-                if property["type"] in properties_map:
-                    if property["type"] == "files":
-                        for file in property["files"]:
-                            structured_notion["pages"][page_id]["files"].append(file["file"]["url"])
-                    structured_notion["pages"][page_id]["properties_md"][property_title] = properties_map[
-                        property["type"]
-                    ](property)
-                else:
-                    if property["type"] != "title":  # We already have the title
-                        logging.debug(f"{property['type']} is not supported yet")
+            page["properties"] = raw_notion[page_id]["properties"]
+            page["properties_md"], files = db_entry_properties(page["properties"])
+            page["files"].extend(files)
+
+
+class UrlRewriter:
+    """Replaces many URLs in a text in a single pass.
+
+    All URLs are joined into one compiled alternation, longest first, so a
+    URL which starts with another one is replaced whole, and each text is
+    scanned once however many URLs there are.
+
+    Args:
+        new_urls (dict): Old URL -> new URL.
+    """
+
+    def __init__(self, new_urls: dict):
+        self.new_urls = new_urls
+        urls = sorted(new_urls, key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(url) for url in urls)) if urls else None
+
+    def rewrite(self, text: str) -> str:
+        if self.pattern is None or not text:
+            return text
+        return self.pattern.sub(lambda match: self.new_urls[match[0]], text)
+
+
+def asset_location(page: dict, file_url: str, config: dict) -> tuple:
+    """Returns (site URL, local path) of a file downloaded next to the page."""
+    # Original file information
+    clean_url = urljoin(file_url, urlparse(file_url).path)
+    filename = unquote(urlparse(clean_url).path.replace("/", "_").strip("_"))
+    # Downloaded file information
+    parent = Path(page["url"]).parent
+    new_url = str(parent / filename)
+    local_file_location = config["output_dir"] / Path(page["url"].lstrip("/")).parent / filename
+    return new_url, local_file_location
+
+
+def max_file_size(config: dict) -> int | None:
+    """Returns the maximum size of downloaded files in bytes or None for no limit."""
+    if config["max_file_size"] is None:
+        return None
+    return int(config["max_file_size"] * 2**20)
+
+
+def asset_store(config: dict) -> assets.AssetStore | None:
+    """Returns the asset store in the cache directory or None if it is turned off or there is no cache directory."""
+    if not config["asset_store"] or not config["cache_dir"]:
+        return None
+    return assets.AssetStore(config["cache_dir"] / assets.STORE_DIR)
 
 
 def download_and_replace_paths(structured_notion: dict, config: dict):
+    # Start the downloads, each local file is downloaded once
+    downloads = {}
     for page_id, page in structured_notion["pages"].items():
-        for i_file, file_url in enumerate(page["files"]):
-            # Original file information
-            clean_url = urljoin(file_url, urlparse(file_url).path)
-            filename = unquote(urlparse(clean_url).path.replace("/", "_").strip("_"))
-            # Downloaded file information
-            parent = Path(page["url"]).parent
-            new_url = str(parent / filename)
-            local_file_location = config["output_dir"] / Path(page["url"].lstrip("/")).parent / filename
-
-            # Start the download
-            local_file_location.parent.mkdir(parents=True, exist_ok=True)
-            if local_file_location.exists():
-                logging.debug(f"🤖 {filename} already exists.")
-            else:
-                try:
-                    request.urlretrieve(file_url, local_file_location.resolve())
-                    logging.debug(f"🤖 Downloaded {filename}")
-                except HTTPError:
-                    logging.warning(f"🤖Cannot download {filename} from link {file_url}.")
-                except ValueError:
+        for file_url in page["files"]:
+            if urlparse(file_url).scheme:
+                _, local_file_location = asset_location(page, file_url, config)
+                downloads.setdefault(local_file_location, file_url)
+    store = asset_store(config)
+    partial_dir = config["cache_dir"] / assets.PARTIAL_DIR if config["cache_dir"] else None
+    with assets.AssetDownloader(
+        config["download_workers"],
+        config["download_timeout"],
+        store,
+        max_file_size(config),
+        partial_dir=partial_dir,
+    ) as downloader:
+        downloader.download_all(downloads)
+    downloader.report()
+
+    for page_id, page in structured_notion["pages"].items():
+        # Old -> new URL of every file of the page
+        new_urls = {}
+        skipped = []
+        for file_url in page["files"]:
+            # Links without a scheme cannot be downloaded and stay as they are
+            if not urlparse(file_url).scheme:
+                continue
+            new_url, local_file_location = asset_location(page, file_url, config)
+            if local_file_location in downloader.oversized:
+                if config["oversized_files"] == "link":
+                    # The page links the original file
                     continue
+                # The file is left out of the site
+                skipped.append(file_url)
+                continue
+            new_urls[file_url] = new_url
+        if new_urls or skipped:
+            replace_page_urls(page, new_urls, skipped)
 
-            # Replace url in structured_data
-            structured_notion["pages"][page_id]["files"][i_file] = new_url
 
-            # Replace url in markdown
-            md_content = structured_notion["pages"][page_id]["md_content"]
-            structured_notion["pages"][page_id]["md_content"] = md_content.replace(file_url, new_url)
+def page_content(page: dict) -> str:
+    """Returns the HTML of the page content if it was rendered from blocks, otherwise its markdown."""
+    if "html_content" in page:
+        return page["html_content"]
+    return page.get("md_content", "")
 
-            # Add short description for sites
-            clean_content = strip_html_tags(md_content)
-            structured_notion["pages"][page_id]["description"] = clean_content[:150]
 
-            # Replace url in header
-            for asset in ["icon", "cover"]:
-                if page[asset] == file_url:
-                    structured_notion["pages"][page_id][asset] = new_url
+def remove_file_markup(text: str, urls: list) -> str:
+    """Removes images, videos and embeds of the URLs from markdown or HTML, keeping the text of links to them."""
+    if not urls or not text:
+        return text
+    alternatives = "|".join(re.escape(url) for url in sorted(urls, key=len, reverse=True))
+    text = re.sub(rf'<(img|video|iframe)\b[^>]*\bsrc="(?:{alternatives})"[^>]*>(?:</\1>)?', "", text)
+    text = re.sub(rf'<a\b[^>]*\bhref="(?:{alternatives})"[^>]*>(.*?)</a>', r"\1", text, flags=re.DOTALL)
+    return re.sub(rf"!?\[([^\]]*)\]\((?:{alternatives})\)", r"\1", text)
 
-            # Replace url in files property:
-            if page["type"] == "db_entry":
-                for prop_name, prop_value in page["properties_md"].items():
-                    if file_url in prop_value:
-                        new_value = prop_value.replace(file_url, new_url)
-                        structured_notion["pages"][page_id]["properties_md"][prop_name] = new_value
+
+def replace_page_urls(page: dict, new_urls: dict, skipped: list | None = None):
+    """Replaces URLs of the page files in its markdown, HTML, header and properties in one pass each.
+
+    Files in 'skipped' are left out of the site: their images, videos and
+    embeds are removed and links to them become plain text, so no empty URL
+    makes the browser request the page itself.
+    """
+    skipped = skipped or []
+    rewriter = UrlRewriter(new_urls)
+    page["files"] = [new_urls.get(file_url, file_url) for file_url in page["files"] if file_url not in skipped]
+    if "md_content" in page:
+        page["md_content"] = remove_file_markup(rewriter.rewrite(page["md_content"]), skipped)
+    if "html_content" in page:
+        # URLs are escaped in HTML attributes
+        escaped = UrlRewriter({html.escape(file_url): html.escape(new_url) for file_url, new_url in new_urls.items()})
+        page["html_content"] = remove_file_markup(
+            escaped.rewrite(page["html_content"]), [html.escape(file_url) for file_url in skipped]
+        )
+
+    # Add short description for sites
+    page["description"] = strip_html_tags(page_content(page))[:150]
+
+    for asset in ["icon", "cover"]:
+        if page[asset] in new_urls:
+            page[asset] = new_urls[page[asset]]
+        elif page[asset] in skipped:
+            page[asset] = None
+
+    # Replace url in files property:
+    if page["type"] == "db_entry":
+        for prop_name, prop_value in page["properties_md"].items():
+            page["properties_md"][prop_name] = remove_file_markup(rewriter.rewrite(prop_value), skipped)
 
 
 def sorting_db_entries(structured_notion: dict):
@@ -510,8 +599,8 @@ def create_search_index(structured_notion: dict):
     search_index = []
 
     for page_id, page in structured_notion["pages"].items():
-        if "md_content" in page:
-            clean_content = strip_html_tags(page["md_content"])
+        if "md_content" in page or "html_content" in page:
+            clean_content = strip_html_tags(page_content(page))
             # Debug log to check content
             logging.debug(f"🤖 Indexing content for {page['title']}: {clean_content[:200]}...")
 
@@ -520,6 +609,125 @@ def create_search_index(structured_notion: dict):
     structured_notion["search_index"] = search_index
 
 
+def parses_markdown(config: dict) -> bool:
+    return config["renderer"] == "markdown" or config["export_markdown"]
+
+
+def block_cache(config: dict) -> markdown_parser.BlockCache | None:
+    if not config["cache_dir"]:
+        return None
+    return markdown_parser.BlockCache(config["cache_dir"] / "blocks.json")
+
+
+# Fields of pages shown by blocks linking them, the read-only lookup table of worker processes
+LOOKUP_FIELDS = ["type", "title", "url", "emoji", "icon"]
+
+# Lookup table, config, block cache and synced blocks of a worker process of parse_pages, set once by init_worker
+_worker_context: tuple = ()
+
+
+def init_worker(lookup: dict, config: dict):
+    global _worker_context
+    cache = block_cache(config) if parses_markdown(config) else None
+    _worker_context = (lookup, config, cache, {})
+
+
+def parse_pages_in_worker(pages: list) -> tuple:
+    """Parses a shard of (page ID, raw page) in a worker process with the lookup table it received once.
+
+    Returns:
+        results (list): (page ID, md_content, files of blocks, properties_md, files of properties) of every page.
+        used (dict): Entries of the block cache used by the shard or None.
+    """
+    lookup, config, cache, synced_cache = _worker_context
+    results = []
+    for page_id, raw_page in pages:
+        # Files found in the blocks are appended to the page in the lookup table
+        lookup["pages"][page_id]["files"] = []
+        md_content = None
+        if parses_markdown(config):
+            md_content = markdown_parser.convert_page(raw_page["blocks"], lookup, page_id, synced_cache, cache)
+        properties_md, property_files = None, []
+        if lookup["pages"][page_id]["type"] == "db_entry":
+            properties_md, property_files = db_entry_properties(raw_page["properties"])
+        results.append((page_id, md_content, lookup["pages"][page_id]["files"], properties_md, property_files))
+    return results, cache.export() if cache is not None else None
+
+
+def parse_pages(raw_notion: dict, structured_notion: dict, config: dict, jobs: int) -> dict:
+    """Parses markdown and properties of all pages in 'jobs' processes.
+
+    Every worker receives the lookup table of linked page fields once when it
+    starts and then parses shards of raw pages. Results are merged in the
+    order of pages, so files of the pages are listed as by the serial parsing.
+
+    Returns:
+        properties (dict): Page ID -> (properties_md, files of properties) of database entries.
+    """
+    lookup = {
+        "pages": {
+            page_id: {field: page.get(field) for field in LOOKUP_FIELDS}
+            for page_id, page in structured_notion["pages"].items()
+        }
+    }
+    cache = block_cache(config) if parses_markdown(config) else None
+    pages = list(raw_notion.items())
+    # A few shards per worker balance pages of different sizes
+    shard_size = max(1, len(pages) // (jobs * 4))
+    shards = [pages[i : i + shard_size] for i in range(0, len(pages), shard_size)]
+    properties = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(lookup, config)) as executor:
+        for results, used in executor.map(parse_pages_in_worker, shards):
+            for page_id, md_content, files, properties_md, property_files in results:
+                if md_content is not None:
+                    structured_notion["pages"][page_id]["md_content"] = md_content
+                    structured_notion["pages"][page_id]["files"].extend(files)
+                if properties_md is not None:
+                    properties[page_id] = (properties_md, property_files)
+            if cache is not None and used is not None:
+                cache.update(used)
+    if cache is not None:
+        cache.save()
+        logging.debug(f"🤖 Converted {cache.converted} blocks to markdown, {cache.cached} were cached.")
+    logging.debug(f"🤖 {jobs} processes parsed {len(pages)} pages.")
+    return properties
+
+
+def parse_content(raw_notion: dict, structured_notion: dict, config: dict):
+    """Parses markdown, HTML and properties of database entries of all pages.
+
+    With more than one of 'config["jobs"]', markdown and properties are
+    parsed by worker processes, see parse_pages().
+    """
+    jobs = workers.jobs_count(config)
+    properties = None
+    if jobs > 1 and len(raw_notion) > 1:
+        properties = parse_pages(raw_notion, structured_notion, config, jobs)
+    elif parses_markdown(config):
+        cache = block_cache(config)
+        markdown_parser.parse_markdown(raw_notion, structured_notion, cache)
+        if cache is not None:
+            cache.save()
+            logging.debug(f"🤖 Converted {cache.converted} blocks to markdown, {cache.cached} were cached.")
+    if parses_markdown(config):
+        logging.debug("🤖 Parsed markdown content")
+
+    if config["renderer"] == "html":
+        # Files of the blocks are already collected with the markdown
+        html_renderer.parse_html(raw_notion, structured_notion, collect_files=not config["export_markdown"])
+        logging.debug("🤖 Rendered HTML content")
+
+    if properties is None:
+        parse_db_entry_properties(raw_notion, structured_notion)
+    else:
+        for page_id, (properties_md, files) in properties.items():
+            page = structured_notion["pages"][page_id]
+            page["properties"] = raw_notion[page_id]["properties"]
+            page["properties_md"] = properties_md
+            page["files"].extend(files)
+    logging.debug("🤖 Parsed db_entries properties")
+
+
 def structurize_notion_content(raw_notion: dict, config: dict) -> dict:
     structured_notion = {}
     structured_notion["pages"] = {}
@@ -531,21 +739,23 @@ def structurize_notion_content(raw_notion: dict, config: dict) -> dict:
     find_lists_in_dbs(structured_notion)
     logging.debug("🤖 Structurized headers")
 
-    parse_family_lines(structured_notion)
+    graph = PageGraph(structured_notion["pages"])
+    parse_family_lines(structured_notion, graph)
     logging.debug("🤖 Structurized family lines")
 
-    generate_urls(structured_notion["root_page_id"], structured_notion, config)
-    logging.debug("🤖 Generated urls")
-
-    markdown_parser.parse_markdown(raw_notion, structured_notion)
-    logging.debug("🤖 Parsed markdown content")
+    generate_urls(structured_notion, graph)
+    logging.debug(
+        f"🤖 Generated urls of {graph.descendants(structured_notion['root_page_id']) + 1} of {len(graph)} pages"
+    )
 
-    parse_db_entry_properties(raw_notion, structured_notion)
-    logging.debug("🤖 Parsed db_entries properties")
+    parse_content(raw_notion, structured_notion, config)
 
     if config["download_files"]:
         download_and_replace_paths(structured_notion, config)
         logging.debug("🤖 Downloaded files and replaced paths")
+        if config["optimize_images"]:
+            images.optimize_images(structured_notion, config)
+            logging.debug("🤖 Generated responsive image variants")
 
     sorting_db_entries(structured_notion)
     sorting_page_by_year(structured_notion)
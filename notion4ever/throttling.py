@@ -0,0 +1,235 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime
+from datetime import timezone
+from notion_client import AsyncClient
+from notion_client import Client
+import asyncio
+import logging
+import random
+import threading
+import time
+import httpx
+
+# Statuses worth another attempt besides 429: transient server side failures.
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token bucket shared by every Notion API request of a run.
+
+    The bucket refills with 'rate' tokens per second up to 'capacity' tokens.
+    Each request reserves one token before it is sent; when the bucket is empty
+    the reservation goes negative and the caller waits until its token is
+    refilled, so concurrent workers are served at the average rate in the order
+    they asked. The bucket is thread-safe and can be shared between the
+    synchronous and the asynchronous clients.
+    """
+
+    def __init__(self, rate: float = 3.0, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError("Rate of the token bucket must be positive.")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns the number of seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return max(0.0, self._updated - now) + max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Stops refilling the bucket for 'seconds', e.g. after a Retry-After header."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now + seconds > self._updated:
+                self._tokens = min(self._tokens, 0.0)
+                self._updated = now + seconds
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    async def acquire_async(self):
+        await asyncio.sleep(self.reserve())
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parses Retry-After header given either in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, backoff: float, max_backoff: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_backoff, backoff * 2**attempt))
+
+
+class _RetryPolicy:
+    def __init__(self, bucket: TokenBucket, max_retries: int, backoff: float, max_backoff: float):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def response_delay(self, request: httpx.Request, response: httpx.Response, attempt: int) -> float | None:
+        """Returns delay before the next attempt or None if response is final.
+
+        A rate limited response pauses the shared bucket, so every worker slows
+        down, and returns zero: waiting for the next token is enough.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if response.status_code == 429:
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None:
+                delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+            logging.debug(f"🤖 Rate limited on {request.url.path}, retrying in {delay:.1f}s.")
+            self.bucket.pause(delay)
+            return 0.0
+        if response.status_code in RETRY_STATUSES:
+            delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+            logging.debug(f"🤖 {response.status_code} on {request.url.path}, retrying in {delay:.1f}s.")
+            return delay
+        return None
+
+    def timeout_delay(self, request: httpx.Request, attempt: int) -> float | None:
+        if attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(attempt, self.backoff, self.max_backoff)
+        logging.debug(f"🤖 Timeout on {request.url.path}, retrying in {delay:.1f}s.")
+        return delay
+
+
+class ThrottledTransport(httpx.BaseTransport):
+    """httpx transport which throttles and retries requests to Notion API.
+
+    Every request waits for a token of the shared bucket. Responses with 429
+    honor Retry-After, while 5xx responses and timeouts are retried with
+    jittered exponential backoff, up to 'max_retries' times.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        self.policy = _RetryPolicy(bucket, max_retries, backoff, max_backoff)
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.policy.bucket.acquire()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TimeoutException:
+                delay = self.policy.timeout_delay(request, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            delay = self.policy.response_delay(request, response, attempt)
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncThrottledTransport(httpx.AsyncBaseTransport):
+    """Asynchronous counterpart of ThrottledTransport."""
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.policy = _RetryPolicy(bucket, max_retries, backoff, max_backoff)
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            await self.policy.bucket.acquire_async()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TimeoutException:
+                delay = self.policy.timeout_delay(request, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            delay = self.policy.response_delay(request, response, attempt)
+            if delay is None:
+                return response
+            await response.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def throttled_client(
+    auth: str,
+    bucket: TokenBucket,
+    max_retries: int = 5,
+    base_url: str | None = None,
+    transport: httpx.BaseTransport | None = None,
+) -> Client:
+    """Creates a synchronous Notion client whose requests go through 'bucket'.
+
+    'base_url' points the client to another server, e.g. notion4ever.fake_notion,
+    and 'transport' replaces the network below the throttling, e.g. with
+    recording.ReplayTransport.
+    """
+    transport = ThrottledTransport(bucket, max_retries=max_retries, transport=transport)
+    options = {"auth": auth, "base_url": base_url} if base_url else {"auth": auth}
+    return Client(options, client=httpx.Client(transport=transport))
+
+
+def async_throttled_client(
+    auth: str,
+    bucket: TokenBucket,
+    max_retries: int = 5,
+    base_url: str | None = None,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> AsyncClient:
+    """Creates an asynchronous Notion client whose requests go through 'bucket'."""
+    transport = AsyncThrottledTransport(bucket, max_retries=max_retries, transport=transport)
+    options = {"auth": auth, "base_url": base_url} if base_url else {"auth": auth}
+    return AsyncClient(options, client=httpx.AsyncClient(transport=transport))
@@ -0,0 +1,9 @@
+import os
+
+
+def jobs_count(config: dict) -> int:
+    """Returns the number of worker processes, '--jobs 0' means one per CPU."""
+    jobs = config["jobs"]
+    if jobs == 0:
+        return os.cpu_count() or 1
+    return jobs
@@ -0,0 +1,96 @@
+from notion4ever import journal
+
+import json
+
+
+def page(page_id: str, object_type: str = "page") -> dict:
+    return {"object": object_type, "id": page_id}
+
+
+def child_page(page_id: str) -> dict:
+    return {"object": "block", "id": page_id, "type": "child_page", "has_children": False}
+
+
+def paragraph(block_id: str, text: str = "") -> dict:
+    return {"object": "block", "id": block_id, "type": "paragraph", "has_children": False, "paragraph": text}
+
+
+def write_crawl(filename: str) -> dict:
+    notion_json = {}
+    with journal.CrawlJournal(filename, notion_json) as crawl_journal:
+        notion_json["root"] = page("root")
+        crawl_journal.page(notion_json["root"])
+        notion_json["root"]["blocks"] = [paragraph("a"), child_page("missing")]
+        crawl_journal.blocks("root", notion_json["root"]["blocks"], "cursor")
+        notion_json["root"]["blocks"].append(child_page("sub"))
+        crawl_journal.blocks("root", [child_page("sub")], None)
+        crawl_journal.block("root", 0, paragraph("a", "parsed"))
+        notion_json["root"]["blocks"][0] = paragraph("a", "parsed")
+        notion_json["sub"] = page("sub")
+        crawl_journal.page(notion_json["sub"])
+        notion_json["outside"] = page("outside")
+        crawl_journal.page(notion_json["outside"])
+        crawl_journal.discard("outside")
+        crawl_journal.page_done("root", [1])
+        notion_json["root"]["blocks"].pop(1)
+    return notion_json
+
+
+def test_replay_restores_content_and_progress(tmp_path):
+    filename = str(tmp_path / "notion_content.jsonl")
+    written = write_crawl(filename)
+
+    notion_json = {}
+    with journal.CrawlJournal(filename, notion_json, resume=True) as resumed:
+        assert notion_json == written
+        assert resumed.is_listed("root")
+        assert not resumed.is_listed("sub")
+        assert resumed.is_parsed("root", 0)
+        assert not resumed.is_parsed("root", 1)
+        assert resumed.is_done("root")
+        assert not resumed.is_done("sub")
+        assert "outside" not in resumed.cursors
+
+
+def test_replay_continues_listing_from_the_cursor(tmp_path):
+    filename = str(tmp_path / "notion_content.jsonl")
+    notion_json = {}
+    with journal.CrawlJournal(filename, notion_json) as crawl_journal:
+        notion_json["root"] = page("root")
+        crawl_journal.page(notion_json["root"])
+        notion_json["root"]["blocks"] = [paragraph("a")]
+        crawl_journal.blocks("root", [paragraph("a")], "next page")
+
+    with journal.CrawlJournal(filename, {}, resume=True) as resumed:
+        assert not resumed.is_listed("root")
+        assert resumed.next_cursor("root") == "next page"
+
+
+def test_replay_skips_truncated_last_record(tmp_path):
+    filename = tmp_path / "notion_content.jsonl"
+    written = write_crawl(str(filename))
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "page", "page": page("late")})[:20])
+
+    notion_json = {}
+    journal.replay(str(filename), notion_json)
+    assert notion_json == written
+
+
+def test_compact_writes_pages_in_crawl_order(tmp_path):
+    filename = tmp_path / "notion_content.jsonl"
+    notion_json = {}
+    with journal.CrawlJournal(str(filename), notion_json) as crawl_journal:
+        # Pages fetched concurrently are journaled in the order they finish
+        for page_id in ["root", "second", "first"]:
+            notion_json[page_id] = page(page_id)
+            crawl_journal.page(notion_json[page_id])
+        notion_json["root"]["blocks"] = [child_page("first"), child_page("second")]
+        crawl_journal.blocks("root", notion_json["root"]["blocks"], None)
+
+    snapshot = tmp_path / "notion_content.json"
+    compacted = journal.compact(str(filename), str(snapshot))
+    assert list(compacted) == ["root", "first", "second"]
+    with open(snapshot, "r", encoding="utf-8") as f:
+        assert json.load(f) == compacted
+    assert not filename.exists()
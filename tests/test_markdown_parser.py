@@ -0,0 +1,132 @@
+from notion4ever import markdown_parser
+
+import copy
+
+import pytest
+
+
+def grouping(page_md: str) -> str:
+    """List grouping of the whole page as done before MarkdownWriter."""
+    page_md_fixed = []
+    prev_line_type = ""
+    for line in page_md.splitlines():
+        line_type = ""
+        norm_line = line.lstrip()
+        if norm_line.startswith(("- [ ]", "- [x]")):
+            line_type = "checkbox"
+        elif norm_line.startswith("* "):
+            line_type = "bullet"
+        elif norm_line.startswith("1. "):
+            line_type = "numbered"
+
+        if prev_line_type != "":
+            if line == "":
+                continue
+
+        if line_type != prev_line_type:
+            page_md_fixed.append("")
+
+        page_md_fixed.append(line)
+        prev_line_type = line_type
+    return "\n".join(page_md_fixed).replace("\n\n\n", "\n\n")
+
+
+PAGES = [
+    ["# Title\n\n", "text\n\n", "* a\n\n", "* b\n\n", "\t* nested\n\n", "after\n\n"],
+    ["1. one\n\n", "1. two\n\n", "- [ ] todo\n\n", "- [x] done\n\n", "* bullet\n\n", "text"],
+    ["text\n\n\n\n\n", "more\n\n\n", "end"],
+    ["* a\n\n\tparagraph in item\n\n", "* b\n\n", "```\ncode\n\n\n```\n\n"],
+    ["first line\r\nsecond\r", "\n* item\r\n", "\n\nlast"],
+    ["", "\n\n", "* only\n", ""],
+]
+
+
+@pytest.mark.parametrize("chunks", PAGES)
+def test_markdown_writer_groups_lists_as_the_whole_page(chunks):
+    writer = markdown_parser.MarkdownWriter()
+    for chunk in chunks:
+        writer.write(chunk)
+    assert writer.getvalue() == grouping("".join(chunks))
+
+
+@pytest.mark.parametrize("chunks", PAGES)
+def test_markdown_writer_does_not_depend_on_chunk_boundaries(chunks):
+    text = "".join(chunks)
+    writer = markdown_parser.MarkdownWriter()
+    for char in text:
+        writer.write(char)
+    assert writer.getvalue() == grouping(text)
+
+
+def block(block_id: str, text: str, children: list | None = None, **fields) -> dict:
+    return {
+        "object": "block",
+        "id": block_id,
+        "type": "paragraph",
+        "last_edited_time": "2025-01-01T00:00:00.000Z",
+        "has_children": bool(children),
+        "paragraph": {"rich_text": [{"plain_text": text}], "color": "default"},
+        **({"children": children} if children else {}),
+        **fields,
+    }
+
+
+STRUCTURED_NOTION = {
+    "pages": {
+        "child": {"title": "Child", "url": "/child/index.html", "emoji": None, "icon": None, "files": []},
+    }
+}
+
+
+def signature(*blocks: dict, structured_notion: dict = STRUCTURED_NOTION) -> list:
+    parts = []
+    for block in blocks:
+        markdown_parser.block_signature(block, structured_notion, parts)
+    return parts
+
+
+def test_block_signature_follows_the_payload():
+    original = block("a", "text")
+    assert signature(original) == signature(copy.deepcopy(original))
+    # Edits within the same minute keep last_edited_time
+    assert signature(original) != signature(block("a", "edited"))
+
+
+def test_block_signature_covers_children():
+    parent = block("a", "text", [block("b", "child")])
+    assert signature(parent) != signature(block("a", "text", [block("b", "edited child")]))
+    # A nested block differs from the same block following its parent
+    assert signature(parent) != signature(block("a", "text"), block("b", "child"))
+
+
+def test_block_signature_of_linked_pages_follows_the_page():
+    child_page = {"object": "block", "id": "child", "type": "child_page", "has_children": False, "child_page": {}}
+    renamed = copy.deepcopy(STRUCTURED_NOTION)
+    renamed["pages"]["child"]["title"] = "Renamed"
+    assert signature(child_page) != signature(child_page, structured_notion=renamed)
+
+
+def test_block_cache_reuses_entries_of_the_previous_run(tmp_path):
+    filename = tmp_path / "blocks.json"
+    cache = markdown_parser.BlockCache(filename)
+    key = cache.key(block("a", "text"), STRUCTURED_NOTION)
+    assert cache.get(key) is None
+    cache.put(key, "text\n\n", ["/a.png"])
+    unused = cache.key(block("b", "unused"), STRUCTURED_NOTION)
+    cache.save()
+
+    cache = markdown_parser.BlockCache(filename)
+    assert cache.get(key) == ["text\n\n", ["/a.png"]]
+    assert cache.get(unused) is None
+    assert cache.cached == 1
+
+
+def test_block_cache_drops_entries_of_another_version(tmp_path):
+    filename = tmp_path / "blocks.json"
+    cache = markdown_parser.BlockCache(filename)
+    key = cache.key(block("a", "text"), STRUCTURED_NOTION)
+    cache.put(key, "text\n\n", [])
+    cache.version = "previous version"
+    cache.save()
+
+    assert markdown_parser.BlockCache(filename).get(key) is None
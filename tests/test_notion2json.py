@@ -0,0 +1,51 @@
+from notion4ever import notion2json
+
+
+def entry(entry_id: str, title: str = "") -> dict:
+    return {"object": "page", "id": entry_id, "title": title}
+
+
+def test_merge_database_entries_keeps_the_current_order():
+    previous = [entry("a", "old a"), entry("b", "old b"), entry("deleted")]
+    changed = [entry("b", "new b")]
+    merged = notion2json.merge_database_entries(["b", "a", "new"], changed, previous)
+    assert merged == [entry("b", "new b"), entry("a", "old a"), None]
+
+
+def test_merge_database_entries_prefers_changed_entries():
+    merged = notion2json.merge_database_entries(["a"], [entry("a", "changed")], [entry("a", "previous")])
+    assert merged == [entry("a", "changed")]
+
+
+class Endpoint:
+    """Paginated list endpoint returning 'page_size' results per request."""
+
+    def __init__(self, results: list, page_size: int):
+        self.results = results
+        self.page_size = page_size
+        self.requests: list = []
+
+    def __call__(self, object_id: str, **kwargs) -> dict:
+        self.requests.append((object_id, kwargs))
+        start = int(kwargs.get("start_cursor") or 0)
+        end = start + self.page_size
+        return {"results": self.results[start:end], "next_cursor": str(end) if end < len(self.results) else None}
+
+
+def test_list_all_collects_every_page_of_results():
+    endpoint = Endpoint(list(range(7)), 3)
+    assert notion2json.list_all(endpoint, "database", filter_properties=["title"]) == list(range(7))
+    assert endpoint.requests == [
+        ("database", {"filter_properties": ["title"]}),
+        ("database", {"filter_properties": ["title"], "start_cursor": "3"}),
+        ("database", {"filter_properties": ["title"], "start_cursor": "6"}),
+    ]
+
+
+def test_pagination_continues_from_the_cursor():
+    endpoint = Endpoint(list(range(7)), 3)
+    pagination = notion2json.Pagination("3")
+    while not pagination.done:
+        pagination.add(endpoint("page", **pagination.request()))
+    assert pagination.results == [3, 4, 5, 6]
+    assert len(endpoint.requests) == 2
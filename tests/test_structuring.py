@@ -0,0 +1,22 @@
+from notion4ever.structuring import UrlRewriter
+
+
+def test_url_rewriter_replaces_every_url():
+    rewriter = UrlRewriter({"https://a/1.png": "/p/1.png", "https://a/2.png": "/p/2.png"})
+    text = "![](https://a/1.png) [file](https://a/2.png) ![](https://a/1.png)"
+    assert rewriter.rewrite(text) == "![](/p/1.png) [file](/p/2.png) ![](/p/1.png)"
+
+
+def test_url_rewriter_replaces_longest_url():
+    rewriter = UrlRewriter({"https://a/file": "/short", "https://a/file.png": "/long"})
+    assert rewriter.rewrite("https://a/file.png https://a/file") == "/long /short"
+
+
+def test_url_rewriter_does_not_rewrite_replacements():
+    rewriter = UrlRewriter({"https://a": "https://b", "https://b": "https://c"})
+    assert rewriter.rewrite("https://a https://b") == "https://b https://c"
+
+
+def test_url_rewriter_without_urls_keeps_text():
+    assert UrlRewriter({}).rewrite("https://a") == "https://a"
+    assert UrlRewriter({"https://a": "/a"}).rewrite("") == ""